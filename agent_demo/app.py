@@ -1,11 +1,11 @@
-from agent_demo.chunkbuddy_standalone_graph import build_app
+from agent_demo.chunkbuddy_standalone_graph import build_app, get_app  # noqa: F401
 
 # LangGraph Studio will call build_app() itself.
 # Do NOT call build_app() at import time.
 
-# Optional: expose a function for manual use
-def get_app():
-    return build_app()
+# Optional: get_app() for manual use. The compiled graph is built on the
+# first call and reused, so repeated calls share one graph and its LLM client.
+# Importing this module is cheap: LangGraph and the client load on first use.
 
 # Only run locally when executing `python app.py`
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+# batch_runner.py
+# ---------------------------------------------------------------------------
+# Stage-wise batch execution for large topic lists.
+# Instead of running every topic through the graph start-to-finish, this
+# runner executes ONE stage across the whole batch before moving on:
+#   all draft prompts → llm.batch → all chunk prompts → llm.batch → ...
+# Each stage has its own concurrency limit so it can be matched to the
+# provider's rate limits. Rows that fail are retried on their own; rows that
+# still fail are dropped from later stages without stalling the others.
+#
+# Usage:
+#   python batch_runner.py topics.txt --level beginner --out results.jsonl
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import time
+from typing import Dict, List, Optional, Union
+
+from langchain_core.messages import HumanMessage
+
+import chunkbuddy_graph
+from chunkbuddy_graph import STAGES, LearningState, response_cache_key
+from llm_cache import ResponseCache
+from node_output import response_format
+
+
+class StageFailure(RuntimeError):
+    """Raised (and returned in place of a result) when a row exhausts its retries."""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage} failed: {error!r}")
+        self.stage = stage
+        self.error = error
+
+
+# --- One stage across the batch ---------------------------------------------
+def _run_stage(
+    prompts: Dict[int, str],
+    max_concurrency: int,
+    max_retries: int,
+    retry_backoff: float,
+    cache: Optional[ResponseCache],
+    llm,
+    fmt: Optional[dict] = None,
+) -> Dict[int, Union[str, Exception]]:
+    """Send prompts (row index → prompt) through llm.batch; return row → text or error."""
+    results: Dict[int, Union[str, Exception]] = {}
+    # Same structured-output request (and so the same cache keys) as the graph node.
+    kwargs = {"response_format": fmt} if fmt else {}
+
+    pending = {}
+    for idx, prompt in prompts.items():
+        cached = cache.get(response_cache_key(prompt, llm, fmt)) if cache is not None else None
+        if cached is not None:
+            results[idx] = cached
+        else:
+            pending[idx] = prompt
+
+    attempt = 0
+    while pending:
+        indices = list(pending)
+        responses = llm.batch(
+            [[HumanMessage(content=pending[i])] for i in indices],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+            **kwargs,
+        )
+        failed = {}
+        for idx, response in zip(indices, responses):
+            if isinstance(response, Exception):
+                failed[idx] = pending[idx]
+                results[idx] = response
+                continue
+            results[idx] = response.content
+            if cache is not None:
+                cache.set(response_cache_key(pending[idx], llm, fmt), response.content)
+
+        attempt += 1
+        if not failed or attempt > max_retries:
+            break
+        # Only the failed rows go round again, after an exponential backoff.
+        time.sleep(retry_backoff * (2 ** (attempt - 1)))
+        pending = failed
+
+    return results
+
+
+# --- Whole pipeline, stage by stage -----------------------------------------
+def run_stagewise(
+    states: List[LearningState],
+    max_concurrency: int = 8,
+    stage_concurrency: Optional[Dict[str, int]] = None,
+    max_retries: int = 2,
+    retry_backoff: float = 1.0,
+    cache: Optional[ResponseCache] = None,
+    llm=None,
+) -> List[Union[LearningState, StageFailure]]:
+    """
+    Run every stage of the ChunkBuddy pipeline across `states`.
+
+    `stage_concurrency` overrides `max_concurrency` per node name, e.g.
+    {"draft_explanation": 4}. `llm` defaults to chunkbuddy_graph.llm.
+    The returned list is aligned with `states`; rows that failed hold a
+    StageFailure instead of a state.
+    """
+    stage_concurrency = stage_concurrency or {}
+    llm = llm if llm is not None else chunkbuddy_graph.llm
+    rows: List[Union[LearningState, StageFailure]] = [dict(s) for s in states]
+
+    for name, build_prompt, parse in STAGES:
+        prompts: Dict[int, str] = {}
+        for idx, state in enumerate(rows):
+            if isinstance(state, StageFailure):
+                continue
+            prompt = build_prompt(state)
+            if prompt:
+                prompts[idx] = prompt
+            else:
+                # Nothing to send (e.g. empty explanation): parse the empty
+                # response just like the graph node would.
+                state.update(parse("", state))
+
+        texts = _run_stage(
+            prompts,
+            max_concurrency=stage_concurrency.get(name, max_concurrency),
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            cache=cache,
+            llm=llm,
+            fmt=response_format(name, llm),
+        )
+        for idx, text in texts.items():
+            if isinstance(text, Exception):
+                rows[idx] = StageFailure(name, text)
+            else:
+                rows[idx].update(parse(text, rows[idx]))
+
+    return rows
+
+
+# --- CLI --------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run ChunkBuddy stage-wise over a topic list.")
+    parser.add_argument("topics_file", help="Text file with one topic per line.")
+    parser.add_argument("--level", default="beginner")
+    parser.add_argument("--out", default="batch_results.jsonl")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--max-retries", type=int, default=2)
+    args = parser.parse_args()
+
+    with open(args.topics_file, encoding="utf-8") as f:
+        topics = [line.strip() for line in f if line.strip()]
+
+    cache = ResponseCache()
+    results = run_stagewise(
+        [{"topic": t, "level": args.level} for t in topics],
+        max_concurrency=args.max_concurrency,
+        max_retries=args.max_retries,
+        cache=cache,
+    )
+
+    failures = 0
+    with open(args.out, "w", encoding="utf-8") as f:
+        for topic, result in zip(topics, results):
+            if isinstance(result, StageFailure):
+                failures += 1
+                row = {"topic": topic, "level": args.level, "error": str(result)}
+            else:
+                row = result
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    print(f"✅ {len(topics) - failures}/{len(topics)} topics written to {args.out}")
+    if failures:
+        print(f"⚠️  {failures} topics failed; see the 'error' field in the output.")
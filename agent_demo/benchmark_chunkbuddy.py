@@ -0,0 +1,220 @@
+# benchmark_chunkbuddy.py
+# ---------------------------------------------------------------------------
+# Offline benchmark suite for the ChunkBuddy graph.
+# Runs entirely against fake_llm.FakeChatModel, so it needs no API key and
+# no network. Reports:
+#   1. per-node and end-to-end latency (p50 / p95 / p99)
+#   2. graph overhead with a zero-latency model
+#   3. runs/sec of the async graph at several concurrency levels
+#   4. parser cost per response for each node, for plain-text replies and
+#      structured (JSON) replies
+#   5. end-to-end latency per graph topology, with a fake LLM whose replies
+#      stream word by word (so the pipelined topology can overlap calls)
+# Import / cold-start times are covered by benchmark_imports.py.
+#
+# Usage:
+#   python benchmark_chunkbuddy.py
+#   python benchmark_chunkbuddy.py --runs 200 --latency 0.2 --json bench.json
+# ---------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import chunkbuddy_graph
+from chunkbuddy_graph import (
+    TOPOLOGIES,
+    build_app,
+    build_async_app,
+    parse_chunks,
+    parse_fused,
+    parse_questions,
+    parse_summary,
+)
+from fake_llm import FakeChatModel, canned_response
+from metrics import get_verbosity, set_verbosity
+
+TOPICS = [
+    "Kafka partitions", "TLS Handshake", "Consistent hashing", "B-trees",
+    "Raft consensus", "OAuth 2.0", "Bloom filters", "Garbage collection",
+]
+
+
+# --- Stats helpers ----------------------------------------------------------
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; `pct` is 0–100."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    # Keep per-node timing lines out of the report, whatever the env says.
+    previous = get_verbosity()
+    set_verbosity(0)
+    try:
+        yield
+    finally:
+        set_verbosity(previous)
+
+
+# --- 1 & 2. Per-node and end-to-end latency ---------------------------------
+def bench_latency(runs: int, llm: FakeChatModel, topology: str = "sequential") -> Dict[str, Dict[str, float]]:
+    app = build_app(llm=llm, topology=topology)
+    per_node: Dict[str, List[float]] = defaultdict(list)
+    end_to_end: List[float] = []
+
+    with quiet():
+        for i in range(runs):
+            state = {"topic": TOPICS[i % len(TOPICS)], "level": "beginner"}
+            start = last = time.perf_counter()
+            # In the sequential topology, the gap between consecutive
+            # "updates" events is the duration of the node that just finished.
+            for update in app.stream(state, stream_mode="updates"):
+                now = time.perf_counter()
+                for node in update:
+                    per_node[node].append(now - last)
+                last = now
+            end_to_end.append(time.perf_counter() - start)
+
+    report = {node: summarize(values) for node, values in per_node.items()}
+    report["end_to_end"] = summarize(end_to_end)
+    return report
+
+
+# --- 3. Concurrency scaling -------------------------------------------------
+def bench_concurrency(runs: int, levels: List[int], llm: FakeChatModel) -> Dict[int, float]:
+    results = {}
+    topics = [TOPICS[i % len(TOPICS)] for i in range(runs)]
+    app = build_async_app(llm=llm)
+    for concurrency in levels:
+        with quiet():
+            start = time.perf_counter()
+            asyncio.run(chunkbuddy_graph.run_many(topics, "beginner", max_concurrency=concurrency, app=app))
+            elapsed = time.perf_counter() - start
+        results[concurrency] = runs / elapsed
+    return results
+
+
+# --- 4. Parser cost ----------------------------------------------------------
+# Every node reply goes through node_output.py: JSON replies (structured
+# output) are read by key, text replies through the single-pass line scanner.
+def _as_json(node: str, text: str) -> str:
+    """The structured-output reply equivalent to a canned text reply."""
+    if node == "chunks":
+        return json.dumps({"chunks": text.split("\n\n")})
+    if node == "questions":
+        return json.dumps({"check_questions": parse_questions(text, {})["check_questions"]})
+    parsed = parse_summary(text, {})
+    return json.dumps({"summary": parsed["summary"], "learning_design_notes": parsed["meta"]["learning_design_notes"]})
+
+
+def bench_parsers(iterations: int) -> Dict[str, Dict[str, float]]:
+    """Parses/sec and µs per response, per node and reply format."""
+    chunks = [f"Chunk {i}: Idea {i}\nBody." for i in range(1, 5)]
+    state = {"topic": "Kafka partitions", "chunks": chunks, "check_questions": ["q"] * 5}
+    texts = {
+        "chunks": canned_response("break it into"),
+        "questions": canned_response("create 5 SHORT questions"),
+        "summary": canned_response("Topic: Kafka partitions\nTL;DR"),
+    }
+    cases = []
+    for node, parse in (("chunks", parse_chunks), ("questions", parse_questions), ("summary", parse_summary)):
+        cases.append((f"{node} (text)", parse, texts[node]))
+        cases.append((f"{node} (json)", parse, _as_json(node, texts[node])))
+    cases.append(("fused (json)", parse_fused, canned_response("Topic: Kafka partitions\nONE JSON object")))
+
+    results = {}
+    for name, parse, text in cases:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse(text, state)
+        elapsed = time.perf_counter() - start
+        results[name] = {"per_sec": iterations / elapsed, "us_per_response": elapsed / iterations * 1e6}
+    return results
+
+
+# --- 5. Topologies -----------------------------------------------------------
+def bench_topologies(runs: int, llm: FakeChatModel) -> Dict[str, Dict[str, float]]:
+    """End-to-end latency of each topology against the same model."""
+    return {topology: bench_latency(runs, llm, topology)["end_to_end"] for topology in TOPOLOGIES}
+
+
+# --- Report -----------------------------------------------------------------
+def print_latency_table(title: str, report: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{title}")
+    print(f"  {'stage':<28}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, s in report.items():
+        print(f"  {stage:<28}{s['n']:>6}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ChunkBuddy benchmarks.")
+    parser.add_argument("--runs", type=int, default=50, help="Graph runs per measurement.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean fake LLM latency (s).")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Fake LLM latency std-dev (s).")
+    parser.add_argument("--distribution", default="lognormal")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated levels.")
+    parser.add_argument("--parser-iterations", type=int, default=20_000)
+    parser.add_argument("--token-latency", type=float, default=0.002,
+                        help="Fake LLM seconds per streamed word, for the topology comparison.")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file.")
+    args = parser.parse_args()
+
+    def fake(latency: float, token_latency: float = 0.0) -> FakeChatModel:
+        return FakeChatModel(latency_mean=latency, latency_jitter=args.jitter if latency else 0.0,
+                             distribution=args.distribution, seed=0, token_latency=token_latency)
+
+    latency = bench_latency(args.runs, fake(args.latency))
+    overhead = bench_latency(args.runs, fake(0.0))
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    throughput = bench_concurrency(args.runs, levels, fake(args.latency))
+    parsers = bench_parsers(args.parser_iterations)
+    topologies = bench_topologies(args.runs, fake(args.latency, args.token_latency))
+
+    print(f"ChunkBuddy offline benchmark — fake LLM {args.distribution} "
+          f"mean={args.latency * 1000:.0f} ms, jitter={args.jitter * 1000:.0f} ms")
+    print_latency_table("Latency per node / end-to-end", latency)
+    print_latency_table("Graph overhead (zero-latency LLM)", overhead)
+
+    print("\nThroughput (async graph)")
+    for concurrency, rps in throughput.items():
+        print(f"  max_concurrency={concurrency:<6}{rps:>10.1f} runs/sec")
+
+    print("\nParser cost per response")
+    for name, p in parsers.items():
+        print(f"  {name:<28}{p['us_per_response']:>10.1f} µs{p['per_sec']:>14,.0f} parses/sec")
+
+    print_latency_table(f"End-to-end by topology ({args.token_latency * 1000:.1f} ms per streamed word)",
+                        topologies)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "latency": latency,
+                    "overhead": overhead,
+                    "throughput_runs_per_sec": throughput,
+                    "parsers": parsers,
+                    "topologies": topologies,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nWrote {args.json_path}")
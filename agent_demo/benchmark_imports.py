@@ -0,0 +1,146 @@
+# benchmark_imports.py
+# ---------------------------------------------------------------------------
+# Import-time (cold start) benchmark for the ChunkBuddy entry points.
+# Each target is imported in a fresh interpreter under `python -X importtime`;
+# the report shows the import time (interpreter startup excluded) and the
+# packages that cost the most. It also guards cold start: the run fails
+# (exit code 1) when a target is over its time budget or imports one of the
+# heavy packages it must only load on first use (LangGraph, LangChain,
+# OpenAI, LangSmith). The package check does not depend on machine speed,
+# so it is the one to rely on in CI; budgets can be tuned with --budget.
+#
+# Usage:
+#   python benchmark_imports.py
+#   python benchmark_imports.py --repeat 5 --budget ui=1500 --json imports.json
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+HERE = Path(__file__).resolve().parent
+
+# Packages that must not be loaded just by importing an entry point.
+HEAVY = ("langgraph", "langchain_core", "langchain_openai", "openai", "langsmith")
+
+# name -> (import statement, budget in ms, packages that must stay unloaded)
+TARGETS: Dict[str, Tuple[str, float, Tuple[str, ...]]] = {
+    "chunkbuddy_graph": ("import chunkbuddy_graph", 250, HEAVY),
+    "app.py": ("import agent_demo.app", 250, HEAVY),
+    "evaluator": ("import evaluate_chunkbuddy", 400, HEAVY),
+    # Importing the UI runs the Streamlit script once (in "bare mode");
+    # Streamlit, numpy and faiss are needed to draw the page, the graph is not.
+    "ui": ("import chunkbuddy_ui", 1500, HEAVY),
+}
+
+
+# --- Measuring --------------------------------------------------------------
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, depth, self µs, cumulative µs) for each `-X importtime` line."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, self_us, cumulative_us))
+    return rows
+
+
+def run_importtime(statement: str) -> List[Tuple[str, int, int, int]]:
+    env = dict(os.environ)
+    # `agent_demo.app` needs the repo root; everything else imports flat.
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(HERE.parent), str(HERE), env.get("PYTHONPATH")]))
+    env["CHUNKBUDDY_PREWARM"] = "0"  # no network from the UI
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=HERE, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def measure(statement: str, repeat: int, startup: set) -> dict:
+    """Median import time over `repeat` fresh interpreters, plus a breakdown."""
+    totals, by_package = [], defaultdict(list)
+    for _ in range(repeat):
+        rows = [r for r in run_importtime(statement) if r[0] not in startup]
+        totals.append(sum(cumulative for _, depth, _, cumulative in rows if depth == 0) / 1000)
+        per_run = defaultdict(int)
+        for name, _, self_us, _ in rows:
+            per_run[name.split(".")[0]] += self_us
+        for package, self_us in per_run.items():
+            by_package[package].append(self_us / 1000)
+    return {
+        "import_ms": statistics.median(totals),
+        "packages_ms": {p: statistics.median(v) for p, v in by_package.items()},
+        "modules": sorted({name.split(".")[0] for name, *_ in rows}),
+    }
+
+
+def bench_imports(targets: Dict[str, Tuple[str, float, Tuple[str, ...]]], repeat: int) -> Dict[str, dict]:
+    # Modules the bare interpreter already imports are not the target's cost.
+    startup = {name for name, *_ in run_importtime("pass")}
+    results = {}
+    for name, (statement, budget_ms, forbidden) in targets.items():
+        result = measure(statement, repeat, startup)
+        result["budget_ms"] = budget_ms
+        result["heavy_loaded"] = [p for p in forbidden if p in result["modules"]]
+        result["ok"] = result["import_ms"] <= budget_ms and not result["heavy_loaded"]
+        results[name] = result
+    return results
+
+
+# --- Report -----------------------------------------------------------------
+def print_report(results: Dict[str, dict], repeat: int, top: int) -> None:
+    print(f"ChunkBuddy import-time benchmark — median of {repeat}, interpreter startup excluded")
+    print(f"\n  {'target':<20}{'import ms':>12}{'budget ms':>12}  status")
+    for name, r in results.items():
+        status = "ok" if r["ok"] else "FAIL"
+        print(f"  {name:<20}{r['import_ms']:>12.1f}{r['budget_ms']:>12.0f}  {status}")
+    for name, r in results.items():
+        heaviest = sorted(r["packages_ms"].items(), key=lambda kv: kv[1], reverse=True)[:top]
+        print(f"\n{name}: heaviest packages (self time)")
+        for package, ms in heaviest:
+            print(f"  {package:<28}{ms:>10.1f} ms")
+        if r["heavy_loaded"]:
+            print(f"  ❌ loaded at import time: {', '.join(r['heavy_loaded'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChunkBuddy import-time / cold-start benchmark.")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per target.")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest packages to list per target.")
+    parser.add_argument("--only", help="Comma-separated targets (default: all).")
+    parser.add_argument("--budget", action="append", default=[], metavar="TARGET=MS",
+                        help="Override a target's budget; may be repeated.")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file.")
+    args = parser.parse_args()
+
+    targets = dict(TARGETS)
+    if args.only:
+        targets = {name: targets[name] for name in args.only.split(",")}
+    for override in args.budget:
+        name, _, ms = override.partition("=")
+        statement, _, forbidden = targets[name]
+        targets[name] = (statement, float(ms), forbidden)
+
+    results = bench_imports(targets, args.repeat)
+    print_report(results, args.repeat, args.top)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.json_path}")
+    raise SystemExit(0 if all(r["ok"] for r in results.values()) else 1)
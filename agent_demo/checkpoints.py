@@ -0,0 +1,170 @@
+# checkpoints.py
+# ---------------------------------------------------------------------------
+# Durable, resumable ChunkBuddy runs.
+# With a checkpointer compiled in, LangGraph saves the state after every
+# node. If a later node fails (after its retry policy is exhausted), the
+# completed, paid-for LLM calls are not lost: resume(run_id) continues from
+# the failed node.
+#
+# Usage:
+#   python checkpoints.py run "Kafka partitions" --level beginner
+#   python checkpoints.py status <run_id>
+#   python checkpoints.py resume <run_id>
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from chunkbuddy_graph import LearningState, build_app
+from llm_cache import ResponseCache
+
+if TYPE_CHECKING:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+DEFAULT_CHECKPOINT_PATH = Path(__file__).parent / ".cache" / "checkpoints.sqlite"
+
+
+class RunFailed(RuntimeError):
+    """A checkpointed run raised; `run_id` can be passed to resume()."""
+
+    def __init__(self, run_id: str, cause: Exception):
+        super().__init__(f"Run {run_id} failed: {cause!r} (resume with resume({run_id!r}))")
+        self.run_id = run_id
+
+
+def sqlite_checkpointer(path: Path = DEFAULT_CHECKPOINT_PATH) -> "SqliteSaver":
+    """A SqliteSaver on `path`, shareable across threads."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # SqliteSaver serialises access with its own lock.
+    return SqliteSaver(sqlite3.connect(str(path), check_same_thread=False))
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+def run_config(run_id: str) -> dict:
+    return {"configurable": {"thread_id": run_id}}
+
+
+def run_status(app, run_id: str) -> Optional[dict]:
+    """None for an unknown run, else {"done": bool, "next": [...], "values": {...}}."""
+    snapshot = app.get_state(run_config(run_id))
+    if snapshot.created_at is None:
+        return None
+    return {"done": not snapshot.next, "next": list(snapshot.next), "values": snapshot.values}
+
+
+# One lock per run id in use, so two callers with the same stable id (e.g.
+# identical dataset rows) never drive one thread at the same time; the
+# second one finds the run finished and gets its final state.
+_run_locks: Dict[str, List] = {}  # run_id → [lock, users]
+_run_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _run_lock(run_id: str) -> Iterator[None]:
+    with _run_locks_guard:
+        entry = _run_locks.setdefault(run_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _run_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _run_locks[run_id]
+
+
+def run_checkpointed(app, state: LearningState, run_id: Optional[str] = None) -> Tuple[str, LearningState]:
+    """
+    Run `app` (built with a checkpointer) under `run_id`.
+
+    If `run_id` names an earlier run, it is never started again: one that
+    stopped part-way is resumed, and one that finished returns its final
+    state without LLM calls. Callers can therefore derive stable ids (e.g.
+    from the input) and simply call this again after a failure; pass no
+    `run_id` when a new run is wanted.
+    Raises RunFailed carrying the run id.
+    """
+    run_id = run_id or new_run_id()
+    config = run_config(run_id)
+    with _run_lock(run_id):
+        try:
+            status = run_status(app, run_id)
+            if status is not None and status["done"]:
+                return run_id, status["values"]
+            if status is not None:
+                return run_id, app.invoke(None, config)
+            return run_id, app.invoke(state, config)
+        except Exception as exc:
+            raise RunFailed(run_id, exc) from exc
+
+
+def resume(run_id: str, app=None) -> LearningState:
+    """
+    Continue run `run_id` from the node after its last successful one.
+    `app` must be built like the original run (same topology / builder);
+    by default it is the sequential graph on the default checkpoint file.
+    A run that already finished returns its final state without LLM calls.
+    """
+    app = app or build_app(cache=ResponseCache(), checkpointer=sqlite_checkpointer())
+    status = run_status(app, run_id)
+    if status is None:
+        raise KeyError(f"No checkpointed run {run_id!r}")
+    if status["done"]:
+        return status["values"]
+    try:
+        return app.invoke(None, run_config(run_id))
+    except Exception as exc:
+        raise RunFailed(run_id, exc) from exc
+
+
+# --- CLI --------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkpointed ChunkBuddy runs.")
+    parser.add_argument("--db", default=str(DEFAULT_CHECKPOINT_PATH), help="Checkpoint SQLite file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Start a new checkpointed run.")
+    p_run.add_argument("topic")
+    p_run.add_argument("--level", default="beginner")
+
+    p_status = sub.add_parser("status", help="Show where a run stopped.")
+    p_status.add_argument("run_id")
+
+    p_resume = sub.add_parser("resume", help="Resume a failed run.")
+    p_resume.add_argument("run_id")
+    args = parser.parse_args()
+
+    app = build_app(cache=ResponseCache(), checkpointer=sqlite_checkpointer(Path(args.db)))
+
+    if args.command == "status":
+        status = run_status(app, args.run_id)
+        if status is None:
+            print(f"Unknown run: {args.run_id}")
+        else:
+            print("done" if status["done"] else f"stopped before: {', '.join(status['next'])}")
+            print(f"completed fields: {', '.join(status['values'])}")
+        raise SystemExit(0)
+
+    try:
+        if args.command == "run":
+            run_id, final_state = run_checkpointed(app, {"topic": args.topic, "level": args.level})
+            print(f"run id: {run_id}")
+        else:
+            final_state = resume(args.run_id, app)
+    except RunFailed as exc:
+        print(f"❌ {exc}")
+        raise SystemExit(1)
+    print(json.dumps(final_state, indent=2, ensure_ascii=False))
@@ -9,18 +9,47 @@
 # --- Imports & environment bootstrap ---------------------------------------
 # Environment loading is kept in a helper (load_env.py) so all scripts
 # share the same configuration (API keys, tracing, project name).
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
-from typing import TypedDict, List
-from langgraph.graph import StateGraph, START, END
+# LangGraph, LangChain and the OpenAI client take most of a second to import,
+# so they are imported where they are first used (the graph builders, the LLM
+# helpers) rather than here: importing this module stays cheap for the UI,
+# app.py and the evaluator. See benchmark_imports.py.
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, TypedDict, List, Optional, Union, get_type_hints
 # import logging
-import re
+import asyncio
+import contextvars
+import hashlib
+import itertools
+import json
+import os
+import time
 from load_env import load_env
+from llm_cache import ResponseCache
+from metrics import current_span, node_span, set_verbosity
+from model_routing import node_llms
+from node_output import (
+    NODE_SCHEMAS,
+    ChunkSplitter,
+    count_fused,
+    load_json_object,
+    read_chunks,
+    read_questions,
+    read_summary,
+    response_format,
+)
+from prompt_budget import NODE_BUDGETS, render_prompt
+
+if TYPE_CHECKING:
+    from langgraph.graph import StateGraph
 
 # Load API keys and other config from .env into process environment.
-# This happens once, at import time, so everything below can assume
-# OPENAI_API_KEY / LANGCHAIN_API_KEY are available.
-load_env()
+# This happens once, before the first client or graph is built, so
+# everything after that can assume OPENAI_API_KEY / LANGCHAIN_API_KEY
+# are available.
+@lru_cache(maxsize=None)
+def _ensure_env() -> None:
+    load_env()
 
 # logging.basicConfig(level=logging.DEBUG)
 # logger = logging.getLogger(__name__)
@@ -29,14 +58,24 @@ load_env()
 # Single shared LLM instance used by all graph nodes.
 # Using gpt-4o-mini keeps the demo fast and inexpensive while still
 # being strong enough for explanation, chunking, and question generation.
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
+# The client comes from the shared registry (llm_clients.py): pooled HTTP
+# connections, and calls go through the process-wide rate limiter shared
+# with the studio graph and the evaluation judge.
+# It is built on first use; `chunkbuddy_graph.llm` still works and calls
+# get_llm().
+DEFAULT_MODEL_SETTINGS = {
+    "model": "gpt-4o-mini",
     # temperature controls creativity vs determinism:
     # 0.0 = very predictable, 1.0 = very creative.
     # 0.5 is a balanced setting: clear, consistent explanations
     # with a bit of variation so it doesn't feel robotic.
-    temperature=0.5,
-)
+    "temperature": 0.5,
+}
+
+def get_llm():
+    _ensure_env()
+    from llm_clients import get_chat_model
+    return get_chat_model(**DEFAULT_MODEL_SETTINGS)
 
 # --- Shared State Definition ------------------------------------------------
 # This TypedDict defines the fields that flow through the graph.
@@ -50,16 +89,149 @@ class LearningState(TypedDict, total=False):
     summary: str                 # one-sentence TL;DR
     meta: dict                   # optional metadata (learning design notes, counts)
 
-# --- Node 1: draft_explanation ----------------------------------------------
-# Generates a level-appropriate explanation of the topic.
-# Input: topic, level
-# Output: raw_explanation
-def draft_explanation(state: LearningState) -> dict:
-    print("\n>>> draft_explanation received state:", state)
-    topic = state.get("topic", "a technical topic")
-    level = state.get("level", "beginner")
-
-    prompt = f"""
+# --- LLM call helpers -------------------------------------------------------
+# Every node goes through these helpers so that an optional ResponseCache can
+# short-circuit repeated prompts. The cache key covers model, temperature and
+# the exact prompt text, so any prompt or setting change is a cache miss.
+# `llm` lets callers inject a different LLM (e.g. the offline fake in
+# fake_llm.py); when omitted, the shared default from get_llm() is used.
+def _resolve_llm(override=None):
+    return override if override is not None else get_llm()
+
+def model_settings(llm=None) -> dict:
+    """The model settings that change what an LLM returns for a given prompt."""
+    if llm is None:
+        # Known without building the client, so cache lookups stay cheap.
+        return dict(DEFAULT_MODEL_SETTINGS)
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", type(llm).__name__)
+    return {"model": model, "temperature": getattr(llm, "temperature", None)}
+
+def response_cache_key(prompt: str, llm=None, response_format: Optional[dict] = None) -> str:
+    settings = model_settings(llm)
+    # A structured-output reply differs from the plain-text one for the same
+    # prompt, and an output cap can cut a reply short, so both are part of
+    # the key when set.
+    options = {"response_format": response_format,
+               "max_tokens": getattr(llm, "max_tokens", None) if llm is not None else None}
+    options = {k: v for k, v in options.items() if v is not None}
+    if options:
+        prompt = prompt + "\n\n" + json.dumps(options, sort_keys=True)
+    return ResponseCache.make_key(settings["model"], settings["temperature"], prompt)
+
+def _record(prompt: str, text: str, seconds: float, cache_status: str, usage=None) -> None:
+    # Attach the call to the node span it runs in (if any) for metrics.
+    span = current_span()
+    if span is not None:
+        span.record_llm_call(prompt, text, seconds, cache_status, usage)
+
+# `node` names the calling node: for models that support it, the reply is
+# then constrained to that node's JSON schema (see node_output.py).
+def invoke_llm(prompt: str, cache: Optional[ResponseCache] = None, llm=None, node: Optional[str] = None) -> str:
+    llm = _resolve_llm(llm)
+    start = time.perf_counter()
+    fmt = response_format(node, llm) if node else None
+    key = response_cache_key(prompt, llm, fmt) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _record(prompt, cached, time.perf_counter() - start, "hit")
+            return cached
+
+    from langchain_core.messages import HumanMessage
+    kwargs = {"response_format": fmt} if fmt else {}
+    response = llm.invoke([HumanMessage(content=prompt)], **kwargs)
+    text = response.content
+    if key is not None:
+        cache.set(key, text)
+    _record(prompt, text, time.perf_counter() - start, "miss" if key else "disabled",
+            getattr(response, "usage_metadata", None))
+    return text
+
+# Async twin of invoke_llm: same cache, but awaits ainvoke so many runs
+# can share one event loop while they wait on the network.
+async def ainvoke_llm(prompt: str, cache: Optional[ResponseCache] = None, llm=None,
+                      node: Optional[str] = None) -> str:
+    llm = _resolve_llm(llm)
+    start = time.perf_counter()
+    fmt = response_format(node, llm) if node else None
+    key = response_cache_key(prompt, llm, fmt) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _record(prompt, cached, time.perf_counter() - start, "hit")
+            return cached
+
+    from langchain_core.messages import HumanMessage
+    kwargs = {"response_format": fmt} if fmt else {}
+    response = await llm.ainvoke([HumanMessage(content=prompt)], **kwargs)
+    text = response.content
+    if key is not None:
+        cache.set(key, text)
+    _record(prompt, text, time.perf_counter() - start, "miss" if key else "disabled",
+            getattr(response, "usage_metadata", None))
+    return text
+
+# Streaming twins: yield the reply piece by piece as it arrives (all at once
+# on a cache hit) and cache the full text at the end. Always plain text, so
+# callers can split the reply while it streams.
+def stream_llm(prompt: str, cache: Optional[ResponseCache] = None, llm=None) -> Iterator[str]:
+    llm = _resolve_llm(llm)
+    start = time.perf_counter()
+    key = response_cache_key(prompt, llm) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _record(prompt, cached, time.perf_counter() - start, "hit")
+            yield cached
+            return
+
+    from langchain_core.messages import HumanMessage
+    parts: List[str] = []
+    usage = None
+    for message in llm.stream([HumanMessage(content=prompt)]):
+        usage = getattr(message, "usage_metadata", None) or usage
+        if message.content:
+            parts.append(message.content)
+            yield message.content
+    text = "".join(parts)
+    if key is not None:
+        cache.set(key, text)
+    _record(prompt, text, time.perf_counter() - start, "miss" if key else "disabled", usage)
+
+async def astream_llm(prompt: str, cache: Optional[ResponseCache] = None, llm=None) -> AsyncIterator[str]:
+    llm = _resolve_llm(llm)
+    start = time.perf_counter()
+    key = response_cache_key(prompt, llm) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            _record(prompt, cached, time.perf_counter() - start, "hit")
+            yield cached
+            return
+
+    from langchain_core.messages import HumanMessage
+    parts: List[str] = []
+    usage = None
+    async for message in llm.astream([HumanMessage(content=prompt)]):
+        usage = getattr(message, "usage_metadata", None) or usage
+        if message.content:
+            parts.append(message.content)
+            yield message.content
+    text = "".join(parts)
+    if key is not None:
+        cache.set(key, text)
+    _record(prompt, text, time.perf_counter() - start, "miss" if key else "disabled", usage)
+
+# --- Prompt templates -------------------------------------------------------
+# Each node is split into: build prompt → call LLM → parse response.
+# The prompt builders and parsers below are shared by the sync nodes, the
+# async nodes and any other runner that drives the stages itself.
+# A builder returns None when there is nothing to send (e.g. no chunks yet);
+# the node then parses an empty response, which yields the empty result.
+# Builders render through prompt_budget.render_prompt, which keeps each
+# node's prompt within its input-token budget (see NODE_BUDGETS).
+
+DRAFT_PROMPT = """
 You are a friendly technical learning assistant.
 
 Explain the topic below to a {level} learner.
@@ -74,24 +246,12 @@ Requirements:
 - Use a real-world metaphor (e.g., restaurant menu, delivery service) to explain the difference.
 - Aim to reduce cognitive load: focus on the core ideas first, details later.
 """
-    response = llm.invoke([HumanMessage(content=prompt)])
-    return {"raw_explanation": response.content}
 
 #- Include at least one analogy or metaphor that makes the concept relatable.
 #- You must include one analogy or metaphor that makes the concept relatable to a beginner.
 # - Keep it to one coherent explanation (around 2–4 short paragraphs).
 
-# --- Node 2: chunk_explanation ----------------------------------------------
-# Splits the explanation into 3–6 digestible chunks.
-# Input: raw_explanation
-# Output: chunks (list of strings)
-def chunk_explanation(state: LearningState) -> dict:
-    print("\n>>> chunk_explanation received state:", state)
-    raw = state.get("raw_explanation", "")
-    if not raw:
-        return {"chunks": []}
-
-    prompt = f"""
+CHUNK_PROMPT = """
 You are a learning coach.
 
 You will be given an explanation of a technical topic.
@@ -107,23 +267,8 @@ Rules:
 - Here is the explanation to chunk: 
 {raw}
 """
-    response = llm.invoke([HumanMessage(content=prompt)])
-    # Simple parsing: split on blank lines
-    raw_chunks = [c.strip() for c in response.content.split("\n\n") if c.strip()]
-    return {"chunks": raw_chunks}
-
-# --- Node 3: generate_check_questions ---------------------------------------
-# Creates 3–5 retrieval-practice questions based on the chunks.
-# Input: chunks
-# Output: check_questions (list of strings)
-def generate_check_questions(state: LearningState) -> dict:
-    print("\n>>> generate_check_questions received state:", state)
-    chunks = state.get("chunks", [])
-    if not chunks:
-        return {"check_questions": []}
 
-    chunks_text = "\n\n".join(chunks)
-    prompt = f"""
+QUESTIONS_PROMPT = """
 You are a learning coach helping someone understand a technical topic.
 
 You will be given several learning chunks that explain the topic step by step.
@@ -133,32 +278,114 @@ Your job is to create 5 SHORT questions that help the learner check their unders
 Learning chunks:
 {chunks_text}
 """
-    response = llm.invoke([HumanMessage(content=prompt)])
-    text = response.content
 
-    # Parse numbered list into questions
-    questions: List[str] = []
-    num_pat = re.compile(r'^\s*\d+[\.\)\-]\s*(.+)$')
-    bullet_pat = re.compile(r'^\s*[\-\*]\s+(.+)$')
-
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        m= num_pat.match(line)
-        if m:
-            q = m.group(1).strip()
-            if q:
-                questions.append(q)
-            continue
-        m = bullet_pat.match(line)
-        if m:
-            q = m.group(1).strip()
-            if q:
-                questions.append(q)
-            continue
-        if line.endswith("?"):
-            questions.append(line)
+SUMMARY_PROMPT = """
+You are a learning scientist and technical explainer.
+
+Context:
+Topic: {topic}
+
+Raw explanation:
+{raw}
+
+Chunk titles:
+{chunks_text}
+
+Check questions:
+{questions_text}
+
+Tasks:
+1) Write a ONE-SENTENCE TL;DR summary of the topic. Begin the line with exactly: "Summary:".
+2) Write 2–3 bullets explaining how the structure supports learning. Each bullet must start with "- ".
+
+Return only the summary line and the bullets.
+"""
+
+# Used by the "parallel" topology, where the summary runs alongside question
+# generation and so only sees the explanation and chunk titles.
+PARALLEL_SUMMARY_PROMPT = """
+You are a learning scientist and technical explainer.
+
+Context:
+Topic: {topic}
+
+Raw explanation:
+{raw}
+
+Chunk titles:
+{chunks_text}
+
+Tasks:
+1) Write a ONE-SENTENCE TL;DR summary of the topic. Begin the line with exactly: "Summary:".
+2) Write 2–3 bullets explaining how the structure supports learning. Each bullet must start with "- ".
+
+Return only the summary line and the bullets.
+"""
+
+# --- Node 1: draft_explanation ----------------------------------------------
+# Generates a level-appropriate explanation of the topic.
+# Input: topic, level
+# Output: raw_explanation
+def draft_prompt(state: LearningState) -> Optional[str]:
+    topic = state.get("topic", "a technical topic")
+    level = state.get("level", "beginner")
+    return render_prompt("draft_explanation", DRAFT_PROMPT, {"level": level}, {"topic": ([topic], "")})
+
+def parse_draft(text: str, state: LearningState) -> dict:
+    return {"raw_explanation": text}
+
+def draft_explanation(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("draft_explanation", state):
+        return parse_draft(invoke_llm(draft_prompt(state), cache, llm), state)
+
+async def adraft_explanation(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("draft_explanation", state):
+        return parse_draft(await ainvoke_llm(draft_prompt(state), cache, llm), state)
+
+# --- Node 2: chunk_explanation ----------------------------------------------
+# Splits the explanation into 3–6 digestible chunks.
+# Input: raw_explanation
+# Output: chunks (list of strings)
+def chunk_prompt(state: LearningState) -> Optional[str]:
+    raw = state.get("raw_explanation", "")
+    if not raw:
+        return None
+    return render_prompt("chunk_explanation", CHUNK_PROMPT, {}, {"raw": ([raw], "")})
+
+def parse_chunks(text: str, state: LearningState) -> dict:
+    # JSON from structured output, else paragraphs split at "Chunk N:" titles
+    # (or blank lines); see node_output.read_chunks.
+    return {"chunks": read_chunks(text)}
+
+def chunk_explanation(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("chunk_explanation", state):
+        prompt = chunk_prompt(state)
+        text = invoke_llm(prompt, cache, llm, "chunk_explanation") if prompt else ""
+        return parse_chunks(text, state)
+
+async def achunk_explanation(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("chunk_explanation", state):
+        prompt = chunk_prompt(state)
+        text = await ainvoke_llm(prompt, cache, llm, "chunk_explanation") if prompt else ""
+        return parse_chunks(text, state)
+
+# --- Node 3: generate_check_questions ---------------------------------------
+# Creates 3–5 retrieval-practice questions based on the chunks.
+# Input: chunks
+# Output: check_questions (list of strings)
+def questions_prompt(state: LearningState) -> Optional[str]:
+    chunks = state.get("chunks", [])
+    if not chunks:
+        return None
+    return render_prompt(
+        "generate_check_questions", QUESTIONS_PROMPT, {}, {"chunks_text": (chunks, "\n\n")}
+    )
+
+def parse_questions(text: str, state: LearningState) -> dict:
+    chunks = state.get("chunks", [])
+
+    # Numbered / bulleted items and lines ending in "?" (or the JSON list).
+    questions = read_questions(text)
 
     if not questions:
         for c in chunks[:5]:  # cap at 5
@@ -166,97 +393,623 @@ Learning chunks:
             title = title.removeprefix("Chunk ").split(":", 1)[-1].strip()  # "Identity Verification"
             if title:
                 questions.append(f"What is {title.lower()}?")
-        # ensure unique and trimmed
-        questions = [q.strip() for q in questions if q.strip()]
-
 
     return {"check_questions": questions}
 
+def generate_check_questions(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("generate_check_questions", state):
+        prompt = questions_prompt(state)
+        text = invoke_llm(prompt, cache, llm, "generate_check_questions") if prompt else ""
+        return parse_questions(text, state)
+
+async def agenerate_check_questions(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("generate_check_questions", state):
+        prompt = questions_prompt(state)
+        text = await ainvoke_llm(prompt, cache, llm, "generate_check_questions") if prompt else ""
+        return parse_questions(text, state)
+
 # --- Node 4: summarize_and_meta ---------------------------------------------
 # Produces a one-sentence TL;DR and meta-learning notes.
 # Input: topic, level, raw_explanation, chunks, check_questions
 # Output: summary, meta (notes + counts)
-def summarize_and_meta(state: LearningState) -> dict:
-    print("\n>>> summarize_and_meta received state:", state)
+def summary_prompt(state: LearningState) -> Optional[str]:
     topic = state.get("topic", "this topic")
     raw = state.get("raw_explanation", "")
     chunks = state.get("chunks", [])
     questions = state.get("check_questions", [])
 
     # Prepare compact context for the LLM
-    chunks_text = "\n".join(f"- {c.splitlines()[0]}" for c in chunks[:6])  # only titles for brevity
-    questions_text = "\n".join(f"- {q}" for q in questions[:5])
+    chunk_titles = [f"- {c.splitlines()[0]}" for c in chunks[:6]]  # only titles for brevity
+    question_lines = [f"- {q}" for q in questions[:5]]
+
+    return render_prompt(
+        "summarize_and_meta",
+        SUMMARY_PROMPT,
+        {"topic": topic},
+        {
+            "raw": ([raw], ""),
+            "chunks_text": (chunk_titles or ["- (none)"], "\n"),
+            "questions_text": (question_lines or ["- (none)"], "\n"),
+        },
+    )
 
-    prompt = f"""
-You are a learning scientist and technical explainer.
+def parse_summary(text: str, state: LearningState) -> dict:
+    topic = state.get("topic", "this topic")
+    chunks = state.get("chunks", [])
+    questions = state.get("check_questions", [])
+    summary_line, bullets = read_summary(text)
 
-Context:
-Topic: {topic}
+    return {
+        "summary": summary_line or f"A short overview of {topic}.",
+        "meta": {
+            "learning_design_notes": bullets,
+            "num_chunks": len(chunks),
+            "num_questions": len(questions),
+        },
+    }
 
-Raw explanation:
-{raw}
+def summarize_and_meta(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("summarize_and_meta", state):
+        return parse_summary(invoke_llm(summary_prompt(state), cache, llm, "summarize_and_meta"), state)
 
-Chunk titles:
-{chunks_text or "- (none)"}
+async def asummarize_and_meta(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("summarize_and_meta", state):
+        return parse_summary(await ainvoke_llm(summary_prompt(state), cache, llm, "summarize_and_meta"), state)
 
-Check questions:
-{questions_text or "- (none)"}
+# --- Parallel topology nodes ----------------------------------------------
+# In the "parallel" topology the summary branch runs next to question
+# generation, so it cannot see the questions. merge_meta joins the two
+# branches and fills in the counts once both have finished.
+def parallel_summary_prompt(state: LearningState) -> Optional[str]:
+    chunks = state.get("chunks", [])
+    chunk_titles = [f"- {c.splitlines()[0]}" for c in chunks[:6]]
+    return render_prompt(
+        "summarize_and_meta",
+        PARALLEL_SUMMARY_PROMPT,
+        {"topic": state.get("topic", "this topic")},
+        {
+            "raw": ([state.get("raw_explanation", "")], ""),
+            "chunks_text": (chunk_titles or ["- (none)"], "\n"),
+        },
+    )
+
+def summarize_branch(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("summarize_and_meta", state):
+        return parse_summary(invoke_llm(parallel_summary_prompt(state), cache, llm, "summarize_and_meta"), state)
+
+async def asummarize_branch(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("summarize_and_meta", state):
+        return parse_summary(await ainvoke_llm(parallel_summary_prompt(state), cache, llm, "summarize_and_meta"), state)
+
+def merge_meta(state: LearningState) -> dict:
+    meta = dict(state.get("meta", {}))
+    meta["num_chunks"] = len(state.get("chunks", []))
+    meta["num_questions"] = len(state.get("check_questions", []))
+    return {"meta": meta}
+
+# --- Pipelined topology nodes ----------------------------------------------
+# In the "pipelined" topology chunk_explanation streams its reply and starts
+# a question call for each chunk as soon as the next chunk's title arrives
+# (ChunkSplitter), so question generation overlaps the rest of the stream
+# instead of waiting for it. Each call asks for QUESTIONS_PER_CHUNK questions
+# about one chunk; the answers are merged round-robin (every chunk's first
+# question, then the second ones) and capped at QUESTION_LIMIT. The node
+# returns both chunks and check_questions.
+QUESTIONS_PER_CHUNK = 2
+QUESTION_LIMIT = 5
+PIPELINE_MAX_WORKERS = 6
+
+CHUNK_QUESTIONS_PROMPT = """
+You are a learning coach helping someone understand a technical topic.
 
-Tasks:
-1) Write a ONE-SENTENCE TL;DR summary of the topic. Begin the line with exactly: "Summary:".
-2) Write 2–3 bullets explaining how the structure supports learning. Each bullet must start with "- ".
+You will be given one learning chunk from a step-by-step explanation.
 
-Return only the summary line and the bullets.
+Your job is to create {count} SHORT questions that help the learner check their understanding of this chunk.
+
+Learning chunk:
+{chunk_text}
 """
 
-    response = llm.invoke([HumanMessage(content=prompt)])
-    summary_line, bullets = "", []
+def chunk_questions_prompt(chunk: str) -> str:
+    return render_prompt(
+        "generate_check_questions",
+        CHUNK_QUESTIONS_PROMPT,
+        {"count": str(QUESTIONS_PER_CHUNK)},
+        {"chunk_text": ([chunk], "")},
+    )
+
+def _chunk_questions(chunk: str, state: LearningState, cache: Optional[ResponseCache], llm) -> List[str]:
+    with node_span("generate_check_questions", state):
+        return read_questions(invoke_llm(chunk_questions_prompt(chunk), cache, llm, "generate_check_questions"))
+
+async def _achunk_questions(chunk: str, state: LearningState, cache: Optional[ResponseCache], llm) -> List[str]:
+    with node_span("generate_check_questions", state):
+        return read_questions(await ainvoke_llm(chunk_questions_prompt(chunk), cache, llm, "generate_check_questions"))
+
+def _merge_questions(chunks: List[str], per_chunk: Dict[str, List[str]], state: LearningState) -> dict:
+    # Chunks that were split early but are not in the final list are dropped.
+    merged = [q for row in itertools.zip_longest(*(per_chunk.get(c, []) for c in chunks))
+              for q in row if q]
+    if not merged:
+        # Same chunk-title fallback as the questions node.
+        return parse_questions("", {**state, "chunks": chunks})
+    return {"check_questions": merged[:QUESTION_LIMIT]}
+
+def chunk_and_questions(state: LearningState, cache: Optional[ResponseCache] = None, llm=None,
+                        questions_llm=None) -> dict:
+    prompt = chunk_prompt(state)
+    if not prompt:
+        return {**parse_chunks("", state), **parse_questions("", state)}
+
+    futures: Dict[str, Future] = {}
+    with ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS) as pool:
+        def submit(chunk: str) -> None:
+            if chunk not in futures:
+                # Each call runs in a copy of this context, so it is traced
+                # under this node and gets its own metrics span.
+                futures[chunk] = pool.submit(contextvars.copy_context().run,
+                                             _chunk_questions, chunk, state, cache, questions_llm)
+
+        with node_span("chunk_explanation", state):
+            splitter, parts = ChunkSplitter(), []
+            for piece in stream_llm(prompt, cache, llm):
+                parts.append(piece)
+                for chunk in splitter.feed(piece):
+                    submit(chunk)
+            result = parse_chunks("".join(parts), state)
+        for chunk in result["chunks"]:
+            submit(chunk)
+        per_chunk = {chunk: future.result() for chunk, future in futures.items()}
+    return {**result, **_merge_questions(result["chunks"], per_chunk, state)}
+
+async def achunk_and_questions(state: LearningState, cache: Optional[ResponseCache] = None, llm=None,
+                               questions_llm=None) -> dict:
+    prompt = chunk_prompt(state)
+    if not prompt:
+        return {**parse_chunks("", state), **parse_questions("", state)}
+
+    tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(chunk: str) -> None:
+        if chunk not in tasks:
+            tasks[chunk] = asyncio.ensure_future(_achunk_questions(chunk, state, cache, questions_llm))
+
+    try:
+        with node_span("chunk_explanation", state):
+            splitter, parts = ChunkSplitter(), []
+            async for piece in astream_llm(prompt, cache, llm):
+                parts.append(piece)
+                for chunk in splitter.feed(piece):
+                    submit(chunk)
+            result = parse_chunks("".join(parts), state)
+        for chunk in result["chunks"]:
+            submit(chunk)
+        answers = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    per_chunk = dict(zip(tasks, answers))
+    return {**result, **_merge_questions(result["chunks"], per_chunk, state)}
+
+# --- Fused mode: one structured call ---------------------------------------
+# For latency-sensitive traffic, a single call asks the model for the whole
+# result as JSON. The reply is validated against LearningState; only if that
+# fails does the fused graph fall back to the four-node pipeline.
+FUSED_PROMPT = """
+You are a friendly technical learning assistant and learning scientist.
 
-    for line in response.content.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith("Summary:") and not summary_line:
-            summary_line = line[len("Summary:"):].strip()
-            continue
-        if line.startswith("- "):
-            bullets.append(line[2:].strip())
+Topic: {topic}
+Learner level: {level}
+
+Produce a complete mini-lesson and return it as ONE JSON object with exactly these keys:
+{{
+  "raw_explanation": "<explanation of the topic for a {level} learner, at most 30 words, using a real-world metaphor>",
+  "chunks": ["Chunk 1: <title>\\n<2–4 sentences>", "... 4 chunks in total, one idea each"],
+  "check_questions": ["<5 short questions that check understanding>"],
+  "summary": "<ONE-SENTENCE TL;DR summary of the topic>",
+  "learning_design_notes": ["<2–3 notes on how the structure supports learning>"]
+}}
+
+Use simple, clear language and define technical terms the first time you use them.
+Return ONLY the JSON object, with no surrounding text or code fences.
+"""
 
+# Fields the fused reply must provide, checked against LearningState's types.
+FUSED_FIELDS = ("raw_explanation", "chunks", "check_questions", "summary")
+
+def fused_prompt(state: LearningState) -> Optional[str]:
+    return render_prompt(
+        "fused_generate",
+        FUSED_PROMPT,
+        {"level": state.get("level", "beginner")},
+        {"topic": ([state.get("topic", "a technical topic")], "")},
+    )
+
+def _matches_type(value, hint) -> bool:
+    if hint is str:
+        return isinstance(value, str) and bool(value.strip())
+    if getattr(hint, "__origin__", None) is list:
+        (item_type,) = hint.__args__
+        return isinstance(value, list) and bool(value) and all(
+            isinstance(v, item_type) for v in value
+        )
+    return isinstance(value, hint)
+
+def parse_fused(text: str, state: LearningState) -> dict:
+    """Parse and validate a fused reply. Returns {} when it does not fit the schema."""
+    result = _fused_result(load_json_object(text))
+    count_fused(bool(result))
+    return result
+
+def _fused_result(data: Optional[dict]) -> dict:
+    if data is None:
+        return {}
+    hints = get_type_hints(LearningState)
+    for field in FUSED_FIELDS:
+        if not _matches_type(data.get(field), hints[field]):
+            return {}
+    notes = data.get("learning_design_notes", [])
+    if not isinstance(notes, list) or not all(isinstance(n, str) for n in notes):
+        return {}
+
+    chunks = [c.strip() for c in data["chunks"] if c.strip()]
+    questions = [q.strip() for q in data["check_questions"] if q.strip()]
     return {
-        "summary": summary_line or f"A short overview of {topic}.",
+        "raw_explanation": data["raw_explanation"].strip(),
+        "chunks": chunks,
+        "check_questions": questions,
+        "summary": data["summary"].strip(),
         "meta": {
-            "learning_design_notes": bullets,
+            "learning_design_notes": [n.strip() for n in notes if n.strip()],
             "num_chunks": len(chunks),
             "num_questions": len(questions),
         },
     }
 
+def fused_generate(state: LearningState, cache: Optional[ResponseCache] = None, llm=None) -> dict:
+    with node_span("fused_generate", state):
+        return parse_fused(invoke_llm(fused_prompt(state), cache, llm, "fused_generate"), state)
+
+def _fused_route(state: LearningState) -> str:
+    from langgraph.graph import END
+    if all(field in state for field in FUSED_FIELDS):
+        return END
+    return "draft_explanation"
+
+# --- Stage table ------------------------------------------------------------
+# (node name, prompt builder, parser) in pipeline order. Runners that drive
+# the stages themselves (rather than through LangGraph) iterate over this.
+STAGES = [
+    ("draft_explanation", draft_prompt, parse_draft),
+    ("chunk_explanation", chunk_prompt, parse_chunks),
+    ("generate_check_questions", questions_prompt, parse_questions),
+    ("summarize_and_meta", summary_prompt, parse_summary),
+]
+
+# Every template the graphs send. Anything cached on graph *output* (e.g.
+# evaluation targets) should include prompt_fingerprint() in its key, so a
+# prompt, prompt-budget or output-schema edit invalidates it.
+PROMPT_TEMPLATES = {
+    "draft": DRAFT_PROMPT,
+    "chunk": CHUNK_PROMPT,
+    "questions": QUESTIONS_PROMPT,
+    "summary": SUMMARY_PROMPT,
+    "parallel_summary": PARALLEL_SUMMARY_PROMPT,
+    "chunk_questions": CHUNK_QUESTIONS_PROMPT,
+    "fused": FUSED_PROMPT,
+}
+
+def prompt_fingerprint() -> str:
+    payload = json.dumps([PROMPT_TEMPLATES, NODE_BUDGETS, NODE_SCHEMAS], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# --- Retry policies ---------------------------------------------------------
+# Each LLM node retries transient failures (timeouts, dropped connections,
+# rate limits, 5xx) with exponential backoff and jitter before the run fails.
+# Combined with a checkpointer (see checkpoints.py), a run that still fails
+# resumes from the failed node instead of redoing the calls before it.
+def is_transient_error(exc: Exception) -> bool:
+    from langgraph.types import default_retry_on
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return default_retry_on(exc)
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return default_retry_on(exc)
+
+RETRY_NODES = (
+    "draft_explanation",
+    "chunk_explanation",
+    "generate_check_questions",
+    "summarize_and_meta",
+    "fused_generate",
+)
+
+def _default_retry_policy():
+    from langgraph.types import RetryPolicy
+    return RetryPolicy(
+        initial_interval=1.0,
+        backoff_factor=2.0,
+        max_interval=30.0,
+        max_attempts=3,
+        jitter=True,
+        retry_on=is_transient_error,
+    )
+
+# DEFAULT_RETRY_POLICY and NODE_RETRY_POLICIES (per-node overrides; pass
+# retry_policies={} to a builder to disable) are created on first access,
+# since RetryPolicy lives in langgraph. Once created, edits to
+# NODE_RETRY_POLICIES apply to every graph built afterwards.
+def _node_retry_policies() -> dict:
+    g = globals()
+    if "NODE_RETRY_POLICIES" not in g:
+        g["DEFAULT_RETRY_POLICY"] = _default_retry_policy()
+        g["NODE_RETRY_POLICIES"] = {node: g["DEFAULT_RETRY_POLICY"] for node in RETRY_NODES}
+    return g["NODE_RETRY_POLICIES"]
+
+def __getattr__(name: str):
+    if name == "llm":
+        return get_llm()
+    if name in ("DEFAULT_RETRY_POLICY", "NODE_RETRY_POLICIES"):
+        _node_retry_policies()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _add_nodes(graph: "StateGraph", nodes: dict, retry_policies: Optional[dict]) -> None:
+    policies = _node_retry_policies() if retry_policies is None else retry_policies
+    for name, action in nodes.items():
+        graph.add_node(name, action, retry_policy=policies.get(name))
+
 # --- Graph Construction -----------------------------------------------------
-def build_app():
+# Three topologies are available:
+#   "sequential": START → draft → chunk → questions → summary → END
+#   "parallel":   START → draft → chunk → (questions ‖ summary) → merge_meta → END
+#   "pipelined":  START → draft → chunk+questions (streamed) → summary → END
+# The parallel variant saves roughly one LLM round trip per run; its summary
+# is written from the chunk titles only, since questions are not ready yet.
+# The pipelined variant overlaps question generation with the chunk stream
+# (see chunk_and_questions); there is no separate questions node.
+TOPOLOGIES = ("sequential", "parallel", "pipelined")
+
+def _wire(graph: "StateGraph", topology: str) -> None:
+    from langgraph.graph import END, START
+    graph.add_edge(START, "draft_explanation")
+    graph.add_edge("draft_explanation", "chunk_explanation")
+    if topology == "pipelined":
+        graph.add_edge("chunk_explanation", "summarize_and_meta")
+        graph.add_edge("summarize_and_meta", END)
+    elif topology == "sequential":
+        graph.add_edge("chunk_explanation", "generate_check_questions")
+        graph.add_edge("generate_check_questions", "summarize_and_meta")
+        graph.add_edge("summarize_and_meta", END)
+    else:
+        graph.add_node("merge_meta", merge_meta)
+        # Fan out after chunking, then join once both branches are done.
+        graph.add_edge("chunk_explanation", "generate_check_questions")
+        graph.add_edge("chunk_explanation", "summarize_and_meta")
+        graph.add_edge(["generate_check_questions", "summarize_and_meta"], "merge_meta")
+        graph.add_edge("merge_meta", END)
+
+def _check_topology(topology: str) -> None:
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology {topology!r}; expected one of {TOPOLOGIES}")
+
+# Pass a ResponseCache to reuse LLM responses across runs; the CLI harness,
+# Streamlit UI and evaluation script can share one store this way. Pass
+# llm to run the graph on a different LLM than the module default.
+# Pass a checkpointer (e.g. checkpoints.sqlite_checkpointer()) to persist
+# state after every node so failed runs can be resumed; invocations then
+# need a run id (checkpoints.run_config / run_checkpointed).
+# Pass routing={node: ModelConfig(...)} to give nodes their own model,
+# temperature, output cap and timeout (see model_routing.py); nodes left out
+# of the table use `llm`.
+def build_app(
+    cache: Optional[ResponseCache] = None,
+    topology: str = "sequential",
+    llm=None,
+    checkpointer=None,
+    retry_policies: Optional[dict] = None,
+    routing: Optional[dict] = None,
+):
+    _ensure_env()
+    from langgraph.graph import StateGraph
+    _check_topology(topology)
+    summarize = summarize_branch if topology == "parallel" else summarize_and_meta
+    llms = node_llms(routing, llm)
+
+    # Wrap nodes so they capture the cache and their LLM via closure
+    def draft_node(state):
+        return draft_explanation(state, cache, llms["draft_explanation"])
+
+    def chunk_node(state):
+        if topology == "pipelined":
+            return chunk_and_questions(state, cache, llms["chunk_explanation"],
+                                       llms["generate_check_questions"])
+        return chunk_explanation(state, cache, llms["chunk_explanation"])
+
+    def questions_node(state):
+        return generate_check_questions(state, cache, llms["generate_check_questions"])
+
+    def summary_node(state):
+        return summarize(state, cache, llms["summarize_and_meta"])
+
     graph = StateGraph(LearningState)
     # Register nodes
-    graph.add_node("draft_explanation", draft_explanation)
-    graph.add_node("chunk_explanation", chunk_explanation)
-    graph.add_node("generate_check_questions", generate_check_questions)
-    graph.add_node("summarize_and_meta", summarize_and_meta)
-    # Wire them: START → draft → chunk → questions → summary → END
-    graph.add_edge(START, "draft_explanation")
+    nodes = {
+        "draft_explanation": draft_node,
+        "chunk_explanation": chunk_node,
+        "generate_check_questions": questions_node,
+        "summarize_and_meta": summary_node,
+    }
+    if topology == "pipelined":
+        del nodes["generate_check_questions"]  # chunk_node produces the questions
+    _add_nodes(graph, nodes, retry_policies)
+    _wire(graph, topology)
+    return graph.compile(checkpointer=checkpointer)
+
+# --- Async Graph Construction -----------------------------------------------
+# Same topologies as build_app(), but every node awaits llm.ainvoke. Use this
+# with app.ainvoke()/app.abatch() when many topics should share one event loop.
+# Checkpointing here needs an async saver (e.g. AsyncSqliteSaver).
+def build_async_app(
+    cache: Optional[ResponseCache] = None,
+    topology: str = "sequential",
+    llm=None,
+    checkpointer=None,
+    retry_policies: Optional[dict] = None,
+    routing: Optional[dict] = None,
+):
+    _ensure_env()
+    from langgraph.graph import StateGraph
+    _check_topology(topology)
+    asummarize = asummarize_branch if topology == "parallel" else asummarize_and_meta
+    llms = node_llms(routing, llm)
+
+    async def draft_node(state):
+        return await adraft_explanation(state, cache, llms["draft_explanation"])
+
+    async def chunk_node(state):
+        if topology == "pipelined":
+            return await achunk_and_questions(state, cache, llms["chunk_explanation"],
+                                              llms["generate_check_questions"])
+        return await achunk_explanation(state, cache, llms["chunk_explanation"])
+
+    async def questions_node(state):
+        return await agenerate_check_questions(state, cache, llms["generate_check_questions"])
+
+    async def summary_node(state):
+        return await asummarize(state, cache, llms["summarize_and_meta"])
+
+    graph = StateGraph(LearningState)
+    nodes = {
+        "draft_explanation": draft_node,
+        "chunk_explanation": chunk_node,
+        "generate_check_questions": questions_node,
+        "summarize_and_meta": summary_node,
+    }
+    if topology == "pipelined":
+        del nodes["generate_check_questions"]  # chunk_node produces the questions
+    _add_nodes(graph, nodes, retry_policies)
+    _wire(graph, topology)
+    return graph.compile(checkpointer=checkpointer)
+
+# --- Fused Graph Construction -----------------------------------------------
+# START → fused_generate → END when the single structured reply validates,
+# otherwise fused_generate → draft → chunk → questions → summary → END.
+# The final state has the same shape as build_app()'s, so the UI and the
+# evaluators work unchanged.
+def build_fused_app(
+    cache: Optional[ResponseCache] = None,
+    llm=None,
+    checkpointer=None,
+    retry_policies: Optional[dict] = None,
+    routing: Optional[dict] = None,
+):
+    _ensure_env()
+    from langgraph.graph import END, START, StateGraph
+    llms = node_llms(routing, llm)
+
+    def fused_node(state):
+        return fused_generate(state, cache, llms["fused_generate"])
+
+    def draft_node(state):
+        return draft_explanation(state, cache, llms["draft_explanation"])
+
+    def chunk_node(state):
+        return chunk_explanation(state, cache, llms["chunk_explanation"])
+
+    def questions_node(state):
+        return generate_check_questions(state, cache, llms["generate_check_questions"])
+
+    def summary_node(state):
+        return summarize_and_meta(state, cache, llms["summarize_and_meta"])
+
+    graph = StateGraph(LearningState)
+    _add_nodes(graph, {
+        "fused_generate": fused_node,
+        "draft_explanation": draft_node,
+        "chunk_explanation": chunk_node,
+        "generate_check_questions": questions_node,
+        "summarize_and_meta": summary_node,
+    }, retry_policies)
+    graph.add_edge(START, "fused_generate")
+    graph.add_conditional_edges("fused_generate", _fused_route, ["draft_explanation", END])
     graph.add_edge("draft_explanation", "chunk_explanation")
     graph.add_edge("chunk_explanation", "generate_check_questions")
     graph.add_edge("generate_check_questions", "summarize_and_meta")
     graph.add_edge("summarize_and_meta", END)
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
+
+# --- Shared compiled graph --------------------------------------------------
+# Compiling a graph costs far more than invoking it, so long-lived callers
+# (app.py, the UI, the CLI harness) share one compiled app per topology,
+# backed by the default on-disk ResponseCache. Build your own with
+# build_app() when you need a different cache, LLM or checkpointer.
+@lru_cache(maxsize=None)
+def default_response_cache() -> ResponseCache:
+    return ResponseCache()
+
+@lru_cache(maxsize=None)
+def get_app(topology: str = "sequential"):
+    return build_app(cache=default_response_cache(), topology=topology)
+
+# --- Bulk async entry point -------------------------------------------------
+# Runs many topics concurrently on one event loop. `levels` is either a single
+# level for every topic or a list aligned with `topics`. At most
+# `max_concurrency` graph runs are in flight at once; a failing topic comes
+# back as its exception instead of cancelling the rest of the batch.
+async def run_many(
+    topics: List[str],
+    levels: Union[str, List[str]] = "beginner",
+    max_concurrency: int = 16,
+    cache: Optional[ResponseCache] = None,
+    app=None,
+    llm=None,
+    routing: Optional[dict] = None,
+) -> List[Union[LearningState, Exception]]:
+    if isinstance(levels, str):
+        levels = [levels] * len(topics)
+    if len(levels) != len(topics):
+        raise ValueError("topics and levels must have the same length")
+
+    app = app or build_async_app(cache=cache, llm=llm, routing=routing)
+    inputs: List[LearningState] = [
+        {"topic": topic, "level": level} for topic, level in zip(topics, levels)
+    ]
+    return await app.abatch(
+        inputs,
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
 
 # --- CLI Test Harness -------------------------------------------------------
 # Allows quick local testing without LangSmith dataset.
 # For evaluation, evaluate_chunkbuddy.py loads chunkbuddy-topics instead.
 if __name__ == "__main__":
-    app = build_app()
+    # One timing line per node by default; CHUNKBUDDY_VERBOSITY=2 also dumps
+    # each node's input state, 0 silences node output.
+    set_verbosity(int(os.environ.get("CHUNKBUDDY_VERBOSITY", "1")))
+    cache = default_response_cache()
+    app = get_app()
     initial_state: LearningState = {
         "topic": "TLS Handshake",
         "level": "beginner",
     }
-    final_state = app.invoke(initial_state)
+    # Precomputed topics come straight from the topic library, and
+    # near-duplicate topics from the semantic cache, without running the
+    # graph at all. (Imported here: both modules import this one.)
+    from semantic_cache import SemanticCache, invoke_with_semantic_cache
+    from topic_library import TopicLibrary
+    final_state = TopicLibrary().get(initial_state["topic"], initial_state["level"])
+    if final_state is None:
+        final_state = invoke_with_semantic_cache(app, initial_state, SemanticCache())
     print("\n=== FINAL STATE ===")
     for k, v in final_state.items():
         print(f"{k}: {v}")
+    print(f"\n(cache: {cache.hits} hits, {cache.misses} misses)")
@@ -0,0 +1,433 @@
+# chunkbuddy_service.py
+# ---------------------------------------------------------------------------
+# ASGI HTTP service for the ChunkBuddy graph, so other applications can use
+# it under load (the Streamlit UI, the CLI harness and LangGraph Studio are
+# all single-user).
+#
+# Endpoints:
+#   POST /v1/lessons          {"topic": ..., "level": ...} → final LearningState
+#   POST /v1/lessons/stream   same body, answered as Server-Sent Events:
+#                             `accepted`, one `node` event per finished node,
+#                             then `done` with the final state
+#   GET  /v1/lessons/stream?topic=...&level=...   the same, for EventSource
+#   GET  /healthz             worker / queue occupancy as JSON
+#   GET  /metrics             the metrics registry in Prometheus text format
+#
+# Load handling:
+#   - at most `workers` graph runs execute at once; up to `queue_size` more
+#     wait for a worker. Beyond that the service answers 429 with
+#     Retry-After instead of queueing without bound.
+#   - identical concurrent requests (same normalised topic and level) share
+#     one run via single_flight.SingleFlight and take a single slot. A
+#     streamed run is cancelled, freeing its slot, once every client that
+#     was following it has disconnected.
+#
+# It is a plain ASGI callable with no framework dependency; any ASGI server
+# can host it. Usage:
+#   python chunkbuddy_service.py --port 8000 --workers 8 --queue-size 64
+#   python chunkbuddy_service.py --fake-llm 0.2      # offline, fake LLM
+#   python chunkbuddy_service.py smoke --requests 200 --workers 4 --queue-size 16
+# ---------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from chunkbuddy_graph import build_async_app, default_response_cache
+from metrics import REGISTRY
+from single_flight import SingleFlight, count_run, run_key
+
+LEVELS = ("beginner", "intermediate", "advanced")
+MAX_TOPIC_CHARS = 200
+MAX_BODY_BYTES = 16 * 1024
+
+REGISTRY.describe("chunkbuddy_service_requests_total", "HTTP requests by route and status code.")
+REGISTRY.describe("chunkbuddy_service_request_seconds", "HTTP request wall time by route.")
+REGISTRY.describe("chunkbuddy_service_running", "Graph runs currently holding a worker.")
+REGISTRY.describe("chunkbuddy_service_queued", "Graph runs waiting for a worker.")
+
+
+class QueueFull(Exception):
+    """Every worker is busy and the wait queue is full."""
+
+
+class BadRequest(Exception):
+    pass
+
+
+# --- Admission control -------------------------------------------------------
+class Admission:
+    """
+    `workers` concurrent runs plus a bounded wait queue. slot() rejects with
+    QueueFull immediately when the queue is full, instead of waiting.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        if workers < 1 or queue_size < 0:
+            raise ValueError("workers must be >= 1 and queue_size >= 0")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.running = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(workers)
+
+    def _publish(self) -> None:
+        REGISTRY.set_gauge("chunkbuddy_service_running", self.running)
+        REGISTRY.set_gauge("chunkbuddy_service_queued", self.queued)
+
+    def reserve(self) -> None:
+        """
+        Take a place in line, or raise QueueFull. Must be followed by
+        slot(reserved=True), or by unreserve() if the run is abandoned first.
+        """
+        if self.running + self.queued >= self.workers + self.queue_size:
+            raise QueueFull()
+        self.queued += 1
+        self._publish()
+
+    def unreserve(self) -> None:
+        """Give back a place taken by reserve() that slot() never used."""
+        self.queued -= 1
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self, reserved: bool = False) -> AsyncIterator[None]:
+        if not reserved:
+            self.reserve()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        self._publish()
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            self._publish()
+
+    def health(self) -> dict:
+        return {"status": "ok", "workers": self.workers, "queue_size": self.queue_size,
+                "running": self.running, "queued": self.queued}
+
+
+# --- Request parsing ---------------------------------------------------------
+def parse_lesson_request(data) -> Dict[str, str]:
+    """Validate a request body / query into an initial LearningState."""
+    if not isinstance(data, dict):
+        raise BadRequest("expected a JSON object")
+    topic = data.get("topic")
+    if not isinstance(topic, str) or not topic.strip():
+        raise BadRequest("`topic` must be a non-empty string")
+    if len(topic) > MAX_TOPIC_CHARS:
+        raise BadRequest(f"`topic` is longer than {MAX_TOPIC_CHARS} characters")
+    level = data.get("level", "beginner")
+    if level not in LEVELS:
+        raise BadRequest(f"`level` must be one of {LEVELS}")
+    return {"topic": topic.strip(), "level": level}
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionResetError("client disconnected")
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise BadRequest("request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n".encode("utf-8")
+
+
+# --- Service -----------------------------------------------------------------
+class ChunkBuddyService:
+    """
+    The ASGI application. `app` is a compiled async graph (build_async_app);
+    by default one is built on first use with the shared on-disk response
+    cache.
+    """
+
+    def __init__(self, app=None, workers: int = 8, queue_size: int = 64, retry_after: int = 1):
+        self._app = app
+        self.admission = Admission(workers, queue_size)
+        self.flight = SingleFlight()
+        self.retry_after = retry_after
+
+    @property
+    def app(self):
+        if self._app is None:
+            self._app = build_async_app(cache=default_response_cache())
+        return self._app
+
+    # --- Graph runs (shared by identical concurrent requests) ----------------
+    async def _invoke(self, state: Dict[str, str]) -> dict:
+        async with self.admission.slot():
+            return await self.app.ainvoke(state)
+
+    async def _stream(self, state: Dict[str, str]) -> AsyncIterator[Tuple[str, dict]]:
+        self.admission.reserve()  # rejects before anything is streamed
+        try:
+            yield "accepted", {"topic": state["topic"], "level": state["level"]}
+        except BaseException:  # closed before slot() took over the reservation
+            self.admission.unreserve()
+            raise
+        result = dict(state)
+        async with self.admission.slot(reserved=True):
+            async for update in self.app.astream(state, stream_mode="updates"):
+                for node, values in update.items():
+                    result.update(values or {})
+                    yield "node", {"node": node, "update": values or {}}
+        yield "done", result
+
+    async def lesson(self, state: Dict[str, str]) -> dict:
+        result, shared = await self.flight.ado(run_key(state), lambda: self._invoke(state))
+        count_run("ainvoke", shared)
+        return {**result, **state}
+
+    def lesson_events(self, state: Dict[str, str]) -> AsyncIterator[Tuple[str, dict]]:
+        events, shared = self.flight.astream(run_key(state), lambda: self._stream(state))
+        count_run("astream", shared)
+        return events
+
+    # --- ASGI ----------------------------------------------------------------
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        start = time.perf_counter()
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        route, status = path, 500
+        try:
+            if path == "/healthz" and method == "GET":
+                status = await self._json(send, 200, self.admission.health())
+            elif path == "/metrics" and method == "GET":
+                body = REGISTRY.to_prometheus().encode("utf-8")
+                status = await self._respond(send, 200, body, b"text/plain; version=0.0.4; charset=utf-8")
+            elif path == "/v1/lessons" and method == "POST":
+                state = parse_lesson_request(_loads(await _read_body(receive)))
+                status = await self._json(send, 200, await self.lesson(state))
+            elif path == "/v1/lessons/stream" and method in ("GET", "POST"):
+                if method == "POST":
+                    data = _loads(await _read_body(receive))
+                else:
+                    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+                    data = {k: v[0] for k, v in query.items()}
+                status = await self._stream_response(receive, send, parse_lesson_request(data))
+            elif path in ("/healthz", "/metrics", "/v1/lessons", "/v1/lessons/stream"):
+                status = await self._json(send, 405, {"error": "method not allowed"})
+            else:
+                route = "other"
+                status = await self._json(send, 404, {"error": "not found"})
+        except BadRequest as exc:
+            status = await self._json(send, 400, {"error": str(exc)})
+        except QueueFull:
+            status = await self._json(send, 429, {"error": "server busy, retry later"},
+                                      [(b"retry-after", str(self.retry_after).encode())])
+        except ConnectionResetError:
+            status = 499  # client went away; nothing left to send
+        except Exception as exc:
+            status = await self._json(send, 500, {"error": f"{type(exc).__name__}: {exc}"})
+        finally:
+            REGISTRY.inc("chunkbuddy_service_requests_total", route=route, status=str(status))
+            REGISTRY.observe("chunkbuddy_service_request_seconds", time.perf_counter() - start, route=route)
+
+    async def _stream_response(self, receive, send, state: Dict[str, str]) -> int:
+        events = self.lesson_events(state)
+        try:
+            return await self._send_events(receive, send, events)
+        finally:
+            # Leaving the shared run: if no other request is following it,
+            # it is cancelled and its worker slot freed.
+            await events.aclose()
+
+    async def _send_events(self, receive, send, events) -> int:
+        # The first event is "accepted" or QueueFull, so a rejected request
+        # still gets a plain 429 rather than an event stream.
+        first = await events.__anext__()
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+
+        async def watch_disconnect() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        # Stop writing when the client leaves; the shared run carries on only
+        # while some other request is still following it.
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({"type": "http.response.body", "body": _sse(*first), "more_body": True})
+            while True:
+                # Wait for the next event or the disconnect, whichever is first,
+                # so a client that leaves mid-node is noticed straight away.
+                following = asyncio.ensure_future(events.__anext__())
+                await asyncio.wait({following, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if not following.done():
+                    following.cancel()
+                    await asyncio.wait({following})  # the replay must be idle before aclose()
+                    return 499
+                try:
+                    event = following.result()
+                except StopAsyncIteration:
+                    break
+                await send({"type": "http.response.body", "body": _sse(*event), "more_body": True})
+        except Exception as exc:
+            # Headers are already sent: report the failure in-stream.
+            await send({"type": "http.response.body", "more_body": True,
+                        "body": _sse("error", {"error": f"{type(exc).__name__}: {exc}"})})
+        finally:
+            watcher.cancel()
+        await send({"type": "http.response.body", "body": b""})
+        return 200
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes, content_type: bytes,
+                       headers: Optional[List[Tuple[bytes, bytes]]] = None) -> int:
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode()),
+            *(headers or []),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+        return status
+
+    async def _json(self, send, status: int, data, headers=None) -> int:
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        return await self._respond(send, status, body, b"application/json", headers)
+
+
+def _loads(body: bytes):
+    try:
+        return json.loads(body or b"{}")
+    except json.JSONDecodeError:
+        raise BadRequest("body is not valid JSON")
+
+
+def create_service(llm=None, workers: Optional[int] = None, queue_size: Optional[int] = None,
+                   topology: str = "sequential") -> ChunkBuddyService:
+    """
+    Build the service. Defaults come from CHUNKBUDDY_SERVICE_WORKERS /
+    CHUNKBUDDY_SERVICE_QUEUE. With an explicit `llm` (e.g. a FakeChatModel)
+    the response cache is off, so every run really calls the model.
+    """
+    workers = workers or int(os.environ.get("CHUNKBUDDY_SERVICE_WORKERS", "8"))
+    if queue_size is None:
+        queue_size = int(os.environ.get("CHUNKBUDDY_SERVICE_QUEUE", "64"))
+    cache = None if llm is not None else default_response_cache()
+    app = build_async_app(cache=cache, llm=llm, topology=topology)
+    return ChunkBuddyService(app, workers=workers, queue_size=queue_size)
+
+
+# --- In-process smoke test ---------------------------------------------------
+# Drives the ASGI callable directly (no server, no sockets) against the fake
+# LLM, to check the 200 / 429 split and latency under a burst.
+async def _call(service: ChunkBuddyService, method: str, path: str, body: bytes = b"") -> Tuple[int, bytes]:
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}
+    sent = False
+    response: Dict[str, object] = {"status": 0, "body": b""}
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # never disconnects
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] += message.get("body", b"")
+
+    await service(scope, receive, send)
+    return response["status"], response["body"]
+
+
+async def smoke(requests: int, distinct: int, workers: int, queue_size: int, latency: float,
+                stream: bool) -> dict:
+    from benchmark_chunkbuddy import TOPICS, percentile, quiet
+    from fake_llm import FakeChatModel
+
+    service = create_service(FakeChatModel(latency_mean=latency, latency_jitter=latency / 4),
+                             workers=workers, queue_size=queue_size)
+    path = "/v1/lessons/stream" if stream else "/v1/lessons"
+    latencies: List[float] = []
+
+    async def one(i: int) -> int:
+        body = json.dumps({"topic": f"{TOPICS[i % len(TOPICS)]} {i % distinct}"}).encode()
+        start = time.perf_counter()
+        status, _ = await _call(service, "POST", path, body)
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        return status
+
+    with quiet():
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    coalesced = REGISTRY.counter_value("chunkbuddy_singleflight_total",
+                                       mode="astream" if stream else "ainvoke", role="follower")
+    return {
+        "statuses": dict(Counter(statuses)),
+        "seconds": elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "coalesced": coalesced,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChunkBuddy HTTP service.")
+    parser.add_argument("command", nargs="?", default="serve", choices=["serve", "smoke"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, help="Concurrent graph runs (CHUNKBUDDY_SERVICE_WORKERS).")
+    parser.add_argument("--queue-size", type=int, help="Runs allowed to wait (CHUNKBUDDY_SERVICE_QUEUE).")
+    parser.add_argument("--topology", default="sequential")
+    parser.add_argument("--fake-llm", type=float, metavar="LATENCY",
+                        help="Serve with the offline fake LLM at this mean latency (s).")
+    parser.add_argument("--requests", type=int, default=200, help="smoke: concurrent requests.")
+    parser.add_argument("--distinct", type=int, default=50, help="smoke: distinct topics among them.")
+    parser.add_argument("--stream", action="store_true", help="smoke: use the SSE endpoint.")
+    args = parser.parse_args()
+
+    if args.command == "smoke":
+        report = asyncio.run(smoke(args.requests, args.distinct, args.workers or 8,
+                                   16 if args.queue_size is None else args.queue_size,
+                                   0.05 if args.fake_llm is None else args.fake_llm, args.stream))
+        print(json.dumps(report, indent=2))
+    else:
+        import uvicorn  # optional: only needed to serve over HTTP
+
+        llm = None
+        if args.fake_llm is not None:
+            from fake_llm import FakeChatModel
+            llm = FakeChatModel(latency_mean=args.fake_llm, latency_jitter=args.fake_llm / 4)
+        service = create_service(llm, args.workers, args.queue_size, args.topology)
+        uvicorn.run(service, host=args.host, port=args.port, log_level="warning")
@@ -6,12 +6,20 @@
 from typing import TypedDict, List
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage
-import re
 
-from agent_demo.load_env import load_env
+from load_env import load_env
+from node_output import read_chunks, read_questions, read_summary, response_format
 load_env()  # Load environment variables once
 
 
+# Structured output (a JSON schema per node) where the model supports it;
+# the readers in node_output.py handle both JSON and plain-text replies.
+def invoke_node(llm, prompt: str, node: str) -> str:
+    fmt = response_format(node, llm)
+    kwargs = {"response_format": fmt} if fmt else {}
+    return llm.invoke([HumanMessage(content=prompt)], **kwargs).content
+
+
 # ---------------------------------------------------------------------------
 # Shared State Definition
 # ---------------------------------------------------------------------------
@@ -70,8 +78,7 @@ Rules:
 Explanation:
 {raw}
 """
-    response = llm.invoke([HumanMessage(content=prompt)])
-    chunks = [c.strip() for c in response.content.split("\n\n") if c.strip()]
+    chunks = read_chunks(invoke_node(llm, prompt, "chunk_explanation"))
     return {"chunks": chunks}
 
 
@@ -89,27 +96,7 @@ Create 5 short retrieval-practice questions based on these learning chunks:
 
 {chunks_text}
 """
-    response = llm.invoke([HumanMessage(content=prompt)])
-    text = response.content
-
-    questions = []
-    num_pat = re.compile(r'^\s*\d+[\.\)\-]\s*(.+)$')
-    bullet_pat = re.compile(r'^\s*[\-\*]\s+(.+)$')
-
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        m = num_pat.match(line)
-        if m:
-            questions.append(m.group(1).strip())
-            continue
-        m = bullet_pat.match(line)
-        if m:
-            questions.append(m.group(1).strip())
-            continue
-        if line.endswith("?"):
-            questions.append(line)
+    questions = read_questions(invoke_node(llm, prompt, "generate_check_questions"))
 
     if not questions:
         for c in chunks[:5]:
@@ -150,19 +137,7 @@ Tasks:
 1) Write a ONE-SENTENCE TL;DR summary beginning with "Summary:".
 2) Write 2–3 bullets explaining how the structure supports learning.
 """
-    response = llm.invoke([HumanMessage(content=prompt)])
-
-    summary_line = ""
-    bullets = []
-
-    for line in response.content.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith("Summary:") and not summary_line:
-            summary_line = line[len("Summary:"):].strip()
-        elif line.startswith("- "):
-            bullets.append(line[2:].strip())
+    summary_line, bullets = read_summary(invoke_node(llm, prompt, "summarize_and_meta"))
 
     return {
         "summary": summary_line or f"A short overview of {topic}.",
@@ -178,10 +153,11 @@ Tasks:
 # Graph Construction
 # ---------------------------------------------------------------------------
 def build_app():
-    from langchain_openai import ChatOpenAI
-    from agent_demo.state import ChunkBuddyState
+    from llm_clients import get_chat_model
 
-    llm = ChatOpenAI(
+    # Shared client from the registry: re-compiling reuses its pooled
+    # connections, and calls share the process-wide rate limiter.
+    llm = get_chat_model(
         model="gpt-4o-mini",
         temperature=0,
     )
@@ -199,7 +175,7 @@ def build_app():
     def summary_node(state):
         return summarize_and_meta(state, llm)
 
-    graph = StateGraph(ChunkBuddyState)
+    graph = StateGraph(LearningState)
 
     graph.add_node("draft_explanation", draft_node)
     graph.add_node("chunk_explanation", chunk_node)
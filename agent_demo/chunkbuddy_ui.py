@@ -6,21 +6,121 @@
 # summary, and meta notes).
 # ---------------------------------------------------------------------------
 
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
 import streamlit as st
-from typing import TypedDict, List
 
 # Reuse the existing LangGraph app and state definition
-from chunkbuddy_standalone_graph import build_app, LearningState
+from chunkbuddy_standalone_graph import get_app, LearningState
+from llm_clients import prewarm
+from semantic_cache import SemanticCache
+from single_flight import coalesced
+from topic_library import TopicLibrary, topic_key
 from load_env import load_env
-load_env()
 
-# --- Build the LangGraph app once at startup -------------------------------
-# We compile the graph once and keep it in memory. Each user interaction
-# simply invokes this app with a new initial state.
-app = build_app()
+# --- Process-wide resources ------------------------------------------------
+# Streamlit re-runs this whole script on every widget interaction, so
+# anything expensive is created once per process with st.cache_resource and
+# shared by every rerun and every browser session.
+
+# Recent results per (topic, level), kept for RESULT_TTL_SECONDS. Pressing
+# "Teach me" again for the same topic, in any session, re-renders the stored
+# result instead of calling the LLM.
+RESULT_TTL_SECONDS = 3600
+RESULT_MAX_ENTRIES = 256
+# Previous runs kept in each browser session's history.
+HISTORY_SIZE = 20
+
+
+class ResultCache:
+    """Thread-safe in-memory (topic, level) → LearningState map with a TTL."""
+
+    def __init__(self, ttl_seconds: float = RESULT_TTL_SECONDS, max_entries: int = RESULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, str], Tuple[float, LearningState]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, topic: str, level: str) -> Optional[LearningState]:
+        key = (topic_key(topic), level)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, state: LearningState) -> None:
+        key = (topic_key(state["topic"]), state["level"])
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), state)
+            # Dicts keep insertion order, so the first key is the oldest.
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+
+@st.cache_resource(show_spinner=False)
+def startup() -> None:
+    load_env()
+    # Open pooled API connections while the learner is still typing, so the
+    # first LLM call skips the TCP/TLS handshake.
+    prewarm()
+
+
+# We compile the graph once and keep it in memory; each user interaction
+# simply invokes this app with a new initial state. It is first built when a
+# topic actually needs the graph, so the page renders without waiting for
+# LangGraph to load. Its response cache is the same on-disk store the CLI
+# and evaluation script use, so a topic that was already taught is served
+# without calling the LLM again. Sessions asking for the same topic and level
+# at the same moment share one run (see single_flight.py).
+@st.cache_resource(show_spinner="Loading ChunkBuddy...")
+def graph_app():
+    return coalesced(get_app())
+
+
+# Whole-run cache for near-duplicate topics ("Kafka partitions" vs
+# "partitions in Kafka"): a match skips the graph entirely.
+@st.cache_resource(show_spinner=False)
+def semantic_cache() -> SemanticCache:
+    return SemanticCache()
+
+
+# Precomputed results for common topics (see topic_library.py). Stale
+# entries are still shown instantly and regenerated in the background.
+@st.cache_resource(show_spinner=False)
+def topic_library() -> TopicLibrary:
+    return TopicLibrary(refresher=lambda state: graph_app().invoke(state))
+
+
+@st.cache_resource(show_spinner=False)
+def result_cache() -> ResultCache:
+    return ResultCache()
+
 
 # --- Streamlit page setup --------------------------------------------------
 st.set_page_config(page_title="ChunkBuddy", page_icon="🧠", layout="wide")
+startup()
+
+# Per-session state: the run on screen and earlier runs, so touching a
+# widget redraws them instead of clearing the page.
+st.session_state.setdefault("current", None)
+st.session_state.setdefault("history", [])
+
+
+def remember(result: LearningState, source: str) -> dict:
+    run_id = st.session_state.get("run_counter", 0) + 1
+    st.session_state["run_counter"] = run_id
+    run = {"id": run_id, "result": result, "source": source, "at": time.strftime("%H:%M:%S")}
+    st.session_state["current"] = run
+    st.session_state["history"] = ([run] + st.session_state["history"])[:HISTORY_SIZE]
+    return run
+
 
 st.title("🧠 ChunkBuddy – LangGraph Learning Assistant")
 st.write(
@@ -45,72 +145,171 @@ run_button = st.sidebar.button("Teach me 🚀")
 
 st.markdown("---")
 
-# --- Main interaction flow -------------------------------------------------
-if run_button:
-    if not topic.strip():
-        # Guard clause: require a non-empty topic
-        st.error("Please enter a topic.")
-    else:
-        # Show spinner while the graph runs
-        with st.spinner("ChunkBuddy is thinking..."):
-            # Prepare initial state for the graph
-            initial_state: LearningState = {
-                "topic": topic.strip(),
-                "level": level,
-            }
-            # Invoke the graph and collect results
-            result = app.invoke(initial_state)
-
-        # --- Layout: 2 columns (explanation + summary) ----------------------
-        col1, col2 = st.columns([2, 1])
-
-        # 1. Full explanation
-        with col1:
-            st.subheader("1. Explanation")
-            st.write(result.get("raw_explanation", "_No explanation generated._"))
-
-        # 2. TL;DR summary
-        with col2:
-            st.subheader("4. Quick Summary")
-            st.write(result.get("summary", "_No summary generated._"))
-
-        st.markdown("---")
-
-        # 3. Chunks (expandable sections)
-        st.subheader("2. Learning chunks")
+
+# --- Layout: reserve every section up front --------------------------------
+# Sections start as placeholders and are filled in as soon as the node that
+# owns them finishes, instead of waiting for the whole run.
+def reserve_layout() -> Dict[str, object]:
+    boxes: Dict[str, object] = {"status": st.status("ChunkBuddy is thinking...", expanded=False)}
+
+    col1, col2 = st.columns([2, 1])
+
+    # 1. Full explanation
+    with col1:
+        st.subheader("1. Explanation")
+        boxes["explanation"] = st.empty()
+
+    # 2. TL;DR summary
+    with col2:
+        st.subheader("4. Quick Summary")
+        boxes["summary"] = st.empty()
+
+    st.markdown("---")
+
+    # 3. Chunks (expandable sections)
+    st.subheader("2. Learning chunks")
+    boxes["chunks"] = st.container()
+
+    st.markdown("---")
+
+    # 4. Check-your-understanding questions
+    st.subheader("3. Check your understanding")
+    boxes["questions"] = st.container()
+
+    st.markdown("---")
+
+    # 5. Meta learning notes (optional)
+    boxes["notes"] = st.container()
+
+    # 6. Developer view: raw state (for debugging)
+    boxes["dev"] = st.empty()
+
+    boxes["explanation"].caption("_Waiting for the explanation..._")
+    boxes["summary"].caption("_Waiting for the summary..._")
+    return boxes
+
+
+# --- Fill in one section once its node has finished ------------------------
+def render_section(boxes: Dict[str, object], node: str, result: dict) -> None:
+    if node == "draft_explanation":
+        boxes["explanation"].write(result.get("raw_explanation") or "_No explanation generated._")
+
+    elif node == "chunk_explanation":
         chunks = result.get("chunks", [])
-        if not chunks:
-            st.write("_No chunks generated._")
-        else:
+        with boxes["chunks"]:
+            if not chunks:
+                st.write("_No chunks generated._")
             for i, chunk in enumerate(chunks, start=1):
                 with st.expander(f"Chunk {i}"):
                     st.write(chunk)
 
-        st.markdown("---")
-
-        # 4. Check-your-understanding questions
-        st.subheader("3. Check your understanding")
+    elif node == "generate_check_questions":
         questions = result.get("check_questions", [])
-        if not questions:
-            st.write("_No questions generated._")
-        else:
+        with boxes["questions"]:
+            if not questions:
+                st.write("_No questions generated._")
             for q in questions:
                 st.markdown(f"- {q}")
 
-        st.markdown("---")
-
-        # 5. Meta learning notes (optional)
-        meta = result.get("meta", {})
-        notes = meta.get("learning_design_notes", [])
+    elif node == "summarize_and_meta":
+        boxes["summary"].write(result.get("summary") or "_No summary generated._")
+        notes = result.get("meta", {}).get("learning_design_notes", [])
         if notes:
-            st.subheader("🧩 How this structure helps you learn")
-            for note in notes:
-                st.markdown(f"- {note}")
+            with boxes["notes"]:
+                st.subheader("🧩 How this structure helps you learn")
+                for note in notes:
+                    st.markdown(f"- {note}")
+
+
+def render_run(boxes: Dict[str, object], run: dict) -> None:
+    for node in ("draft_explanation", "chunk_explanation",
+                 "generate_check_questions", "summarize_and_meta"):
+        render_section(boxes, node, run["result"])
+    boxes["status"].update(label=f"Served from {run['source']} at {run['at']} ✅", state="complete")
+    with boxes["dev"].expander("Developer view: raw state"):
+        st.json(run["result"])
+
+
+# --- Stream the graph --------------------------------------------------------
+# "messages" yields LLM tokens as they arrive (used for the explanation),
+# "updates" yields each node's output once that node has finished.
+def stream_graph(boxes: Dict[str, object], initial_state: LearningState) -> LearningState:
+    result = dict(initial_state)
+    explanation_tokens: List[str] = []
 
-        # 6. Developer view: raw state (for debugging)
-        with st.expander("Developer view: raw state"):
-            st.json(result)
+    for mode, payload in graph_app().stream(initial_state, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            message, metadata = payload
+            if metadata.get("langgraph_node") == "draft_explanation" and message.content:
+                explanation_tokens.append(message.content)
+                boxes["explanation"].write("".join(explanation_tokens))
+            continue
+
+        for node, update in payload.items():
+            result.update(update or {})
+            boxes["status"].update(label=f"ChunkBuddy finished `{node}`...")
+            render_section(boxes, node, result)
+            if node == "chunk_explanation" and "check_questions" in (update or {}):
+                # Pipelined topology: the chunk node also wrote the questions.
+                render_section(boxes, "generate_check_questions", result)
+
+    boxes["status"].update(label="ChunkBuddy is done ✅", state="complete")
+    with boxes["dev"].expander("Developer view: raw state"):
+        st.json(result)
+    return result
+
+
+# --- Main interaction flow -------------------------------------------------
+if run_button:
+    if not topic.strip():
+        # Guard clause: require a non-empty topic
+        st.error("Please enter a topic.")
+    else:
+        # Prepare initial state for the graph
+        initial_state: LearningState = {
+            "topic": topic.strip(),
+            "level": level,
+        }
+
+        # Serve a recent identical run, then the precomputed library, then
+        # the semantic cache, and only run the graph when none has this topic.
+        served, source = result_cache().get(initial_state["topic"], level), "recent runs"
+        if served is None:
+            served, source = topic_library().get(initial_state["topic"], level), "topic library"
+        if served is None:
+            match = semantic_cache().lookup(initial_state["topic"], level)
+            if match is not None:
+                served, similarity = match
+                source = f"cache (similarity {similarity:.2f})"
+
+        boxes = reserve_layout()
+        if served is not None:
+            # Already taught (or near-duplicate): no LLM calls.
+            render_run(boxes, remember({**served, **initial_state}, source))
+        else:
+            result = stream_graph(boxes, initial_state)
+            semantic_cache().store(result)
+            remember(result, "a fresh run")
+
+        # Teaching this topic again, from any session, is now served from memory.
+        result_cache().put(st.session_state["current"]["result"])
+
+elif st.session_state["current"] is not None:
+    # A widget changed: redraw the last run instead of clearing the page.
+    render_run(reserve_layout(), st.session_state["current"])
 
 else:
     # Initial info message before user clicks the button
     st.info("Enter a topic and click **Teach me 🚀** in the sidebar to get started.")
+
+# --- Session history ---------------------------------------------------------
+# Previous runs in this session (drawn last, so it includes the run that just
+# finished). Picking one redraws it, with no LLM calls.
+if st.session_state["history"]:
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("History")
+    for run in st.session_state["history"]:
+        label = f"{run['result']['topic']} ({run['result']['level']}) · {run['at']}"
+        if st.sidebar.button(label, key=f"history-{run['id']}"):
+            st.session_state["current"] = run
+            st.rerun()
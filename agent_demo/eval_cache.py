@@ -0,0 +1,69 @@
+# eval_cache.py
+# ---------------------------------------------------------------------------
+# Content-addressed cache for evaluation runs.
+# Re-running an evaluation after changing only an evaluator should not re-run
+# the graph or re-ask the judge about explanations it has already scored.
+# Entries are keyed by a hash of everything that determines the result:
+#   - targets: graph prompt templates + model settings + the input row
+#   - verdicts: judge prompt (which embeds the explanation) + judge settings
+# so an unchanged row is a hit and a prompt edit only misses what it affects.
+# Values are JSON dicts stored in a ResponseCache (memory LRU + SQLite).
+# ---------------------------------------------------------------------------
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from llm_cache import ResponseCache
+
+DEFAULT_EVAL_CACHE_PATH = Path(__file__).parent / ".cache" / "eval_results.sqlite"
+
+
+def content_key(kind: str, *parts: Any) -> str:
+    """sha256 over a canonical JSON encoding of `kind` and `parts`."""
+    payload = json.dumps([kind, *parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EvalCache:
+    """Stores evaluation targets and judge verdicts by content key."""
+
+    def __init__(
+        self,
+        path: Optional[Path] = DEFAULT_EVAL_CACHE_PATH,
+        max_entries: int = 100_000,
+        ttl_seconds: Optional[float] = None,
+    ):
+        # Keys change whenever their inputs do, so entries never go stale;
+        # by default only the size limit evicts anything.
+        self._store = ResponseCache(
+            path=path,
+            max_memory_entries=1024,
+            max_disk_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+        )
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        value = self._store.get(key)
+        counts = self.stats.setdefault(kind, {"hits": 0, "misses": 0})
+        counts["hits" if value is not None else "misses"] += 1
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: dict) -> None:
+        self._store.set(key, json.dumps(value, ensure_ascii=False))
+
+    def cached(self, kind: str, key: str, compute: Callable[[], dict]) -> dict:
+        """Return the stored value for `key`, or compute, store and return it."""
+        value = self.get(kind, key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._store.clear()
+
+    def close(self) -> None:
+        self._store.close()
@@ -17,23 +17,62 @@ Prereqs:
 # --- Imports & environment bootstrap ----------------------------------------
 # We load environment variables first so API keys and project settings
 # are available to LangGraph and LangSmith.
+from functools import lru_cache
 from typing import Dict, Any, List
 import json
-from langsmith import Client
-from langsmith.evaluation import evaluate
-from langchain_openai import ChatOpenAI
+import threading
 
+from checkpoints import run_checkpointed, sqlite_checkpointer
+from chunkbuddy_graph import model_settings, prompt_fingerprint
 from chunkbuddy_standalone_graph import build_app
+from eval_cache import EvalCache, content_key
+from llm_cache import ResponseCache
 from load_env import load_env
+from llm_clients import get_chat_model
+from node_output import response_format
 load_env()
 
 # --- Build the LangGraph app ------------------------------------------------
 # We compile the ChunkBuddy graph once and reuse it for all dataset rows.
-app = build_app()
+# The shared response cache means re-running an experiment over the same
+# dataset does not pay for graph LLM calls that were already made.
+# Runs are checkpointed under a stable per-row id, so a row that failed
+# part-way resumes from the failed node on the next run (and a finished one
+# is not run again).
+# The graph is compiled on the first row that misses the eval cache (see
+# target_app()), so a fully cached re-run never loads LangGraph.
+cache = ResponseCache()
+checkpointer = None
+app = None
+target_llm = None  # None = the graph's default model
+_app_lock = threading.Lock()
+
+def target_app():
+    """The compiled target graph, built with its checkpointer on first use."""
+    global app, checkpointer
+    with _app_lock:
+        if app is None:
+            checkpointer = checkpointer or sqlite_checkpointer()
+            app = build_app(cache=cache, llm=target_llm, checkpointer=checkpointer)
+        return app
+
+# Evaluation-level cache: whole target outputs and judge verdicts, keyed by
+# content (see eval_cache.py). Unchanged rows skip the graph and the judge
+# entirely; set to None (or configure(evaluation_cache=False)) to disable.
+eval_cache = EvalCache()
 
 # LangSmith client (optional: useful if you want to inspect datasets,
-# experiments, or metadata directly).
-client = Client()
+# experiments, or metadata directly). Created on first use;
+# `evaluate_chunkbuddy.client` still works.
+@lru_cache(maxsize=1)
+def get_client():
+    from langsmith import Client
+    return Client()
+
+def __getattr__(name: str):
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ---------------------------------------------------------------------------
 # Target function: how LangSmith calls your app
@@ -47,13 +86,26 @@ def chunkbuddy_target(inputs: Dict[str, Any]) -> Dict[str, Any]:
         {"topic": "Kafka partitions", "level": "beginner"}
 
     We invoke the LangGraph app with this state and return a flat dict
-    of outputs that evaluators can inspect.
+    of outputs that evaluators can inspect. Rows whose prompts, model
+    settings and inputs are unchanged are served from `eval_cache`.
     """
+    if eval_cache is not None:
+        return eval_cache.cached("target", target_cache_key(inputs), lambda: _run_target(inputs))
+    return _run_target(inputs)
+
+def target_cache_key(inputs: Dict[str, Any]) -> str:
+    """Hash of the graph's prompt templates, model settings and the input row."""
+    return content_key("target", prompt_fingerprint(), model_settings(target_llm), inputs)
+
+def _run_target(inputs: Dict[str, Any]) -> Dict[str, Any]:
     topic = inputs["topic"]
     level = inputs.get("level", "beginner")
 
-    # Run the graph on this dataset row
-    state = app.invoke({"topic": topic, "level": level})
+    # Run the graph on this dataset row, or resume its earlier, failed run.
+    # With the eval cache disabled the caller asked for a fresh run, so it
+    # gets a new run id instead of the previous run's final state.
+    run_id = target_cache_key(inputs) if eval_cache is not None else None
+    _, state = run_checkpointed(target_app(), {"topic": topic, "level": level}, run_id=run_id)
 
     # Return only the fields we want evaluators to check
     return {
@@ -94,7 +146,21 @@ def question_count_ok(inputs: dict, outputs: dict) -> dict:
 # LLM-as-judge evaluator for clarity vs learner level
 # ---------------------------------------------------------------------------
 # Instead of a fixed rule, we ask a model to rate clarity on a 1–5 scale.
-eval_llm = ChatOpenAI(model="gpt-4o-mini")
+# The judge comes from the shared client registry, so it reuses the graph's
+# HTTP pool and rate limiter. It is created on the first verdict that is not
+# cached; configure(judge_llm=...) sets eval_llm to use a different model.
+eval_llm = None
+JUDGE_MODEL = "gpt-4o-mini"
+
+def get_judge_llm() -> Any:
+    return eval_llm if eval_llm is not None else get_chat_model(model=JUDGE_MODEL)
+
+def judge_settings(judge_llm=None) -> dict:
+    """The judge's model settings for cache keys, known without building its client."""
+    judge_llm = judge_llm if judge_llm is not None else eval_llm
+    if judge_llm is not None:
+        return model_settings(judge_llm)
+    return {"model": JUDGE_MODEL, "temperature": None}
 
 def clarity_for_level(inputs: dict, outputs: dict) -> dict:
     """
@@ -126,7 +192,16 @@ Respond ONLY as a JSON object with the following structure:
   "reason": "<short explanation of your rating>"
 }}
 """
-    response = eval_llm.invoke(prompt)
+    # The prompt embeds the explanation, so it alone identifies the verdict.
+    # The judge client is only built on a miss: a fully cached run needs no
+    # API key.
+    key = content_key("judge", prompt, judge_settings())
+    if eval_cache is not None:
+        cached = eval_cache.get("judge", key)
+        if cached is not None:
+            return cached
+
+    response = get_judge_llm().invoke(prompt)
     text = response.content
 
     try:
@@ -134,33 +209,229 @@ Respond ONLY as a JSON object with the following structure:
         score = float(data.get("score", 0.0))
         reason = data.get("reason", "")
     except Exception:
-        # Fallback if the model doesn't follow JSON perfectly
+        # Fallback if the model doesn't follow JSON perfectly (not cached,
+        # and marked so a resumed local_eval run judges the row again)
         score = 0.0
         reason = f"Could not parse JSON from response: {text}"
+        return {"score": score, "reason": reason, "name": "clarity_for_level", "unjudged": True}
+
+    result = {"score": score, "reason": reason, "name": "clarity_for_level"}
+    if eval_cache is not None:
+        eval_cache.set(key, result)
+    return result
+
+# ---------------------------------------------------------------------------
+# Batched LLM-as-judge (many rows per judge call)
+# ---------------------------------------------------------------------------
+# clarity_for_level costs one judge call per row. For large datasets we pack
+# several (topic, level, explanation) items into one prompt and ask for a
+# strict JSON reply keyed by row id: constrained to the clarity_judge_batch
+# schema in node_output.py when the judge supports it, parsed from text
+# otherwise. Batches run concurrently; rows whose verdict is missing or
+# malformed are re-batched and scored again.
+
+BATCH_JUDGE_PROMPT = """
+You are evaluating the clarity of several explanations, each written for a learner.
+
+For EACH item below, rate how clear, accurate, and appropriate the explanation
+is for the given learner level, on a scale from 1 to 5.
+
+{items}
+
+Respond ONLY with a JSON object of this exact shape, with one entry per item id:
+{{
+  "verdicts": [
+    {{"id": "<item id>", "score": <number from 1 to 5>, "reason": "<short reason>"}}
+  ]
+}}
+"""
+
+BATCH_JUDGE_ITEM = """### Item {id}
+Topic: {topic}
+Level: {level}
+Explanation:
+\"\"\"{explanation}\"\"\"
+"""
+
+
+def batch_judge_prompt(items: List[Dict[str, Any]]) -> str:
+    """items: dicts with id, topic, level and explanation."""
+    return BATCH_JUDGE_PROMPT.format(
+        items="\n".join(BATCH_JUDGE_ITEM.format(**item) for item in items)
+    )
+
+
+def parse_batch_verdicts(text: str, expected_ids: List[str]) -> Dict[str, dict]:
+    """
+    Return {row id: evaluator result} for every well-formed verdict in `text`.
+    Unknown ids, duplicates and scores outside 1–5 are dropped, so the
+    caller can re-score whatever is missing.
+    """
+    # Tolerate a ```json fence around the object, nothing else.
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(text)
+        entries = data["verdicts"]
+    except (ValueError, KeyError, TypeError):
+        return {}
 
-    return {"score": score, "reason": reason, "name": "clarity_for_level"}
+    wanted = set(expected_ids)
+    verdicts: Dict[str, dict] = {}
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            row_id = str(entry["id"])
+            score = float(entry["score"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if row_id in wanted and row_id not in verdicts and 1.0 <= score <= 5.0:
+            verdicts[row_id] = {"score": score, "reason": str(entry.get("reason", "")),
+                                "name": "clarity_for_level"}
+    return verdicts
+
+
+def clarity_for_level_batch(
+    rows: List[Dict[str, Any]],
+    batch_size: int = 10,
+    max_concurrency: int = 8,
+    max_retries: int = 2,
+    judge_llm=None,
+) -> Dict[str, dict]:
+    """
+    Batched version of clarity_for_level.
+
+    rows: dicts with "id", "inputs" and "outputs" (as passed to evaluators).
+    Returns {row id: {"score", "reason", "name"}} for every row; rows that
+    still have no valid verdict after `max_retries` re-scoring rounds get
+    score 0.0, like the single-row fallback, and "unjudged": True.
+    """
+    items = [
+        {
+            "id": str(row["id"]),
+            "topic": row["inputs"].get("topic", ""),
+            "level": row["inputs"].get("level", "beginner"),
+            "explanation": row["outputs"].get("raw_explanation", ""),
+        }
+        for row in rows
+    ]
+    verdicts: Dict[str, dict] = {}
+
+    # Verdicts are cached per item (not per batch), keyed on the judge
+    # templates, the judge settings and the item content minus its row id.
+    # The judge client is only built if some verdict is not cached.
+    settings = judge_settings(judge_llm)
+    keys = {
+        item["id"]: content_key("judge-batch", BATCH_JUDGE_PROMPT, BATCH_JUDGE_ITEM, settings,
+                                item["topic"], item["level"], item["explanation"])
+        for item in items
+    }
+    pending = []
+    for item in items:
+        cached = eval_cache.get("judge", keys[item["id"]]) if eval_cache is not None else None
+        if cached is not None:
+            verdicts[item["id"]] = cached
+        else:
+            pending.append(item)
+
+    if pending:
+        judge_llm = judge_llm or get_judge_llm()
+        fmt = response_format("clarity_judge_batch", judge_llm)
+        kwargs = {"response_format": fmt} if fmt else {}
+    for _attempt in range(max_retries + 1):
+        if not pending:
+            break
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        responses = judge_llm.batch(
+            [batch_judge_prompt(batch) for batch in batches],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+            **kwargs,
+        )
+        for batch, response in zip(batches, responses):
+            if isinstance(response, Exception):
+                continue
+            parsed = parse_batch_verdicts(response.content, [item["id"] for item in batch])
+            verdicts.update(parsed)
+            if eval_cache is not None:
+                for row_id, verdict in parsed.items():
+                    eval_cache.set(keys[row_id], verdict)
+        # Only rows without a valid verdict go into the next round.
+        pending = [item for item in pending if item["id"] not in verdicts]
+
+    for item in pending:
+        verdicts[item["id"]] = {"score": 0.0, "name": "clarity_for_level", "unjudged": True,
+                                "reason": "No valid verdict from the batched judge."}
+    return verdicts
+
+# ---------------------------------------------------------------------------
+# Swapping models (offline runs, benchmarks)
+# ---------------------------------------------------------------------------
+
+def configure(llm=None, judge_llm=None, evaluation_cache=None) -> None:
+    """
+    Point the target graph and/or the judge at different chat models,
+    e.g. fake_llm.FakeChatModel for a fully offline evaluation run.
+    `evaluation_cache` replaces the evaluation cache; pass False to disable it.
+    """
+    global app, target_llm, eval_llm, eval_cache
+    if llm is not None:
+        with _app_lock:
+            target_llm = llm
+            app = None  # rebuilt by target_app() on the next run
+    if judge_llm is not None:
+        eval_llm = judge_llm
+    if evaluation_cache is not None:
+        eval_cache = evaluation_cache or None
 
 # ---------------------------------------------------------------------------
 # Run the evaluation
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    import argparse
+
+    from langsmith.evaluation import evaluate
+
+    parser = argparse.ArgumentParser(description="LangSmith evaluation for ChunkBuddy.")
+    parser.add_argument("--batch-judge", action="store_true",
+                        help="Score clarity with the batched judge after the experiment runs.")
+    parser.add_argument("--judge-batch-size", type=int, default=10)
+    parser.add_argument("--no-eval-cache", action="store_true",
+                        help="Re-run every target and judge call, ignoring cached results.")
+    args = parser.parse_args()
+    if args.no_eval_cache:
+        configure(evaluation_cache=False)
+
     # Name of the dataset you created in LangSmith UI
     DATASET_NAME = "chunkbuddy-topics"
 
+    evaluators = [chunk_count_ok, question_count_ok]
+    if not args.batch_judge:
+        evaluators.append(clarity_for_level)  # LLM-as-judge evaluator
+
     # Run evaluation: apply target function to dataset rows,
     # then score outputs with evaluators.
     experiment_results = evaluate(
         chunkbuddy_target,
         data=DATASET_NAME,
-        evaluators=[
-            chunk_count_ok,
-            question_count_ok,
-            clarity_for_level,  # LLM-as-judge evaluator
-        ],
+        evaluators=evaluators,
         experiment_prefix="chunkbuddy-eval",
         metadata={"app": "chunkbuddy", "version": "v1"},
     )
 
+    if args.batch_judge:
+        # Judge every run in batches, then attach the verdicts as feedback.
+        rows = [
+            {"id": str(r["run"].id), "inputs": r["example"].inputs, "outputs": r["run"].outputs or {}}
+            for r in experiment_results
+        ]
+        verdicts = clarity_for_level_batch(rows, batch_size=args.judge_batch_size)
+        for run_id, verdict in verdicts.items():
+            get_client().create_feedback(run_id, key=verdict["name"], score=verdict["score"],
+                                         comment=verdict["reason"])
+
     print("✅ LangSmith experiment created:")
     print("  Name:", experiment_results.experiment_name)
+    if eval_cache is not None:
+        print("  Eval cache:", eval_cache.stats)
@@ -0,0 +1,224 @@
+# fake_llm.py
+# ---------------------------------------------------------------------------
+# Deterministic, offline stand-in for ChatOpenAI.
+# FakeChatModel recognises which ChunkBuddy prompt it was given and returns a
+# canned, realistically formatted reply after a simulated network delay.
+# Pass it to build_app(llm=...) to benchmark graph overhead, parsers and
+# concurrency scaling without an API key or network access.
+# ---------------------------------------------------------------------------
+
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal")
+
+
+# --- Canned responses -------------------------------------------------------
+def _topic_from(prompt: str) -> str:
+    m = re.search(r"^Topic:\s*(.+)$", prompt, re.MULTILINE)
+    return m.group(1).strip() if m else "the topic"
+
+
+def canned_response(prompt: str) -> str:
+    """Return a reply shaped like the real model's answer to a ChunkBuddy prompt."""
+    topic = _topic_from(prompt)
+
+    if "ONE JSON object" in prompt:
+        return json.dumps({
+            "raw_explanation": f"{topic} works like a restaurant kitchen: orders come in, "
+                               "stations split the work, and dishes go out in order.",
+            "chunks": [
+                f"Chunk {i}: Part {i} of {topic}\nThis part covers one idea. "
+                "It uses a simple example. It links back to the kitchen metaphor."
+                for i in range(1, 5)
+            ],
+            "check_questions": [f"What does part {i} of {topic} do?" for i in range(1, 6)],
+            "summary": f"{topic} splits work into simple, ordered steps.",
+            "learning_design_notes": [
+                "Chunks keep each idea small to reduce cognitive load.",
+                "Questions prompt retrieval practice.",
+            ],
+        })
+
+    if "You are evaluating the clarity of several explanations" in prompt:
+        ids = re.findall(r"^### Item (.+)$", prompt, re.MULTILINE)
+        return json.dumps({"verdicts": [
+            {"id": row_id.strip(), "score": 4, "reason": "Clear and level-appropriate."}
+            for row_id in ids
+        ]})
+
+    if "You are evaluating the clarity" in prompt:
+        return json.dumps({"score": 4, "reason": "Clear and level-appropriate, with a helpful metaphor."})
+
+    if "break it into" in prompt:
+        return "\n\n".join(
+            f"Chunk {i}: Idea {i}\nThis chunk explains one idea in plain words. "
+            "It gives a short example. It connects to the previous chunk."
+            for i in range(1, 5)
+        )
+
+    asked = re.search(r"create (\d+) SHORT questions", prompt)
+    if asked and "one learning chunk" in prompt:
+        # Pipelined topology: a few questions about a single chunk.
+        title = re.search(r"^Chunk \d+[:.\-]\s*(.+)$", prompt, re.MULTILINE)
+        idea = title.group(1).strip() if title else "this chunk"
+        return "\n".join(f"{i}. What is question {i} about {idea}?"
+                         for i in range(1, int(asked.group(1)) + 1))
+
+    if asked:
+        return "\n".join(
+            [
+                "Here are five questions to check your understanding:",
+                "",
+                "1. What is the main idea of chunk 1?",
+                "2. How does chunk 2 build on chunk 1?",
+                "3) Why is the example in chunk 3 useful?",
+                "- What would break without the idea in chunk 4?",
+                "* Can you explain the whole topic in one sentence?",
+            ]
+        )
+
+    if "TL;DR" in prompt:
+        return "\n".join(
+            [
+                f"Summary: {topic} breaks a complex process into simple, ordered steps.",
+                "- Short chunks keep each idea small, reducing cognitive load.",
+                "- Check questions encourage retrieval practice.",
+                "- The metaphor anchors new terms to familiar experience.",
+            ]
+        )
+
+    if "Explain the topic below" in prompt:
+        return (
+            f"{topic} is like a restaurant kitchen: orders (requests) arrive, "
+            "stations (components) share the work, and dishes (results) go out in order."
+        )
+
+    return "OK."
+
+
+def _tokens(text: str) -> List[str]:
+    """Split a reply into word-sized stream tokens (whitespace kept)."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+# --- Fake chat model --------------------------------------------------------
+class FakeChatModel(BaseChatModel):
+    """
+    Offline chat model with a configurable latency distribution.
+
+    latency_mean / latency_jitter are in seconds; `distribution` is one of
+    LATENCY_DISTRIBUTIONS. `seed` makes the latency sequence reproducible.
+    `responses`, if given, is cycled through instead of the canned replies.
+    `token_latency` adds that many seconds per output word, so a streamed
+    reply arrives over time instead of all at once.
+    """
+
+    model_name: str = "fake-chunkbuddy"
+    temperature: float = 0.0
+    latency_mean: float = 0.5
+    latency_jitter: float = 0.1
+    distribution: str = "lognormal"
+    seed: Optional[int] = 0
+    token_latency: float = 0.0
+    responses: Optional[List[str]] = None
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {LATENCY_DISTRIBUTIONS}")
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chunkbuddy"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    # --- Simulation helpers -------------------------------------------------
+    def sample_latency(self) -> float:
+        mean, jitter = self.latency_mean, self.latency_jitter
+        with self._lock:
+            if self.distribution == "constant" or mean <= 0:
+                value = mean
+            elif self.distribution == "uniform":
+                value = self._rng.uniform(mean - jitter, mean + jitter)
+            elif self.distribution == "normal":
+                value = self._rng.gauss(mean, jitter)
+            else:
+                # Lognormal with the requested mean and standard deviation:
+                # a long right tail, like real API latency.
+                sigma2 = math.log(1 + (jitter / mean) ** 2)
+                mu = math.log(mean) - sigma2 / 2
+                value = self._rng.lognormvariate(mu, sigma2 ** 0.5)
+        return max(0.0, value)
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt = messages[-1].content if messages else ""
+        with self._lock:
+            index = self._calls
+            self._calls += 1
+        if self.responses:
+            text = self.responses[index % len(self.responses)]
+        else:
+            text = canned_response(prompt)
+        input_tokens = max(1, len(prompt) // 4)
+        output_tokens = max(1, len(text) // 4)
+        return AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    # --- BaseChatModel interface --------------------------------------------
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._reply(messages)
+        time.sleep(self.sample_latency() + self.token_latency * len(_tokens(message.content)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._reply(messages)
+        await asyncio.sleep(self.sample_latency() + self.token_latency * len(_tokens(message.content)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    # Streaming: the sampled latency is spent before the first token (like a
+    # real API's time-to-first-token), then the reply arrives word by word,
+    # token_latency apart.
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.sample_latency())
+        for token in _tokens(self._reply(messages).content):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.sample_latency())
+        for token in _tokens(self._reply(messages).content):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
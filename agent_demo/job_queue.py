@@ -0,0 +1,552 @@
+# job_queue.py
+# ---------------------------------------------------------------------------
+# Durable local job queue for bulk ChunkBuddy generation.
+# Thousands of topics should not tie up an interactive process, and a crash
+# half-way through should not lose the batch. Jobs live in a SQLite file, so
+# they survive restarts; any number of worker threads and processes on the
+# machine pull from it.
+#
+# - Delivery is at-least-once, with visibility timeouts: claiming a job
+#   hides it for `visibility_timeout` seconds. A worker that dies mid-job
+#   simply never completes it, and the job becomes claimable again when the
+#   timeout expires. A failed job is retried after a back-off, until
+#   `max_attempts`; then it is marked failed with its last error.
+# - Results go to the `results` table (written in the same transaction as
+#   the job's completion) and to any extra sinks, e.g. a JSONL file or the
+#   topic library. Only the worker still holding the job's lease completes
+#   it: a worker whose lease expired and was re-claimed discards its result,
+#   so sinks see each job once.
+# - Claims use BEGIN IMMEDIATE, so threads and processes never claim the
+#   same job at once; the database runs in WAL mode so readers (status
+#   queries) do not block the workers.
+#
+# Usage:
+#   python job_queue.py enqueue topics.txt --levels beginner,intermediate --batch week-12
+#   python job_queue.py work --threads 8 --processes 2 --drain --out results.jsonl
+#   python job_queue.py status [JOB_ID]
+#   python job_queue.py results --batch week-12 --out week-12.jsonl
+#   python job_queue.py bench --jobs 200 --threads 1,4,16 --fake-llm 0.05
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from metrics import REGISTRY
+
+DEFAULT_QUEUE_PATH = Path(__file__).parent / ".cache" / "jobs.sqlite"
+STATUSES = ("queued", "running", "done", "failed")
+
+REGISTRY.describe("chunkbuddy_jobs_total", "Queue jobs finished, by outcome (done / retried / failed).")
+REGISTRY.describe("chunkbuddy_job_seconds", "Wall time of one queue job's graph run.")
+
+
+class Job(NamedTuple):
+    id: int
+    topic: str
+    level: str
+    attempts: int  # including the current one
+    batch: Optional[str]
+
+
+# --- Queue --------------------------------------------------------------------
+class JobQueue:
+    """
+    SQLite-backed queue of (topic, level) jobs. Safe to share between threads;
+    every process opens its own JobQueue on the same file.
+    """
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_QUEUE_PATH,
+        visibility_timeout: float = 300.0,
+        max_attempts: int = 3,
+        retry_backoff: float = 5.0,
+    ):
+        self.path = Path(path)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly (BEGIN IMMEDIATE)
+        # where a read and a write must be atomic.
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False,
+                                     isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                level TEXT NOT NULL,
+                batch TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                visible_at REAL NOT NULL,
+                worker TEXT,
+                error TEXT,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, visible_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch);
+            CREATE TABLE IF NOT EXISTS results (
+                job_id INTEGER PRIMARY KEY REFERENCES jobs(id),
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- Producing ----------------------------------------------------------
+    def enqueue(self, topic: str, level: str = "beginner", batch: Optional[str] = None) -> int:
+        return self.enqueue_many([(topic, level)], batch)[0]
+
+    def enqueue_many(self, items: Sequence[Tuple[str, str]], batch: Optional[str] = None) -> List[int]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [
+                    self._conn.execute(
+                        "INSERT INTO jobs (topic, level, batch, visible_at, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                        (topic, level, batch, now, now),
+                    ).lastrowid
+                    for topic, level in items
+                ]
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    # --- Consuming ----------------------------------------------------------
+    def claim(self, worker: str, limit: int = 1) -> List[Job]:
+        """
+        Lease up to `limit` visible jobs to `worker`: queued jobs whose retry
+        delay has passed, and running jobs whose lease has expired.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases that used up their last attempt are failures.
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, "
+                    "error = COALESCE(error, 'visibility timeout expired') "
+                    "WHERE status = 'running' AND visible_at <= ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                rows = self._conn.execute(
+                    "SELECT id, topic, level, attempts, batch FROM jobs "
+                    "WHERE status IN ('queued', 'running') AND visible_at <= ? "
+                    "ORDER BY visible_at, id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, visible_at = ?, "
+                    "worker = ?, started_at = ? WHERE id = ?",
+                    [(now + self.visibility_timeout, worker, now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [Job(id, topic, level, attempts + 1, batch) for id, topic, level, attempts, batch in rows]
+
+    def complete(self, job: Job, worker: str, state: dict, sinks: Sequence["ResultSink"] = ()) -> bool:
+        """
+        Store the result, hand it to `sinks` and mark the job done, if
+        `worker` still holds the job's lease. Returns False (nothing stored,
+        no sink called) when the job has passed to another worker or ended.
+        A sink that raises rolls the completion back; the lease is kept.
+        """
+        now = time.time()
+        with self._lock:
+            # The write lock is held while the sinks run, so no one can
+            # re-claim the job between the lease check and the commit.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                won = self._conn.execute(
+                    "UPDATE jobs SET status = 'done', error = NULL, finished_at = ? "
+                    "WHERE id = ? AND status = 'running' AND worker = ?",
+                    (now, job.id, worker),
+                ).rowcount
+                if won:
+                    for sink in sinks:
+                        sink(job, state)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO results (job_id, state, created_at) VALUES (?, ?, ?)",
+                        (job.id, json.dumps(state, ensure_ascii=False), now),
+                    )
+                self._conn.execute("COMMIT" if won else "ROLLBACK")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bool(won)
+
+    def fail(self, job: Job, worker: str, error: str) -> str:
+        """
+        Record a failed attempt: back to the queue after a back-off, or
+        'failed' once attempts are used up. Ignored if the lease has passed to
+        another worker or the job was already swept to 'failed'. Returns the
+        job's status as stored afterwards.
+        """
+        now = time.time()
+        final = job.attempts >= self.max_attempts
+        status = "failed" if final else "queued"
+        delay = self.retry_backoff * 2 ** (job.attempts - 1)
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, visible_at = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'running' AND worker = ?",
+                (status, error, now + delay, now if final else None, job.id, worker),
+            ).rowcount
+            if not updated:
+                status = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job.id,)).fetchone()[0]
+        return status
+
+    # --- Querying -----------------------------------------------------------
+    def get(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [c[0] for c in cursor.description]
+        return dict(zip(columns, row)) if row is not None else None
+
+    def counts(self, batch: Optional[str] = None) -> Dict[str, int]:
+        query = "SELECT status, COUNT(*) FROM jobs"
+        params: tuple = ()
+        if batch is not None:
+            query, params = query + " WHERE batch = ?", (batch,)
+        with self._lock:
+            rows = dict(self._conn.execute(query + " GROUP BY status", params).fetchall())
+        return {status: rows.get(status, 0) for status in STATUSES}
+
+    def pending(self) -> int:
+        """Jobs not yet finished (queued or running)."""
+        counts = self.counts()
+        return counts["queued"] + counts["running"]
+
+    def result(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM results WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def results(self, batch: Optional[str] = None) -> Iterator[Tuple[Job, dict]]:
+        query = ("SELECT j.id, j.topic, j.level, j.attempts, j.batch, r.state "
+                 "FROM results r JOIN jobs j ON j.id = r.job_id")
+        params: tuple = ()
+        if batch is not None:
+            query, params = query + " WHERE j.batch = ?", (batch,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY j.id", params).fetchall()
+        for *job, state in rows:
+            yield Job(*job), json.loads(state)
+
+    def failures(self, batch: Optional[str] = None) -> List[dict]:
+        query = "SELECT id, topic, level, attempts, error FROM jobs WHERE status = 'failed'"
+        params: tuple = ()
+        if batch is not None:
+            query, params = query + " AND batch = ?", (batch,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        return [dict(zip(("id", "topic", "level", "attempts", "error"), row)) for row in rows]
+
+    def requeue_failed(self, batch: Optional[str] = None) -> int:
+        """Give failed jobs a fresh set of attempts."""
+        query = ("UPDATE jobs SET status = 'queued', attempts = 0, visible_at = ?, finished_at = NULL, "
+                 "error = NULL, worker = NULL WHERE status = 'failed'")
+        params: tuple = (time.time(),)
+        if batch is not None:
+            query, params = query + " AND batch = ?", params + (batch,)
+        with self._lock:
+            return self._conn.execute(query, params).rowcount
+
+
+# --- Result sinks -------------------------------------------------------------
+# Called with (job, state) by the lease holder only, inside the transaction
+# that marks the job done; a sink that raises fails the attempt, so the job
+# is retried.
+ResultSink = Callable[[Job, dict], None]
+
+
+class JsonlSink:
+    """Append one {"job_id", "topic", "level", "state"} line per result."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, job: Job, state: dict) -> None:
+        line = json.dumps({"job_id": job.id, "topic": job.topic, "level": job.level, "state": state},
+                          ensure_ascii=False)
+        # One write per line in append mode, so processes sharing the file
+        # do not interleave lines.
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def library_sink(library=None) -> ResultSink:
+    """Store each result in the topic library, so the UI serves it instantly."""
+    if library is None:
+        from topic_library import TopicLibrary
+        library = TopicLibrary()
+    return lambda job, state: library.put(state)
+
+
+# --- Workers ------------------------------------------------------------------
+def work(
+    queue: JobQueue,
+    run: Callable[[dict], dict],
+    worker: str,
+    sinks: Sequence[ResultSink] = (),
+    drain: bool = True,
+    poll_interval: float = 0.5,
+    stop: Optional[threading.Event] = None,
+) -> int:
+    """
+    One worker loop: claim a job, run it, store the result. With `drain`,
+    return once no job is queued or running; otherwise poll until `stop` is
+    set. Returns the number of jobs completed.
+    """
+    completed = 0
+    while stop is None or not stop.is_set():
+        jobs = queue.claim(worker)
+        if not jobs:
+            if drain and queue.pending() == 0:
+                break
+            # Nothing visible yet: jobs are in back-off or leased elsewhere.
+            time.sleep(poll_interval)
+            continue
+
+        job = jobs[0]
+        start = time.perf_counter()
+        try:
+            state = run({"topic": job.topic, "level": job.level})
+            won = queue.complete(job, worker, state, sinks)
+        except Exception as exc:
+            # Another worker owns the job ("running"/"done"): not our outcome.
+            status = queue.fail(job, worker, f"{type(exc).__name__}: {exc}")
+            if status in ("queued", "failed"):
+                REGISTRY.inc("chunkbuddy_jobs_total", outcome="retried" if status == "queued" else "failed")
+            if status == "failed":
+                print(f"⚠️  Job {job.id} ({job.topic!r}) failed after {job.attempts} attempts: {exc!r}")
+        else:
+            if won:  # otherwise the lease expired and another worker has the job
+                completed += 1
+                REGISTRY.inc("chunkbuddy_jobs_total", outcome="done")
+        finally:
+            REGISTRY.observe("chunkbuddy_job_seconds", time.perf_counter() - start)
+    return completed
+
+
+def _graph_runner(fake_latency: Optional[float] = None, topology: str = "sequential") -> Callable[[dict], dict]:
+    """app.invoke for this process: the shared graph, or one on the fake LLM."""
+    if fake_latency is None:
+        from chunkbuddy_graph import get_app
+        return get_app(topology).invoke
+    from chunkbuddy_graph import build_app
+    from fake_llm import FakeChatModel
+    llm = FakeChatModel(latency_mean=fake_latency, latency_jitter=fake_latency / 4, seed=None)
+    return build_app(llm=llm, topology=topology).invoke
+
+
+def run_threads(
+    queue: JobQueue,
+    threads: int,
+    run: Callable[[dict], dict],
+    sinks: Sequence[ResultSink] = (),
+    drain: bool = True,
+    name: str = "worker",
+    stop: Optional[threading.Event] = None,
+    poll_interval: float = 0.5,
+) -> int:
+    """Run `threads` worker loops in this process; returns jobs completed."""
+    counts: List[int] = []
+    pool = [
+        threading.Thread(
+            target=lambda i=i: counts.append(work(queue, run, f"{name}-{os.getpid()}-{i}", sinks, drain,
+                                                   poll_interval, stop)),
+            name=f"chunkbuddy-{name}-{i}",
+        )
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(counts)
+
+
+def _process_main(options: dict) -> int:
+    # Entry point of each worker process: its own connection, graph and sinks.
+    if options.get("quiet"):
+        from metrics import set_verbosity
+        set_verbosity(0)
+    queue = JobQueue(Path(options["path"]), options["visibility_timeout"], options["max_attempts"],
+                     options["retry_backoff"])
+    sinks: List[ResultSink] = []
+    if options.get("out"):
+        sinks.append(JsonlSink(options["out"]))
+    if options.get("library"):
+        sinks.append(library_sink())
+    try:
+        run = _graph_runner(options.get("fake_latency"), options.get("topology", "sequential"))
+        return run_threads(queue, options["threads"], run, sinks, options.get("drain", True),
+                           name=f"proc{options['index']}")
+    except Exception:
+        traceback.print_exc()
+        raise
+    finally:
+        queue.close()
+
+
+def run_pool(
+    path: Path = DEFAULT_QUEUE_PATH,
+    threads: int = 4,
+    processes: int = 1,
+    visibility_timeout: float = 300.0,
+    max_attempts: int = 3,
+    out: Optional[str] = None,
+    library: bool = False,
+    drain: bool = True,
+    fake_latency: Optional[float] = None,
+    topology: str = "sequential",
+    retry_backoff: float = 5.0,
+) -> int:
+    """
+    Run `processes` worker processes with `threads` worker threads each.
+    With processes=1 the threads run in this process. Returns jobs completed.
+    """
+    options = {
+        "path": str(path), "threads": threads, "visibility_timeout": visibility_timeout,
+        "max_attempts": max_attempts, "retry_backoff": retry_backoff, "out": out, "library": library,
+        "drain": drain, "fake_latency": fake_latency, "topology": topology,
+    }
+    if processes <= 1:
+        return _process_main({**options, "index": 0})
+    # spawn: the graph, SQLite connections and HTTP clients are not fork-safe.
+    # Only these worker processes silence per-call tracing, never the caller.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes) as pool:
+        return sum(pool.map(_process_main, [{**options, "index": i, "quiet": True} for i in range(processes)]))
+
+
+# --- Throughput benchmark -----------------------------------------------------
+def bench(jobs: int, thread_counts: List[int], processes: int, fake_latency: float) -> Dict[int, float]:
+    """Jobs/sec against the fake LLM for each thread count, on a fresh queue."""
+    from benchmark_chunkbuddy import TOPICS, quiet
+
+    results = {}
+    for threads in thread_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "bench.sqlite"
+            queue = JobQueue(path)
+            queue.enqueue_many([(f"{TOPICS[i % len(TOPICS)]} #{i}", "beginner") for i in range(jobs)])
+            with quiet():
+                start = time.perf_counter()
+                done = run_pool(path, threads, processes, fake_latency=fake_latency)
+                elapsed = time.perf_counter() - start
+            queue.close()
+        results[threads] = done / elapsed
+    return results
+
+
+# --- CLI ------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Durable ChunkBuddy job queue.")
+    parser.add_argument("--db", default=str(DEFAULT_QUEUE_PATH), help="Queue SQLite file.")
+    parser.add_argument("--visibility-timeout", type=float, default=300.0,
+                        help="Seconds a claimed job stays hidden before it is redelivered.")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--retry-backoff", type=float, default=5.0,
+                        help="Seconds before a failed job's first retry; doubles per attempt.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_enq = sub.add_parser("enqueue", help="Queue a topic list.")
+    p_enq.add_argument("topics_file", help="Text file with one topic per line.")
+    p_enq.add_argument("--levels", default="beginner", help="Comma-separated levels.")
+    p_enq.add_argument("--batch", help="Label to query this batch's status and results by.")
+
+    p_work = sub.add_parser("work", help="Run workers.")
+    p_work.add_argument("--threads", type=int, default=4, help="Worker threads per process.")
+    p_work.add_argument("--processes", type=int, default=1)
+    p_work.add_argument("--drain", action="store_true", help="Exit when the queue is empty.")
+    p_work.add_argument("--out", help="Also append results to this JSONL file.")
+    p_work.add_argument("--library", action="store_true", help="Also store results in the topic library.")
+    p_work.add_argument("--topology", default="sequential")
+    p_work.add_argument("--fake-llm", type=float, metavar="LATENCY", help="Use the offline fake LLM.")
+
+    p_status = sub.add_parser("status", help="Queue counts, or one job's record.")
+    p_status.add_argument("job_id", nargs="?", type=int)
+    p_status.add_argument("--batch")
+
+    p_res = sub.add_parser("results", help="Export stored results as JSONL.")
+    p_res.add_argument("--batch")
+    p_res.add_argument("--out", help="Output file (default: stdout).")
+
+    p_req = sub.add_parser("requeue-failed", help="Retry failed jobs.")
+    p_req.add_argument("--batch")
+
+    p_bench = sub.add_parser("bench", help="Throughput vs. worker count on the fake LLM.")
+    p_bench.add_argument("--jobs", type=int, default=200)
+    p_bench.add_argument("--threads", default="1,4,16", help="Comma-separated thread counts.")
+    p_bench.add_argument("--processes", type=int, default=1)
+    p_bench.add_argument("--fake-llm", type=float, default=0.05, metavar="LATENCY")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        counts = [int(x) for x in args.threads.split(",") if x.strip()]
+        print(f"Job queue throughput — {args.jobs} jobs, fake LLM {args.fake_llm * 1000:.0f} ms, "
+              f"{args.processes} process(es)")
+        for threads, rate in bench(args.jobs, counts, args.processes, args.fake_llm).items():
+            print(f"  threads={threads:<6}{rate:>10.1f} jobs/sec")
+    elif args.command == "work":
+        done = run_pool(Path(args.db), args.threads, args.processes, args.visibility_timeout,
+                        args.max_attempts, args.out, args.library, args.drain, args.fake_llm, args.topology,
+                        args.retry_backoff)
+        print(f"✅ Completed {done} jobs.")
+    else:
+        queue = JobQueue(Path(args.db), args.visibility_timeout, args.max_attempts, args.retry_backoff)
+        if args.command == "enqueue":
+            with open(args.topics_file, encoding="utf-8") as f:
+                topics = [line.strip() for line in f if line.strip()]
+            levels = [lvl.strip() for lvl in args.levels.split(",") if lvl.strip()]
+            ids = queue.enqueue_many([(t, lvl) for t in topics for lvl in levels], args.batch)
+            print(f"✅ Queued {len(ids)} jobs (ids {ids[0]}–{ids[-1]})." if ids else "Nothing to queue.")
+        elif args.command == "status":
+            if args.job_id is not None:
+                print(json.dumps(queue.get(args.job_id), indent=2, ensure_ascii=False))
+            else:
+                print(json.dumps(queue.counts(args.batch), indent=2))
+                for failure in queue.failures(args.batch)[:20]:
+                    print(f"  failed #{failure['id']} {failure['topic']!r} ({failure['level']}): {failure['error']}")
+        elif args.command == "results":
+            f = open(args.out, "w", encoding="utf-8") if args.out else None
+            try:
+                for job, state in queue.results(args.batch):
+                    line = json.dumps({"job_id": job.id, "topic": job.topic, "level": job.level, "state": state},
+                                      ensure_ascii=False)
+                    print(line, file=f)
+            finally:
+                if f is not None:
+                    f.close()
+        elif args.command == "requeue-failed":
+            print(f"Requeued {queue.requeue_failed(args.batch)} failed jobs.")
@@ -0,0 +1,170 @@
+# llm_cache.py
+# ---------------------------------------------------------------------------
+# Persistent response cache for ChunkBuddy's LLM calls.
+# Responses are keyed on (model, temperature, exact prompt) so repeated
+# topics in the UI, CLI and evaluation runs are served without a network
+# round trip. Two tiers:
+#   1. an in-memory LRU (fast, per-process)
+#   2. a SQLite file on disk (shared across processes, TTL + size eviction)
+# ---------------------------------------------------------------------------
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+# Default on-disk location, shared by the CLI harness, Streamlit UI and
+# evaluation script so they all hit the same store.
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "llm_responses.sqlite"
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) cache for raw LLM response text."""
+
+    def __init__(
+        self,
+        path: Optional[Path] = DEFAULT_CACHE_PATH,
+        max_memory_entries: int = 256,
+        max_disk_entries: int = 10_000,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        # path=None gives a memory-only cache (handy for tests and notebooks).
+        self.path = Path(path) if path is not None else None
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # One connection shared across threads (Streamlit runs sessions
+            # on worker threads); access is serialised by self._lock.
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)"
+            )
+            self._conn.commit()
+
+    # --- Keys ---------------------------------------------------------------
+    @staticmethod
+    def make_key(model: str, temperature: Optional[float], prompt: str) -> str:
+        payload = json.dumps([model, temperature, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # --- Lookup / store -----------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._expired(created_at, now):
+                        self._conn.execute(
+                            "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._conn.commit()
+                        self._remember(key, value, created_at)
+                        self.stats["disk_hits"] += 1
+                        return value
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.stats["writes"] += 1
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._evict_disk(now)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- Stats --------------------------------------------------------------
+    @property
+    def hits(self) -> int:
+        return self.stats["memory_hits"] + self.stats["disk_hits"]
+
+    @property
+    def misses(self) -> int:
+        return self.stats["misses"]
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    # --- Internals ----------------------------------------------------------
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> None:
+        # Drop expired rows first, then the least recently used rows until
+        # the table fits within max_disk_entries.
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
@@ -0,0 +1,180 @@
+# llm_clients.py
+# ---------------------------------------------------------------------------
+# Shared, pooled LLM clients.
+# Building a ChatOpenAI per graph compile (or per get_app() call) means a
+# fresh HTTP connection pool each time, so every run starts with a TCP + TLS
+# handshake. Instead, get_chat_model() hands out one client per
+# (model, temperature, options), all backed by a single pooled httpx client
+# (one sync; async requests use one pool per event loop, since connections
+# cannot outlive their loop) and routed through the shared rate limiter.
+#   - prewarm() opens pooled connections to the API ahead of the first call
+#   - pool_stats() reports connections, idle/active counts and requests
+# ---------------------------------------------------------------------------
+
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from metrics import REGISTRY
+from rate_limiter import RateLimitedLLM, rate_limited
+
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=120.0)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+REGISTRY.describe("chunkbuddy_http_requests_total", "HTTP requests sent through the shared LLM pool.")
+REGISTRY.describe("chunkbuddy_http_connections", "Connections in the shared LLM HTTP pool, by state.")
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional["_PerLoopAsyncClient"] = None
+_models: Dict[Tuple, RateLimitedLLM] = {}
+_prewarmed: set = set()
+
+
+def _count_request(request) -> None:
+    REGISTRY.inc("chunkbuddy_http_requests_total")
+
+
+async def _acount_request(request) -> None:
+    REGISTRY.inc("chunkbuddy_http_requests_total")
+
+
+# --- Pooled HTTP clients ----------------------------------------------------
+def http_client() -> httpx.Client:
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT,
+                                        event_hooks={"request": [_count_request]})
+        return _http_client
+
+
+class _PerLoopAsyncClient(httpx.AsyncClient):
+    """
+    The AsyncClient handed to every registry model. Pooled connections
+    belong to the event loop that opened them, and run_many, local_eval,
+    precompute and checkpoints each start their own asyncio.run(), so
+    requests are sent through a pool owned by the running loop.
+    """
+
+    def __init__(self):
+        super().__init__(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary())
+        self._loop_lock = threading.Lock()
+
+    def for_loop(self) -> httpx.AsyncClient:
+        """The pool of the running event loop, created on its first request."""
+        loop = asyncio.get_running_loop()
+        with self._loop_lock:
+            client = self._loop_clients.get(loop)
+            if client is None:
+                # Pools of finished asyncio.run() loops can only be dropped
+                # (their sockets died with the loop); they may also keep
+                # their loop alive, so do not wait for the weak references.
+                for closed in [other for other in self._loop_clients if other.is_closed()]:
+                    del self._loop_clients[closed]
+                client = self._loop_clients[loop] = httpx.AsyncClient(
+                    limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, event_hooks={"request": [_acount_request]})
+            return client
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await self.for_loop().send(request, **kwargs)
+
+
+def http_async_client() -> httpx.AsyncClient:
+    global _http_async_client
+    with _lock:
+        if _http_async_client is None:
+            _http_async_client = _PerLoopAsyncClient()
+        return _http_async_client
+
+
+# --- Chat model registry ----------------------------------------------------
+def get_chat_model(model: str = "gpt-4o-mini", temperature: Optional[float] = None, **kwargs) -> RateLimitedLLM:
+    """
+    The shared, rate-limited ChatOpenAI for these settings. Extra keyword
+    arguments (max_tokens, timeout, ...) are part of the registry key.
+    """
+    # The SDK's own retries would hide 429s from the limiter and skip its
+    # token buckets; RateLimitedLLM retries instead.
+    kwargs.setdefault("max_retries", 0)
+    key = (model, temperature, tuple(sorted(kwargs.items())))
+    with _lock:
+        client = _models.get(key)
+    if client is not None:
+        return client
+
+    from langchain_openai import ChatOpenAI
+
+    chat = ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        http_client=http_client(),
+        http_async_client=http_async_client(),
+        **kwargs,
+    )
+    with _lock:
+        # Another thread may have built the same client meanwhile; keep one.
+        return _models.setdefault(key, rate_limited(chat))
+
+
+# --- Pre-warming ------------------------------------------------------------
+def prewarm(connections: int = 2, base_url: Optional[str] = None, background: bool = True) -> None:
+    """
+    Open `connections` pooled connections to the API (TCP + TLS) before the
+    first LLM call. Uses GET /models, which costs no tokens; failures (e.g.
+    offline) are ignored. With background=True this returns immediately.
+    Runs once per base URL per process; CHUNKBUDDY_PREWARM=0 disables it.
+    """
+    if os.environ.get("CHUNKBUDDY_PREWARM", "1") == "0":
+        return
+    base_url = (base_url or os.environ.get("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+    with _lock:
+        if base_url in _prewarmed:
+            return
+        _prewarmed.add(base_url)
+    headers = {"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}"}
+    client = http_client()
+
+    def warm(_):
+        try:
+            client.get(f"{base_url}/models", headers=headers)
+        except httpx.HTTPError:
+            pass
+
+    def run():
+        # Concurrent requests so each one gets (and then leaves idle) its own connection.
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            list(pool.map(warm, range(connections)))
+
+    if background:
+        threading.Thread(target=run, name="llm-prewarm", daemon=True).start()
+    else:
+        run()
+
+
+# --- Stats ------------------------------------------------------------------
+def pool_stats() -> dict:
+    """Connection counts for the shared sync pool, plus request totals."""
+    connections = []
+    if _http_client is not None:
+        # httpx does not expose pool state publicly; read the httpcore pool.
+        pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for c in connections if c.is_idle())
+    stats = {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "requests": int(REGISTRY.counter_value("chunkbuddy_http_requests_total")),
+        "models": len(_models),
+    }
+    REGISTRY.set_gauge("chunkbuddy_http_connections", idle, state="idle")
+    REGISTRY.set_gauge("chunkbuddy_http_connections", stats["active"], state="active")
+    return stats
@@ -0,0 +1,308 @@
+"""
+local_eval.py
+
+Run ChunkBuddy evaluations locally, without needing a LangSmith dataset.
+
+- Reads the dataset from a JSONL file. Each line is either a flat row
+  ({"topic": ..., "level": ...}) or {"id": ..., "inputs": {...}}.
+- Runs `chunkbuddy_target` and the evaluators from evaluate_chunkbuddy.py
+  on a worker pool.
+- Checkpoints every finished row to <out>/results.jsonl, so an interrupted
+  run picks up where it stopped when started again with the same --out.
+  Rows that failed, or that the judge could not score, are run again.
+- Writes <out>/summary.json and prints a short report.
+- --batch-judge scores clarity with the batched judge (many rows per call)
+  after the target runs, instead of one judge call per row.
+- Optionally exports the results to LangSmith (--export-langsmith).
+
+Usage:
+    python local_eval.py datasets/chunkbuddy-topics.jsonl --out eval_runs/run1 --workers 8
+    python local_eval.py datasets/chunkbuddy-topics.jsonl --out eval_runs/offline --offline
+    python local_eval.py datasets/chunkbuddy-topics.jsonl --out eval_runs/run2 --batch-judge
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import evaluate_chunkbuddy
+from evaluate_chunkbuddy import (
+    chunk_count_ok,
+    clarity_for_level,
+    clarity_for_level_batch,
+    question_count_ok,
+)
+
+EVALUATORS = [chunk_count_ok, question_count_ok, clarity_for_level]
+
+
+# ---------------------------------------------------------------------------
+# Dataset & checkpoint I/O
+# ---------------------------------------------------------------------------
+
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    """Return rows as {"id": str, "inputs": dict}. Rows without an id get their line number."""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            inputs = data["inputs"] if "inputs" in data else data
+            rows.append({"id": str(data.get("id", line_no)), "inputs": inputs})
+    return rows
+
+
+def load_checkpoint(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Latest record per row id. A torn last line (crash mid-write) is ignored."""
+    done: Dict[str, Dict[str, Any]] = {}
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[record["id"]] = record
+    return done
+
+
+class CheckpointWriter:
+    """Appends one JSON line per finished row and fsyncs it."""
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# ---------------------------------------------------------------------------
+# Running one row
+# ---------------------------------------------------------------------------
+
+def evaluate_row(
+    row: Dict[str, Any],
+    target: Callable[[dict], dict],
+    evaluators: Sequence[Callable[[dict, dict], dict]],
+) -> Dict[str, Any]:
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"id": row["id"], "inputs": row["inputs"], "outputs": None,
+                              "results": [], "error": None}
+    try:
+        outputs = target(row["inputs"])
+        record["outputs"] = outputs
+        for evaluator in evaluators:
+            try:
+                record["results"].append(evaluator(row["inputs"], outputs))
+            except Exception as exc:
+                # One broken evaluator should not throw away the target output.
+                record["results"].append({"name": evaluator.__name__, "score": None,
+                                          "error": repr(exc)})
+    except Exception as exc:
+        record["error"] = repr(exc)
+    record["elapsed_s"] = time.perf_counter() - start
+    return record
+
+
+# ---------------------------------------------------------------------------
+# Summary
+# ---------------------------------------------------------------------------
+
+def _judged(result: Dict[str, Any]) -> bool:
+    # False for judge fallbacks (no parsable verdict): re-judged on resume.
+    return result.get("score") is not None and not result.get("unjudged")
+
+
+def summarize(records: Sequence[Dict[str, Any]], total_rows: int, wall_s: float) -> Dict[str, Any]:
+    per_evaluator: Dict[str, List[float]] = {}
+    for record in records:
+        for result in record.get("results", []):
+            if _judged(result):
+                per_evaluator.setdefault(result["name"], []).append(float(result["score"]))
+
+    failed = [r["id"] for r in records if r.get("error")]
+    return {
+        "rows": total_rows,
+        "completed": len(records) - len(failed),
+        "failed": len(failed),
+        "failed_ids": failed,
+        "wall_seconds": round(wall_s, 3),
+        "evaluators": {
+            name: {"n": len(scores), "mean": sum(scores) / len(scores)}
+            for name, scores in per_evaluator.items()
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Optional LangSmith export
+# ---------------------------------------------------------------------------
+
+class LangSmithExporter:
+    """Logs each evaluated row as a run (with feedback scores) in a LangSmith project."""
+
+    def __init__(self, experiment_prefix: str = "chunkbuddy-local-eval"):
+        self.project_name = f"{experiment_prefix}-{time.strftime('%Y%m%d-%H%M%S')}"
+
+    def export(self, records: Sequence[Dict[str, Any]]) -> None:
+        import uuid
+        from langsmith import Client
+
+        client = Client()
+        client.create_project(self.project_name, metadata={"app": "chunkbuddy", "source": "local_eval"})
+        for record in records:
+            if record.get("error"):
+                continue
+            run_id = uuid.uuid4()
+            client.create_run(
+                name="chunkbuddy_target",
+                run_type="chain",
+                inputs=record["inputs"],
+                outputs=record["outputs"],
+                project_name=self.project_name,
+                id=run_id,
+            )
+            for result in record["results"]:
+                if result.get("score") is not None:
+                    client.create_feedback(run_id, key=result["name"], score=result["score"],
+                                           comment=result.get("reason"))
+        print(f"✅ Exported to LangSmith project: {self.project_name}")
+
+
+# ---------------------------------------------------------------------------
+# Main entry point
+# ---------------------------------------------------------------------------
+
+def run_local_eval(
+    dataset_path: str,
+    out_dir: str,
+    workers: int = 4,
+    target: Callable[[dict], dict] = None,
+    evaluators: Sequence[Callable[[dict, dict], dict]] = EVALUATORS,
+    exporters: Sequence[Any] = (),
+    batch_judge: bool = False,
+    judge_batch_size: int = 10,
+) -> Dict[str, Any]:
+    """
+    Evaluate every dataset row not already completed in `out_dir`.
+    With batch_judge=True, clarity_for_level is replaced by one batched
+    judge pass over all rows that do not have a clarity score yet.
+    Returns the summary dict (also written to <out_dir>/summary.json).
+    """
+    # Resolve at call time so evaluate_chunkbuddy.configure() takes effect.
+    target = target or evaluate_chunkbuddy.chunkbuddy_target
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = out / "results.jsonl"
+
+    rows = load_dataset(dataset_path)
+    done = load_checkpoint(checkpoint_path)
+    # Failed rows are retried on resume, and so are rows the per-row judge
+    # could not score (the batched judge re-scores those itself); completed
+    # ones are skipped.
+    def needs_run(record: Dict[str, Any]) -> bool:
+        return bool(record.get("error")) or (
+            not batch_judge and any(res.get("unjudged") for res in record["results"]))
+
+    todo = [r for r in rows if r["id"] not in done or needs_run(done[r["id"]])]
+    print(f"Dataset: {len(rows)} rows, {len(rows) - len(todo)} already done, {len(todo)} to run.")
+    if batch_judge:
+        evaluators = [e for e in evaluators if e is not clarity_for_level]
+
+    start = time.perf_counter()
+    writer = CheckpointWriter(checkpoint_path)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(evaluate_row, row, target, evaluators) for row in todo]
+            for i, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                writer.write(record)
+                done[record["id"]] = record
+                status = "❌" if record["error"] else "✅"
+                print(f"  [{i}/{len(todo)}] {status} {record['inputs'].get('topic', record['id'])}")
+        if batch_judge:
+            _judge_in_batches(rows, done, writer, judge_batch_size, workers)
+    finally:
+        writer.close()
+
+    row_ids = {r["id"] for r in rows}
+    records = [rec for rid, rec in done.items() if rid in row_ids]
+    summary = summarize(records, len(rows), time.perf_counter() - start)
+    if evaluate_chunkbuddy.eval_cache is not None:
+        summary["eval_cache"] = evaluate_chunkbuddy.eval_cache.stats
+    with open(out / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    for exporter in exporters:
+        exporter.export(records)
+    return summary
+
+
+def _judge_in_batches(rows, done, writer: CheckpointWriter, batch_size: int, workers: int) -> None:
+    """Add a batched clarity verdict to every finished row that lacks a real one."""
+    unjudged = [
+        done[r["id"]] for r in rows
+        if r["id"] in done and not done[r["id"]].get("error")
+        and not any(res.get("name") == "clarity_for_level" and _judged(res)
+                    for res in done[r["id"]]["results"])
+    ]
+    if not unjudged:
+        return
+    print(f"Judging {len(unjudged)} rows in batches of {batch_size}...")
+    verdicts = clarity_for_level_batch(unjudged, batch_size=batch_size, max_concurrency=workers)
+    for record in unjudged:
+        record["results"] = [res for res in record["results"] if res.get("name") != "clarity_for_level"]
+        record["results"].append(verdicts[record["id"]])
+        writer.write(record)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local, resumable ChunkBuddy evaluation.")
+    parser.add_argument("dataset", help="JSONL file with one dataset row per line.")
+    parser.add_argument("--out", default="eval_runs/latest", help="Checkpoint/report directory.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--offline", action="store_true",
+                        help="Use fake_llm.FakeChatModel for the graph and the judge.")
+    parser.add_argument("--batch-judge", action="store_true",
+                        help="Score clarity with the batched judge instead of per row.")
+    parser.add_argument("--judge-batch-size", type=int, default=10)
+    parser.add_argument("--no-eval-cache", action="store_true",
+                        help="Re-run every target and judge call, ignoring cached results.")
+    parser.add_argument("--export-langsmith", action="store_true",
+                        help="Also log results to a new LangSmith project.")
+    args = parser.parse_args()
+
+    if args.offline:
+        from fake_llm import FakeChatModel
+        evaluate_chunkbuddy.configure(llm=FakeChatModel(), judge_llm=FakeChatModel())
+
+    if args.no_eval_cache:
+        evaluate_chunkbuddy.configure(evaluation_cache=False)
+
+    exporters = [LangSmithExporter()] if args.export_langsmith else []
+    summary = run_local_eval(args.dataset, args.out, workers=args.workers, exporters=exporters,
+                             batch_judge=args.batch_judge, judge_batch_size=args.judge_batch_size)
+
+    print("\n=== SUMMARY ===")
+    print(f"rows: {summary['rows']}  completed: {summary['completed']}  failed: {summary['failed']}"
+          f"  wall: {summary['wall_seconds']}s")
+    for name, stats in summary["evaluators"].items():
+        print(f"  {name:<22} mean={stats['mean']:.2f}  (n={stats['n']})")
+    for kind, counts in summary.get("eval_cache", {}).items():
+        print(f"  eval cache [{kind}]: {counts['hits']} hits, {counts['misses']} misses")
+    print(f"\nReport written to {Path(args.out) / 'summary.json'}")
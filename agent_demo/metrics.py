@@ -0,0 +1,312 @@
+# metrics.py
+# ---------------------------------------------------------------------------
+# In-process instrumentation for ChunkBuddy.
+# - MetricsRegistry: counters, gauges and histograms with labels, exportable in
+#   Prometheus text format or as a JSON snapshot.
+# - node_span(): a context manager each graph node runs inside. It records
+#   wall time, LLM time vs. local parsing time, prompt/response sizes and
+#   cache status, then feeds the registry and any span sinks (e.g. JSONL).
+# - Verbosity (CHUNKBUDDY_VERBOSITY or set_verbosity()):
+#     0 = silent, 1 = one timing line per node, 2 = also dump node input state
+# ---------------------------------------------------------------------------
+
+import contextvars
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Latency buckets in seconds (LLM calls dominate, so the range is wide).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+# --- Registry ---------------------------------------------------------------
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms, keyed by metric name + labels."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, dict]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h["buckets"][i] += 1
+            h["sum"] += value
+            h["count"] += 1
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    # --- Export -------------------------------------------------------------
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    for bound, count in zip(self.buckets, h["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {h['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {h['sum']:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Plain-dict view of every series (for JSON dumps and tests)."""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(k), "value": v} for k, v in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(k), "value": v} for k, v in series.items()]
+                    for name, series in self._gauges.items()
+                },
+                "histograms": {
+                    name: [
+                        {"labels": dict(k), "sum": h["sum"], "count": h["count"]}
+                        for k, h in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+
+# Process-wide registry used by the graph nodes.
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("chunkbuddy_node_seconds", "Wall time per graph node execution.")
+REGISTRY.describe("chunkbuddy_node_llm_seconds", "Time spent waiting on the LLM inside a node.")
+REGISTRY.describe("chunkbuddy_node_parse_seconds", "Local (non-LLM) time inside a node.")
+REGISTRY.describe("chunkbuddy_prompt_chars_total", "Prompt characters sent per node.")
+REGISTRY.describe("chunkbuddy_prompt_tokens_total", "Prompt tokens sent per node.")
+REGISTRY.describe("chunkbuddy_response_chars_total", "Response characters received per node.")
+REGISTRY.describe("chunkbuddy_response_tokens_total", "Response tokens received per node.")
+REGISTRY.describe("chunkbuddy_cache_requests_total", "LLM calls by response-cache status.")
+REGISTRY.describe("chunkbuddy_node_errors_total", "Node executions that raised.")
+
+
+# --- Verbosity --------------------------------------------------------------
+_verbosity = int(os.environ.get("CHUNKBUDDY_VERBOSITY", "0") or 0)
+
+
+def set_verbosity(level: int) -> None:
+    global _verbosity
+    _verbosity = level
+
+
+def get_verbosity() -> int:
+    return _verbosity
+
+
+# --- Spans ------------------------------------------------------------------
+@dataclass
+class NodeSpan:
+    node: str
+    started_at: float = field(default_factory=time.time)
+    wall_s: float = 0.0
+    llm_s: float = 0.0
+    parse_s: float = 0.0
+    prompt_chars: int = 0
+    prompt_tokens: int = 0
+    prompt_tokens_saved: int = 0  # removed by prompt budgets (prompt_budget.py)
+    response_chars: int = 0
+    response_tokens: int = 0
+    cache: str = "none"          # "hit", "miss", "disabled" or "none" (no LLM call)
+    error: Optional[str] = None
+
+    def record_llm_call(self, prompt: str, response: str, seconds: float, cache: str,
+                        usage: Optional[dict] = None) -> None:
+        """Called by the LLM helpers for every call made inside this span."""
+        usage = usage or {}
+        self.llm_s += seconds
+        self.prompt_chars += len(prompt)
+        self.response_chars += len(response)
+        # Prefer provider-reported usage; fall back to ~4 chars per token.
+        self.prompt_tokens += usage.get("input_tokens") or max(1, len(prompt) // 4)
+        self.response_tokens += usage.get("output_tokens") or max(1, len(response) // 4)
+        self.cache = cache
+
+
+_current_span: contextvars.ContextVar[Optional[NodeSpan]] = contextvars.ContextVar(
+    "chunkbuddy_current_span", default=None
+)
+_span_sinks: List[Callable[[NodeSpan], None]] = []
+
+
+def current_span() -> Optional[NodeSpan]:
+    return _current_span.get()
+
+
+def add_span_sink(sink: Callable[[NodeSpan], None]) -> None:
+    """Register a callable that receives every finished NodeSpan."""
+    _span_sinks.append(sink)
+
+
+def remove_span_sink(sink: Callable[[NodeSpan], None]) -> None:
+    if sink in _span_sinks:
+        _span_sinks.remove(sink)
+
+
+@contextmanager
+def node_span(node: str, state: Optional[dict] = None,
+              registry: MetricsRegistry = REGISTRY) -> Iterator[NodeSpan]:
+    """Time one node execution and publish it when the node returns or raises."""
+    if _verbosity >= 2:
+        print(f"\n>>> {node} received state:", state)
+    span = NodeSpan(node=node)
+    token = _current_span.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    except Exception as exc:
+        span.error = repr(exc)
+        registry.inc("chunkbuddy_node_errors_total", node=node)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.wall_s = time.perf_counter() - start
+        span.parse_s = max(0.0, span.wall_s - span.llm_s)
+        _publish(span, registry)
+
+
+def _publish(span: NodeSpan, registry: MetricsRegistry) -> None:
+    node = span.node
+    registry.observe("chunkbuddy_node_seconds", span.wall_s, node=node)
+    registry.observe("chunkbuddy_node_llm_seconds", span.llm_s, node=node)
+    registry.observe("chunkbuddy_node_parse_seconds", span.parse_s, node=node)
+    registry.inc("chunkbuddy_prompt_chars_total", span.prompt_chars, node=node)
+    registry.inc("chunkbuddy_prompt_tokens_total", span.prompt_tokens, node=node)
+    registry.inc("chunkbuddy_response_chars_total", span.response_chars, node=node)
+    registry.inc("chunkbuddy_response_tokens_total", span.response_tokens, node=node)
+    if span.cache != "none":
+        registry.inc("chunkbuddy_cache_requests_total", node=node, status=span.cache)
+
+    if _verbosity >= 1:
+        saved = f", {span.prompt_tokens_saved} saved" if span.prompt_tokens_saved else ""
+        print(
+            f">>> {node}: {span.wall_s * 1000:.1f} ms "
+            f"(llm {span.llm_s * 1000:.1f} ms, local {span.parse_s * 1000:.1f} ms, "
+            f"cache {span.cache}, {span.prompt_tokens}→{span.response_tokens} tokens{saved})"
+        )
+    for sink in list(_span_sinks):
+        sink(span)
+
+
+# --- JSONL export -----------------------------------------------------------
+class JsonlSpanWriter:
+    """Span sink that appends one JSON object per finished node to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, span: NodeSpan) -> None:
+        line = json.dumps(asdict(span), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def write_snapshot_jsonl(path: str, registry: MetricsRegistry = REGISTRY) -> None:
+    """Append a timestamped snapshot of the registry to a JSONL file."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": time.time(), **registry.snapshot()}) + "\n")
+
+
+# --- Prometheus scrape endpoint ---------------------------------------------
+def start_metrics_server(port: int = 9108, host: str = "127.0.0.1",
+                         registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve GET /metrics in Prometheus text format from a daemon thread."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # keep scrapes out of stdout
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,302 @@
+# model_routing.py
+# ---------------------------------------------------------------------------
+# Per-node model routing.
+# Drafting the explanation is the step that needs a capable model; chunking
+# a 30-word explanation or formatting five questions does not. A routing
+# table maps node names to a ModelConfig (model, temperature, max output
+# tokens, timeout), and build_app(routing=...) gives each node its own
+# client from the shared registry (llm_clients.py).
+#
+# The profile command runs a topic set through candidate routings and
+# reports per-node latency, token usage and estimated cost:
+#   - with --live, on the real clients (needs OPENAI_API_KEY and spends
+#     tokens); it then suggests a routing: for each node, the fastest
+#     candidate model whose replies all parsed (see node_output.py).
+#   - otherwise on the offline stand-in model (fake_llm.py), whose latency
+#     comes from the STAND_IN_LATENCY table and which ignores max_tokens.
+#     That is a simulated estimate that exercises the pipeline; its ranking
+#     is printed as such, never as a suggestion.
+#
+# Usage:
+#   python model_routing.py profile
+#   python model_routing.py profile --live --routings uniform,tiered --runs 40 --json routing.json
+#   python model_routing.py show tiered
+# ---------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+from collections import defaultdict
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+NODES = ("draft_explanation", "chunk_explanation", "generate_check_questions",
+         "summarize_and_meta", "fused_generate")
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    model: str = "gpt-4o-mini"
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None   # cap on output tokens
+    timeout: Optional[float] = None    # seconds per request
+
+
+# The graph's default model (chunkbuddy_graph.DEFAULT_MODEL_SETTINGS).
+DEFAULT_CONFIG = ModelConfig("gpt-4o-mini", 0.5)
+
+# --- Candidate routings -----------------------------------------------------
+# "uniform" is the graph's default: every node on gpt-4o-mini. "tiered"
+# keeps the explanation on gpt-4o-mini and moves the formatting steps to a
+# smaller, faster model with tight output caps.
+ROUTINGS: Dict[str, Dict[str, ModelConfig]] = {
+    "uniform": {node: DEFAULT_CONFIG for node in NODES},
+    "tiered": {
+        "draft_explanation": ModelConfig("gpt-4o-mini", 0.5, max_tokens=300, timeout=30.0),
+        "chunk_explanation": ModelConfig("gpt-4.1-nano", 0.2, max_tokens=500, timeout=20.0),
+        "generate_check_questions": ModelConfig("gpt-4.1-nano", 0.3, max_tokens=250, timeout=20.0),
+        "summarize_and_meta": ModelConfig("gpt-4.1-nano", 0.3, max_tokens=250, timeout=20.0),
+        "fused_generate": ModelConfig("gpt-4o-mini", 0.5, max_tokens=1200, timeout=45.0),
+    },
+    "premium-draft": {
+        "draft_explanation": ModelConfig("gpt-4o", 0.5, max_tokens=300, timeout=45.0),
+        "chunk_explanation": ModelConfig("gpt-4o-mini", 0.2, max_tokens=500),
+        "generate_check_questions": ModelConfig("gpt-4.1-nano", 0.3, max_tokens=250),
+        "summarize_and_meta": ModelConfig("gpt-4.1-nano", 0.3, max_tokens=250),
+        "fused_generate": ModelConfig("gpt-4o", 0.5, max_tokens=1200, timeout=60.0),
+    },
+}
+
+Routing = Mapping[str, Union[ModelConfig, dict, object]]
+
+
+def as_config(entry: Union[ModelConfig, dict]) -> ModelConfig:
+    return entry if isinstance(entry, ModelConfig) else ModelConfig(**entry)
+
+
+def client_for(config: ModelConfig):
+    """The shared, rate-limited client for `config`."""
+    from llm_clients import get_chat_model
+
+    options = {k: v for k, v in (("max_tokens", config.max_tokens), ("timeout", config.timeout)) if v is not None}
+    return get_chat_model(config.model, config.temperature, **options)
+
+
+def node_llms(routing: Optional[Routing], llm=None) -> Dict[str, object]:
+    """
+    Node name → the LLM it should call. Routing entries may be a ModelConfig,
+    a dict of ModelConfig fields, or a ready chat model (e.g. a FakeChatModel).
+    Nodes without an entry get `llm`; None there means the graph default.
+    """
+    routing = routing or {}
+    unknown = set(routing) - set(NODES)
+    if unknown:
+        raise ValueError(f"unknown node(s) in routing: {sorted(unknown)}; expected {NODES}")
+    resolved = {}
+    for node in NODES:
+        entry = routing.get(node)
+        if entry is None:
+            resolved[node] = llm
+        elif isinstance(entry, (ModelConfig, dict)):
+            resolved[node] = client_for(as_config(entry))
+        else:
+            resolved[node] = entry
+    return resolved
+
+
+# --- Profiling ----------------------------------------------------------------
+# Simulated latency (mean, jitter in seconds) per model, for the fake LLM.
+# These are assumptions, not measurements: profile --live to measure.
+STAND_IN_LATENCY: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (1.2, 0.35),
+    "gpt-4o-mini": (0.6, 0.15),
+    "gpt-4.1-mini": (0.55, 0.15),
+    "gpt-4.1-nano": (0.3, 0.08),
+}
+# Approximate USD per 1M (input, output) tokens; edit to match your pricing.
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+
+def stand_in_routing(routing: Routing, scale: float = 1.0, seed: int = 0) -> Dict[str, object]:
+    """Replace every ModelConfig in `routing` with a FakeChatModel named after it."""
+    from fake_llm import FakeChatModel
+
+    fakes = {}
+    for i, node in enumerate(NODES):
+        config = as_config(routing.get(node, DEFAULT_CONFIG))
+        mean, jitter = STAND_IN_LATENCY.get(config.model, (0.6, 0.15))
+        fakes[node] = FakeChatModel(model_name=config.model, temperature=config.temperature or 0.0,
+                                    latency_mean=mean * scale, latency_jitter=jitter * scale,
+                                    seed=seed + i)
+    return fakes
+
+
+def _cost(model: str, prompt_tokens: float, response_tokens: float) -> float:
+    price_in, price_out = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + response_tokens * price_out) / 1_000_000
+
+
+def profile_routing(routing: Routing, topics: List[str], level: str = "beginner",
+                    concurrency: int = 8, scale: float = 1.0, fused: bool = False,
+                    live: bool = False) -> dict:
+    """
+    Run `topics` through `routing`; per-node and end-to-end stats. With
+    live=True the routing's real clients are called; otherwise the stand-in
+    model simulates them (profile["simulated"] is True).
+    """
+    from chunkbuddy_graph import build_async_app, build_fused_app, run_many
+    from metrics import REGISTRY, add_span_sink, remove_span_sink
+
+    spans = []
+    failures_before = _parse_failures(REGISTRY)
+    add_span_sink(spans.append)
+    try:
+        llms = routing if live else stand_in_routing(routing, scale)
+        if fused:
+            app = build_fused_app(routing=llms)
+            inputs = [{"topic": t, "level": level} for t in topics]
+            results = app.batch(inputs, config={"max_concurrency": concurrency})
+        else:
+            app = build_async_app(routing=llms)
+            results = asyncio.run(run_many(topics, level, max_concurrency=concurrency, app=app))
+    finally:
+        remove_span_sink(spans.append)
+    failures_after = _parse_failures(REGISTRY)
+
+    by_node = defaultdict(list)
+    for span in spans:
+        by_node[span.node].append(span)
+    nodes = {}
+    for node, node_spans in by_node.items():
+        model = as_config(routing.get(node, DEFAULT_CONFIG)).model
+        prompt_tokens = statistics.mean(s.prompt_tokens for s in node_spans)
+        response_tokens = statistics.mean(s.response_tokens for s in node_spans)
+        nodes[node] = {
+            "model": model,
+            "runs": len(node_spans),
+            "p50_ms": statistics.median(s.wall_s for s in node_spans) * 1000,
+            "mean_ms": statistics.mean(s.wall_s for s in node_spans) * 1000,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "cost_usd": _cost(model, prompt_tokens, response_tokens),
+            "parse_failures": failures_after.get(node, 0) - failures_before.get(node, 0),
+        }
+    # Nodes run one after another, so a run's latency is the sum of its nodes.
+    return {
+        "simulated": not live,
+        "nodes": nodes,
+        "errors": sum(isinstance(r, Exception) for r in results),
+        "run_ms": sum(n["mean_ms"] * n["runs"] for n in nodes.values()) / max(1, len(topics)),
+        "run_cost_usd": sum(n["cost_usd"] * n["runs"] for n in nodes.values()) / max(1, len(topics)),
+    }
+
+
+def _parse_failures(registry) -> Dict[str, float]:
+    counts: Dict[str, float] = defaultdict(float)
+    for series in registry.snapshot()["counters"].get("chunkbuddy_parse_failures_total", []):
+        counts[series["labels"]["node"]] += series["value"]
+    return counts
+
+
+def suggest_routing(routings: Dict[str, Routing], profiles: Dict[str, dict]) -> Dict[str, ModelConfig]:
+    """
+    For each node, the candidate config with the lowest p50 and no parse
+    failures. Only a recommendation when the profiles are live ones.
+    """
+    suggestion = {}
+    for node in NODES:
+        candidates = [
+            (profile["nodes"][node]["p50_ms"], name)
+            for name, profile in profiles.items()
+            if node in profile["nodes"] and profile["nodes"][node]["parse_failures"] == 0
+        ]
+        if candidates:
+            _, best = min(candidates)
+            suggestion[node] = as_config(routings[best].get(node, DEFAULT_CONFIG))
+    return suggestion
+
+
+# --- Report -----------------------------------------------------------------
+def print_profile(name: str, profile: dict) -> None:
+    print(f"\n{name}: {profile['run_ms']:.0f} ms per run, ${profile['run_cost_usd'] * 1000:.3f} per 1k runs"
+          f" ({profile['errors']} failed runs)")
+    print(f"  {'node':<26}{'model':<15}{'p50 ms':>9}{'tok in':>9}{'tok out':>9}{'$/1k runs':>11}{'parse fail':>12}")
+    for node, n in profile["nodes"].items():
+        print(f"  {node:<26}{n['model']:<15}{n['p50_ms']:>9.0f}{n['prompt_tokens']:>9.0f}"
+              f"{n['response_tokens']:>9.0f}{n['cost_usd'] * 1000:>11.4f}{n['parse_failures']:>12.0f}")
+
+
+if __name__ == "__main__":
+    from benchmark_chunkbuddy import TOPICS, quiet
+    from load_env import load_env
+
+    parser = argparse.ArgumentParser(description="Per-node model routing for ChunkBuddy.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_profile = sub.add_parser("profile", help="Profile candidate routings (simulated unless --live).")
+    p_profile.add_argument("--live", action="store_true",
+                           help="Measure the real clients (needs OPENAI_API_KEY; spends tokens).")
+    p_profile.add_argument("--routings", default=",".join(ROUTINGS), help="Comma-separated ROUTINGS names.")
+    p_profile.add_argument("--topics", help="Text file with one topic per line (default: built-in set).")
+    p_profile.add_argument("--runs", type=int, default=24, help="Topics per routing (cycled).")
+    p_profile.add_argument("--level", default="beginner")
+    p_profile.add_argument("--concurrency", type=int, default=8)
+    p_profile.add_argument("--latency-scale", type=float, default=0.1,
+                           help="Multiply the stand-in latencies (1.0 = realistic, slower).")
+    p_profile.add_argument("--fused", action="store_true", help="Profile the fused graph instead.")
+    p_profile.add_argument("--json", dest="json_path", help="Also write results to this file.")
+
+    p_show = sub.add_parser("show", help="Print a routing table as JSON.")
+    p_show.add_argument("name", choices=list(ROUTINGS))
+
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print(json.dumps({node: asdict(c) for node, c in ROUTINGS[args.name].items()}, indent=2))
+    else:
+        topics = TOPICS
+        if args.topics:
+            with open(args.topics, encoding="utf-8") as f:
+                topics = [line.strip() for line in f if line.strip()]
+        topics = [topics[i % len(topics)] for i in range(args.runs)]
+        names = [n.strip() for n in args.routings.split(",") if n.strip()]
+
+        if args.live:
+            load_env()
+            if not os.environ.get("OPENAI_API_KEY"):
+                parser.error("--live needs OPENAI_API_KEY")
+            print(f"Routing profile — {len(topics)} topics, live models")
+        else:
+            print(f"SIMULATED routing profile — {len(topics)} topics on the fake LLM, latencies from "
+                  f"STAND_IN_LATENCY x{args.latency_scale:g}, max_tokens ignored. Use --live to measure.")
+        profiles = {}
+        with quiet():
+            for name in names:
+                profiles[name] = profile_routing(ROUTINGS[name], topics, args.level, args.concurrency,
+                                                 args.latency_scale, args.fused, live=args.live)
+        for name, profile in profiles.items():
+            print_profile(name, profile)
+
+        suggestion = suggest_routing({n: ROUTINGS[n] for n in names}, profiles)
+        if args.live:
+            print("\nSuggested routing (fastest adequate model per node, measured):")
+        else:
+            print("\nSimulated estimate only, not a recommendation (fastest per node under STAND_IN_LATENCY):")
+        for node, config in suggestion.items():
+            options = ", ".join(f"{f.name}={getattr(config, f.name)}" for f in fields(config)[1:]
+                                if getattr(config, f.name) is not None)
+            print(f"  {node:<26}{config.model:<15}{options}")
+
+        if args.json_path:
+            key = "suggested" if args.live else "simulated_estimate"
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump({"profiles": profiles, key: {n: asdict(c) for n, c in suggestion.items()}},
+                          f, indent=2)
+            print(f"\nWrote {args.json_path}")
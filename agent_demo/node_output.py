@@ -0,0 +1,284 @@
+# node_output.py
+# ---------------------------------------------------------------------------
+# Node-output layer: how the list-shaped nodes (chunks, questions, summary)
+# ask for their replies and read them back.
+#
+# - Structured output: for models that support JSON-schema constrained
+#   decoding, response_format(node, llm) returns the OpenAI `response_format`
+#   for that node's schema, and the reply is a JSON object.
+# - Fallback parser: replies that are not JSON (other models, the fake LLM,
+#   responses cached as text) go through one compiled regex that classifies
+#   every line in a single pass; each node reads the line kinds it needs.
+# - Every parse is counted in the metrics registry by node and format, and
+#   malformed replies by reason (chunkbuddy_parse_failures_total), so bad
+#   output shows up in metrics instead of silently producing wrong counts.
+# ---------------------------------------------------------------------------
+
+import json
+import os
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from metrics import REGISTRY
+
+# --- Schemas ----------------------------------------------------------------
+def _string_list(description: str) -> dict:
+    return {"type": "array", "items": {"type": "string"}, "description": description}
+
+
+def _object_schema(**properties: dict) -> dict:
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+_CHUNKS = _string_list('Each chunk starts with its title, e.g. "Chunk 1: What a partition is".')
+_QUESTIONS = _string_list("Short questions that check understanding.")
+_SUMMARY = {"type": "string", "description": "ONE-SENTENCE TL;DR summary of the topic."}
+_NOTES = _string_list("How the structure supports learning.")
+
+_VERDICTS = {"type": "array", "items": _object_schema(
+    id={"type": "string"},
+    score={"type": "number", "description": "Clarity from 1 to 5."},
+    reason={"type": "string"},
+)}
+
+# Node name → (schema name, JSON schema). draft_explanation is free prose and
+# has none; clarity_judge_batch is the batched evaluation judge (see
+# evaluate_chunkbuddy.py). Strict mode requires every property to be required
+# and no extra keys.
+NODE_SCHEMAS = {
+    "chunk_explanation": ("learning_chunks", _object_schema(chunks=_CHUNKS)),
+    "generate_check_questions": ("check_questions", _object_schema(check_questions=_QUESTIONS)),
+    "summarize_and_meta": ("summary_and_notes", _object_schema(summary=_SUMMARY, learning_design_notes=_NOTES)),
+    "fused_generate": ("mini_lesson", _object_schema(
+        raw_explanation={"type": "string"},
+        chunks=_CHUNKS,
+        check_questions=_QUESTIONS,
+        summary=_SUMMARY,
+        learning_design_notes=_NOTES,
+    )),
+    "clarity_judge_batch": ("clarity_verdicts", _object_schema(verdicts=_VERDICTS)),
+}
+
+# Model families with JSON-schema constrained decoding (OpenAI
+# `response_format={"type": "json_schema", ...}`). Others get plain text.
+STRUCTURED_OUTPUT_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+
+def supports_structured_output(llm) -> bool:
+    """True when `llm` is an OpenAI chat model that accepts a JSON schema."""
+    if os.environ.get("CHUNKBUDDY_STRUCTURED_OUTPUT", "1") == "0":
+        return False
+    # RateLimitedLLM forwards attributes, but the class check needs the model.
+    model = getattr(llm, "llm", llm)
+    if not type(model).__module__.startswith("langchain_openai"):
+        return False
+    name = getattr(model, "model_name", None) or ""
+    return name.startswith(STRUCTURED_OUTPUT_MODELS)
+
+
+def response_format(node: str, llm) -> Optional[dict]:
+    """The `response_format` to request for `node`, or None for plain text."""
+    if node not in NODE_SCHEMAS or not supports_structured_output(llm):
+        return None
+    name, schema = NODE_SCHEMAS[node]
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+# --- Metrics ----------------------------------------------------------------
+REGISTRY.describe("chunkbuddy_parse_total", "Node replies parsed, by node and format (json/text).")
+REGISTRY.describe("chunkbuddy_parse_failures_total", "Node replies that did not fit the expected shape.")
+
+
+def _count(node: str, fmt: str, failure: Optional[str] = None) -> None:
+    REGISTRY.inc("chunkbuddy_parse_total", node=node, format=fmt)
+    if failure is not None:
+        REGISTRY.inc("chunkbuddy_parse_failures_total", node=node, format=fmt, reason=failure)
+
+
+# --- JSON replies -----------------------------------------------------------
+def load_json_object(text: str) -> Optional[dict]:
+    """Parse a JSON object reply, tolerating a ```json fence. None if it is not one."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    if not text.startswith("{"):
+        return None
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _string_items(value) -> Optional[List[str]]:
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        return None
+    return [v.strip() for v in value if v.strip()]
+
+
+# --- Text replies: single-pass line scanner ---------------------------------
+# One regex classifies every line of a reply; alternatives are tried in order,
+# so "Chunk 2: ..." is a chunk title rather than plain text.
+_LINE = re.compile(
+    r"""
+    ^[ \t]*(?:
+        Summary:[ \t]*(?P<summary>.*?)
+      | (?P<chunk>Chunk[ \t]+\d+[ \t]*[:.\-].*?)
+      | \d+[.)\-][ \t]*(?P<numbered>.*?)
+      | [-*•][ \t]+(?P<bullet>.*?)
+      | (?P<text>.*?)
+    )[ \t\r]*$
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+
+
+class Line(NamedTuple):
+    kind: str   # "summary", "chunk", "numbered", "bullet", "text" or "blank"
+    text: str   # the content (marker removed for summary/numbered/bullet)
+    raw: str    # the whole line, stripped
+
+
+def scan_lines(text: str) -> List[Line]:
+    lines = []
+    for m in _LINE.finditer(text):
+        kind = m.lastgroup
+        value = m.group(kind).strip()
+        if kind == "text" and not value:
+            kind = "blank"
+        lines.append(Line(kind, value, m.group(0).strip()))
+    return lines
+
+
+def _paragraphs(lines: List[Line], by_title: bool) -> List[str]:
+    """
+    Split lines into paragraphs: at each "Chunk N:" title when `by_title`
+    (blank lines then stay inside a chunk), otherwise at blank lines.
+    """
+    paragraphs: List[List[str]] = []
+    current: List[str] = []
+    for line in lines:
+        if line.kind == ("chunk" if by_title else "blank"):
+            if current:
+                paragraphs.append(current)
+            current = [line.raw] if by_title else []
+        elif line.kind != "blank":
+            current.append(line.raw)
+    if current:
+        paragraphs.append(current)
+    return ["\n".join(p) for p in paragraphs]
+
+
+# --- Per-node readers -------------------------------------------------------
+# Each reader takes the raw reply. A JSON object (structured output, or a
+# model that answered in JSON anyway) is read by key; anything else goes
+# through the line scanner. A JSON object without the expected keys is a
+# failure and yields nothing, rather than being scanned as text.
+# (fused_generate validates its JSON itself; see chunkbuddy_graph.parse_fused.)
+def read_chunks(text: str) -> List[str]:
+    node = "chunk_explanation"
+    if not text.strip():
+        return []
+    data = load_json_object(text)
+    if data is not None:
+        chunks = _string_items(data.get("chunks")) or []
+        _count(node, "json", None if chunks else "invalid_json")
+        return chunks
+
+    lines = scan_lines(text)
+    # With titles, anything before the first one ("Here are your chunks:")
+    # is preamble; without them, fall back to blank-line paragraphs.
+    first = next((i for i, line in enumerate(lines) if line.kind == "chunk"), None)
+    if first is not None:
+        chunks = _paragraphs(lines[first:], by_title=True)
+    else:
+        chunks = _paragraphs(lines, by_title=False)
+    _count(node, "text", None if chunks else "no_chunks")
+    return chunks
+
+
+def read_questions(text: str) -> List[str]:
+    node = "generate_check_questions"
+    if not text.strip():
+        return []
+    data = load_json_object(text)
+    if data is not None:
+        questions = _string_items(data.get("check_questions")) or []
+        _count(node, "json", None if questions else "invalid_json")
+        return questions
+
+    questions = []
+    for line in scan_lines(text):
+        if line.kind in ("numbered", "bullet"):
+            if line.text:
+                questions.append(line.text)
+        elif line.kind in ("text", "chunk") and line.raw.endswith("?"):
+            questions.append(line.raw)
+    _count(node, "text", None if questions else "no_questions")
+    return questions
+
+
+def read_summary(text: str) -> Tuple[str, List[str]]:
+    """(summary, learning-design notes); "" / [] for whatever is missing."""
+    node = "summarize_and_meta"
+    if not text.strip():
+        return "", []
+    data = load_json_object(text)
+    if data is not None:
+        summary = data.get("summary")
+        summary = summary.strip() if isinstance(summary, str) else ""
+        notes = _string_items(data.get("learning_design_notes")) or []
+        _count(node, "json", None if summary and notes else "invalid_json")
+        return summary, notes
+
+    summary, notes = "", []
+    for line in scan_lines(text):
+        if line.kind == "summary" and not summary:
+            summary = line.text
+        elif line.kind == "bullet" and line.text:
+            notes.append(line.text)
+    _count(node, "text", "no_summary_line" if not summary else None if notes else "no_notes")
+    return summary, notes
+
+
+class ChunkSplitter:
+    """
+    Incremental splitter for a streamed chunk_explanation reply.
+
+    feed() returns the chunks completed by each new piece of text. A chunk
+    is complete when the next "Chunk N:" title line arrives, so blank lines
+    inside a chunk and titles on a line of their own are handled like
+    read_chunks() handles them, and every chunk is exactly the string
+    read_chunks() returns for the whole reply. The last chunk is only known
+    once the stream ends; read it with read_chunks() on the whole reply.
+    """
+
+    def __init__(self):
+        self._partial = ""             # text after the last newline
+        self._current: List[str] = []  # raw lines of the chunk being read
+
+    def feed(self, piece: str) -> List[str]:
+        text = self._partial + piece
+        complete, newline, self._partial = text.rpartition("\n")
+        if not newline:
+            self._partial = complete + self._partial
+            return []
+        ready = []
+        for line in scan_lines(complete):
+            if line.kind == "chunk":
+                if self._current:
+                    ready.append("\n".join(self._current))
+                self._current = [line.raw]
+            elif line.kind != "blank" and self._current:
+                self._current.append(line.raw)  # preamble lines are skipped
+        return ready
+
+
+def count_fused(ok: bool) -> None:
+    """Record a fused reply parse; a reply that does not fit is a failure."""
+    _count("fused_generate", "json", None if ok else "invalid")
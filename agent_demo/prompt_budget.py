@@ -0,0 +1,193 @@
+# prompt_budget.py
+# ---------------------------------------------------------------------------
+# Token-budgeted prompt rendering shared by every ChunkBuddy node.
+# Each node has an input-token budget (NODE_BUDGETS). render_prompt() fills
+# a template and, if the result is over budget, compacts the variable parts
+# of the context (explanations, chunks, questions) until it fits:
+#   - short items are kept whole; long items are cut back at a word boundary
+#     so every item keeps its head (chunk titles, first sentences)
+#   - the template text itself is never trimmed
+#   - if the prompt is still over budget after that, the largest field is cut
+#     as a whole; a prompt whose fixed parts alone exceed the budget is sent
+#     as is and counted in chunkbuddy_prompt_over_budget_total
+# Tokens are counted locally: with tiktoken when its encoding is available,
+# otherwise with a ~4 characters/token estimate, so it works fully offline.
+# Every trim is recorded as "tokens saved" on the node span and in metrics.
+# ---------------------------------------------------------------------------
+
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import REGISTRY, current_span
+
+# Input-token budget per node (template + context). None = unlimited.
+NODE_BUDGETS: Dict[str, Optional[int]] = {
+    "draft_explanation": 300,
+    "chunk_explanation": 1_500,
+    "generate_check_questions": 1_200,
+    "summarize_and_meta": 800,
+    "fused_generate": 500,
+}
+
+TOKENIZER_MODEL = os.environ.get("CHUNKBUDDY_TOKENIZER_MODEL", "gpt-4o-mini")
+ELLIPSIS = " …"
+
+REGISTRY.describe("chunkbuddy_prompt_tokens_saved_total", "Input tokens removed by prompt budgets.")
+REGISTRY.describe("chunkbuddy_prompt_trims_total", "Prompts that had to be compacted to fit a budget.")
+REGISTRY.describe("chunkbuddy_prompt_over_budget_total",
+                  "Prompts still over budget with every variable field cut (template and fixed fields too long).")
+
+
+# --- Tokenizers -------------------------------------------------------------
+class ApproxTokenizer:
+    """Offline fallback: ~4 characters per token (the usual English average)."""
+
+    name = "approx"
+    chars_per_token = 4
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return text[: max_tokens * self.chars_per_token]
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding):
+        self._encoding = encoding
+        self.name = encoding.name
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._encoding.encode(text, disallowed_special=())
+        return self._encoding.decode(tokens[:max_tokens])
+
+
+_tokenizer = None
+
+
+def get_tokenizer():
+    """tiktoken for TOKENIZER_MODEL if installed and loadable, else ApproxTokenizer."""
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            import tiktoken
+            _tokenizer = TiktokenTokenizer(tiktoken.encoding_for_model(TOKENIZER_MODEL))
+        except Exception:
+            # Not installed, unknown model, or the encoding file cannot be
+            # downloaded (offline): estimate instead.
+            _tokenizer = ApproxTokenizer()
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to at most `max_tokens`, at a word boundary, marking the cut."""
+    tokenizer = get_tokenizer()
+    if tokenizer.count(text) <= max_tokens:
+        return text
+    room = max_tokens - tokenizer.count(ELLIPSIS)
+    if room <= 0:
+        return ""
+    head = tokenizer.truncate(text, room)
+    if " " in head:
+        head = head.rsplit(" ", 1)[0]
+    return head.rstrip() + ELLIPSIS
+
+
+# --- Budgeted rendering -----------------------------------------------------
+def _allocate(sizes: List[int], budget: int) -> List[int]:
+    """
+    Split `budget` tokens across items of the given sizes (water-filling):
+    items smaller than an equal share keep their full size, and their slack
+    is shared among the larger ones.
+    """
+    allowance = [0] * len(sizes)
+    remaining, left = budget, len(sizes)
+    for i in sorted(range(len(sizes)), key=sizes.__getitem__):
+        share = remaining // left
+        allowance[i] = min(sizes[i], share)
+        remaining -= allowance[i]
+        left -= 1
+    return allowance
+
+
+def render_prompt(
+    node: str,
+    template: str,
+    fixed: Dict[str, str],
+    elastic: Dict[str, Tuple[Sequence[str], str]],
+    budget: Optional[int] = None,
+) -> str:
+    """
+    Format `template` within the node's token budget.
+
+    fixed:   fields inserted verbatim (topic, level, ...)
+    elastic: field -> (items, separator); these are compacted when the
+             prompt is over budget
+    budget:  overrides NODE_BUDGETS[node]
+    """
+    if budget is None:
+        budget = NODE_BUDGETS.get(node)
+
+    def fill(parts: Dict[str, List[str]]) -> str:
+        joined = {name: elastic[name][1].join(items) for name, items in parts.items()}
+        return template.format(**fixed, **joined)
+
+    parts = {name: list(items) for name, (items, _sep) in elastic.items()}
+    prompt = fill(parts)
+    if budget is None:
+        return prompt
+    original = count_tokens(prompt)
+    if original <= budget:
+        return prompt
+
+    overhead = count_tokens(fill({name: [] for name in parts}))
+    flat = [(name, i, item) for name, items in parts.items() for i, item in enumerate(items)]
+    sizes = [count_tokens(item) for _, _, item in flat]
+    target = budget - overhead
+    # Separators and token merges at the joins make the sum of the parts
+    # slightly off; shrink the target until the whole prompt fits.
+    for _ in range(5):
+        allowance = _allocate(sizes, max(0, target))
+        trimmed: Dict[str, List[str]] = {name: [] for name in parts}
+        for (name, i, item), limit in zip(flat, allowance):
+            cut = truncate_to_tokens(item, limit)
+            if cut:
+                trimmed[name].append(cut)
+        prompt = fill(trimmed)
+        excess = count_tokens(prompt) - budget
+        if excess <= 0:
+            break
+        target -= excess
+    else:
+        # Still over: cut the largest field as a whole until the prompt fits
+        # or no variable text is left.
+        while excess > 0:
+            joined = {name: elastic[name][1].join(items) for name, items in trimmed.items()}
+            name = max(joined, key=lambda n: count_tokens(joined[n]))
+            size = count_tokens(joined[name])
+            if size == 0:
+                REGISTRY.inc("chunkbuddy_prompt_over_budget_total", node=node)
+                break
+            cut = truncate_to_tokens(joined[name], max(0, size - excess))
+            trimmed[name] = [cut] if cut else []
+            prompt = fill(trimmed)
+            excess = count_tokens(prompt) - budget
+
+    _record_saving(node, original - count_tokens(prompt))
+    return prompt
+
+
+def _record_saving(node: str, saved: int) -> None:
+    REGISTRY.inc("chunkbuddy_prompt_trims_total", node=node)
+    REGISTRY.inc("chunkbuddy_prompt_tokens_saved_total", saved, node=node)
+    span = current_span()
+    if span is not None:
+        span.prompt_tokens_saved += saved
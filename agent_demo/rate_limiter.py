@@ -0,0 +1,495 @@
+# rate_limiter.py
+# ---------------------------------------------------------------------------
+# Process-wide adaptive rate limiter for all ChunkBuddy LLM traffic.
+# Without it, the graph, the studio graph and the evaluation judge each hit
+# the provider independently, and bursts end in 429 storms and wasted
+# retries. Every LLM client is wrapped with rate_limited(), which routes its
+# calls through one AdaptiveRateLimiter:
+#   - two token buckets: requests/min (RPM) and tokens/min (TPM). Tokens
+#     are reserved from a local estimate before the call and reconciled
+#     with the provider-reported usage afterwards.
+#   - an AIMD concurrency limit: +1 per window of successful calls,
+#     halved on a 429 (plus a cool-down), and cut by 10% when latency per
+#     output token drifts well above the best level seen so far.
+#   - retries: the wrapper, not the provider SDK, retries 429s and transient
+#     errors (clients are built with max_retries=0), so every 429 reaches
+#     the limiter and every retry passes the token buckets again.
+# Limits come from CHUNKBUDDY_RPM / CHUNKBUDDY_TPM / CHUNKBUDDY_MAX_CONCURRENCY
+# (0 = no RPM / TPM limit).
+# ---------------------------------------------------------------------------
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from metrics import REGISTRY, MetricsRegistry
+from prompt_budget import count_tokens
+
+REGISTRY.describe("chunkbuddy_llm_concurrency_limit", "Current adaptive LLM concurrency limit.")
+REGISTRY.describe("chunkbuddy_llm_in_flight", "LLM calls currently in flight.")
+REGISTRY.describe("chunkbuddy_llm_limiter_wait_seconds", "Time calls waited for the rate limiter.")
+REGISTRY.describe("chunkbuddy_llm_rate_limited_total", "LLM calls rejected by the provider with 429.")
+
+# How long to poll while blocked on the concurrency limit (async callers).
+_POLL_S = 0.02
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    return type(exc).__name__ == "RateLimitError"
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Server errors, timeouts and dropped connections: worth another try."""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _TokenBucket:
+    # per_minute of None or 0 means no limit.
+    def __init__(self, per_minute: Optional[float]):
+        self.unlimited = not per_minute or per_minute <= 0
+        self.capacity = 0.0 if self.unlimited else float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it already is)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)  # oversized calls wait for a full bucket
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount  # may go negative when a reservation was too low
+
+
+class AdaptiveRateLimiter:
+    """RPM + TPM token buckets with an AIMD-controlled concurrency limit."""
+
+    def __init__(
+        self,
+        rpm: Optional[float] = 500,
+        tpm: Optional[float] = 200_000,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        initial_concurrency: Optional[int] = None,
+        latency_tolerance: float = 3.0,
+        cooldown_s: float = 1.0,
+        registry: MetricsRegistry = REGISTRY,
+    ):
+        if max_concurrency < 1 or not 1 <= min_concurrency <= max_concurrency:
+            raise ValueError("need 1 <= min_concurrency <= max_concurrency")
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.cooldown_s = cooldown_s
+        self.registry = registry
+
+        self._requests = _TokenBucket(rpm)
+        self._tokens = _TokenBucket(tpm)
+        self._limit = float(initial_concurrency or min(8, max_concurrency))
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        # Latency per output token: smoothed value and the best seen.
+        self._latency_ewma: Optional[float] = None
+        self._latency_floor: Optional[float] = None
+        self._samples = 0
+        self._avg_output_tokens = 200.0
+        self._cond = threading.Condition()
+        self.stats = {"calls": 0, "rate_limited": 0, "errors": 0, "waited_s": 0.0}
+        self._publish()
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    # --- Admission ----------------------------------------------------------
+    def _try_acquire(self, tokens: float) -> float:
+        """Take a slot and budget for a call; return 0, or seconds to wait. Holds _cond."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._in_flight >= int(self._limit):
+            return -1.0  # wait for a release
+        wait = max(self._requests.wait_for(1, now), self._tokens.wait_for(tokens, now))
+        if wait > 0:
+            return wait
+        self._requests.take(1)
+        self._tokens.take(tokens)
+        self._in_flight += 1
+        self._publish()
+        return 0.0
+
+    def acquire(self, tokens: float) -> None:
+        start = time.perf_counter()
+        with self._cond:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait == 0.0:
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+        self._waited(time.perf_counter() - start)
+
+    async def aacquire(self, tokens: float) -> None:
+        start = time.perf_counter()
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens)
+            if wait == 0.0:
+                break
+            await asyncio.sleep(wait if wait > 0 else _POLL_S)
+        self._waited(time.perf_counter() - start)
+
+    def _waited(self, seconds: float) -> None:
+        self.stats["waited_s"] += seconds
+        self.registry.observe("chunkbuddy_llm_limiter_wait_seconds", seconds)
+
+    # --- Feedback -----------------------------------------------------------
+    def release(self, reserved: float, used: Optional[float], seconds: float,
+                output_tokens: int = 0, error: Optional[BaseException] = None,
+                abandoned: bool = False) -> None:
+        """
+        Return the slot and adapt: call exactly once per successful acquire.
+        An abandoned call (cancelled, or a stream closed early) only returns
+        its slot: its latency says nothing about the provider.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self.stats["calls"] += 1
+            now = time.monotonic()
+            if used is not None:
+                self._tokens.take(used - reserved)
+            if abandoned:
+                pass
+            elif error is not None and is_rate_limit_error(error):
+                self.stats["rate_limited"] += 1
+                self.registry.inc("chunkbuddy_llm_rate_limited_total")
+                self._blocked_until = max(self._blocked_until,
+                                          now + (_retry_after(error) or self.cooldown_s))
+                self._decrease(0.5, now)
+            elif error is not None:
+                self.stats["errors"] += 1
+            else:
+                self._observe_latency(seconds, output_tokens, now)
+            self._publish()
+            self._cond.notify_all()
+
+    def _observe_latency(self, seconds: float, output_tokens: int, now: float) -> None:
+        self._avg_output_tokens += 0.1 * (max(1, output_tokens) - self._avg_output_tokens)
+        per_token = seconds / max(1, output_tokens)
+        self._latency_ewma = per_token if self._latency_ewma is None else (
+            self._latency_ewma + 0.2 * (per_token - self._latency_ewma))
+        self._samples += 1
+        if self._samples >= 10:  # let the average settle before trusting it
+            self._latency_floor = min(self._latency_floor or self._latency_ewma, self._latency_ewma)
+        if self._latency_floor and self._latency_ewma > self._latency_floor * self.latency_tolerance:
+            self._decrease(0.9, now)
+        else:
+            # Additive increase: about +1 per `limit` successful calls.
+            self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+
+    def _decrease(self, factor: float, now: float) -> None:
+        # At most once per cool-down, so one burst of failures counts once.
+        if now - self._last_decrease < self.cooldown_s:
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.min_concurrency), self._limit * factor)
+
+    def _publish(self) -> None:
+        self.registry.set_gauge("chunkbuddy_llm_concurrency_limit", int(self._limit))
+        self.registry.set_gauge("chunkbuddy_llm_in_flight", self._in_flight)
+
+    # --- Call wrappers ------------------------------------------------------
+    def estimate_tokens(self, prompt_tokens: int) -> float:
+        return prompt_tokens + self._avg_output_tokens
+
+    @contextmanager
+    def call(self, prompt_tokens: int) -> Iterator["_Call"]:
+        reserved = self.estimate_tokens(prompt_tokens)
+        self.acquire(reserved)
+        record = _Call(reserved)
+        try:
+            yield record
+        except Exception as exc:
+            record.error = exc
+            raise
+        finally:
+            record.finish(self)
+
+    def start(self, prompt_tokens: int) -> "_Call":
+        """Admit a call whose end the caller reports with _Call.finish() (streams)."""
+        reserved = self.estimate_tokens(prompt_tokens)
+        self.acquire(reserved)
+        return _Call(reserved)
+
+    async def astart(self, prompt_tokens: int) -> "_Call":
+        reserved = self.estimate_tokens(prompt_tokens)
+        await self.aacquire(reserved)
+        return _Call(reserved)
+
+    @asynccontextmanager
+    async def acall(self, prompt_tokens: int) -> AsyncIterator["_Call"]:
+        reserved = self.estimate_tokens(prompt_tokens)
+        await self.aacquire(reserved)
+        record = _Call(reserved)
+        try:
+            yield record
+        except Exception as exc:
+            record.error = exc
+            raise
+        finally:
+            record.finish(self)
+
+
+class _Call:
+    """One admitted call; the wrapper fills in usage before it finishes."""
+
+    def __init__(self, reserved: float):
+        self.reserved = reserved
+        self.used: Optional[float] = None
+        self.output_tokens = 0
+        self.error: Optional[BaseException] = None
+        self._start = time.perf_counter()
+
+    def record(self, message: Any, prompt_tokens: int) -> None:
+        usage = getattr(message, "usage_metadata", None) or {}
+        self.output_tokens = usage.get("output_tokens") or count_tokens(str(message.content))
+        self.used = usage.get("total_tokens") or prompt_tokens + self.output_tokens
+
+    def finish(self, limiter: AdaptiveRateLimiter) -> None:
+        # Neither a reply nor an error: cancelled, or a stream closed early.
+        abandoned = self.used is None and self.error is None
+        limiter.release(self.reserved, self.used, time.perf_counter() - self._start,
+                        self.output_tokens, self.error, abandoned)
+
+
+# --- Wrapped LLM clients ----------------------------------------------------
+def _prompt_tokens(messages: Any) -> int:
+    if isinstance(messages, str):
+        return count_tokens(messages)
+    if hasattr(messages, "to_messages"):  # PromptValue
+        messages = messages.to_messages()
+    return sum(count_tokens(str(getattr(m, "content", m))) for m in messages)
+
+
+class RateLimitedLLM:
+    """
+    Routes a chat model's invoke/ainvoke/stream/astream/batch/abatch through
+    a limiter. Everything else (model_name, temperature, bind, ...) is
+    forwarded to the wrapped model, so cache keys and LangGraph's message
+    streaming see the original model.
+
+    429s and transient errors are retried up to `max_retries` times, each
+    attempt admitted by the limiter again (which holds 429 retries back
+    until Retry-After / the cool-down has passed). Streams are only retried
+    before their first chunk.
+    """
+
+    def __init__(self, llm, limiter: AdaptiveRateLimiter, max_retries: int = 2, retry_backoff: float = 0.5):
+        self.llm = llm
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    def __getattr__(self, name: str):
+        if name in ("llm", "limiter", "max_retries", "retry_backoff"):  # not set yet (e.g. during copy/unpickle)
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _retry_delay(self, exc: Exception, attempt: int) -> Optional[float]:
+        """Seconds to sleep before retrying after `exc`, or None to give up."""
+        if attempt >= self.max_retries:
+            return None
+        if is_rate_limit_error(exc):
+            return 0.0  # the limiter is already holding calls back
+        if is_transient_error(exc):
+            return self.retry_backoff * 2 ** attempt
+        return None
+
+    def invoke(self, input, config=None, **kwargs):
+        tokens = _prompt_tokens(input)
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.call(tokens) as call:
+                    message = self.llm.invoke(input, config, **kwargs)
+                    call.record(message, tokens)
+                return message
+            except Exception as exc:
+                delay = self._retry_delay(exc, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        tokens = _prompt_tokens(input)
+        attempt = 0
+        while True:
+            try:
+                async with self.limiter.acall(tokens) as call:
+                    message = await self.llm.ainvoke(input, config, **kwargs)
+                    call.record(message, tokens)
+                return message
+            except Exception as exc:
+                delay = self._retry_delay(exc, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stream(self, input, config=None, **kwargs):
+        tokens = _prompt_tokens(input)
+        attempt = 0
+        while True:
+            call = self.limiter.start(tokens)
+            chunks = self.llm.stream(input, config, **kwargs)
+            full = None
+            try:
+                for chunk in chunks:
+                    full = chunk if full is None else full + chunk
+                    yield chunk
+                if full is not None:
+                    call.record(full, tokens)
+                return
+            except Exception as exc:
+                call.error = exc
+                delay = None if full is not None else self._retry_delay(exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                # Also when the consumer stops early: the slot is back as
+                # soon as this stream is closed.
+                call.finish(self.limiter)
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+            time.sleep(delay)
+            attempt += 1
+
+    async def astream(self, input, config=None, **kwargs):
+        tokens = _prompt_tokens(input)
+        attempt = 0
+        while True:
+            call = await self.limiter.astart(tokens)
+            chunks = self.llm.astream(input, config, **kwargs)
+            full = None
+            try:
+                async for chunk in chunks:
+                    full = chunk if full is None else full + chunk
+                    yield chunk
+                if full is not None:
+                    call.record(full, tokens)
+                return
+            except Exception as exc:
+                call.error = exc
+                delay = None if full is not None else self._retry_delay(exc, attempt)
+                if delay is None:
+                    raise
+            finally:
+                # The slot goes back when this stream is closed, not when it is
+                # garbage-collected: callers that stop early should aclose() it.
+                call.finish(self.limiter)
+                aclose = getattr(chunks, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _batch_size(self, configs: list) -> int:
+        # Never more workers than the limiter could ever let through at once:
+        # the rest would only sit blocked on it (one thread each, for batch).
+        requested = (configs[0] or {}).get("max_concurrency") or len(configs)
+        return max(1, min(requested, len(configs), self.limiter.max_concurrency))
+
+    def batch(self, inputs: List[Any], config=None, *, return_exceptions: bool = False, **kwargs):
+        # Per-item invoke so every item passes the limiter; the limiter, not
+        # max_concurrency, decides how many actually run at once.
+        if not inputs:
+            return []
+        configs = _per_item(config, len(inputs))
+        max_workers = self._batch_size(configs)
+
+        def one(item, item_config):
+            try:
+                return self.invoke(item, item_config, **kwargs)
+            except Exception as exc:
+                if return_exceptions:
+                    return exc
+                raise
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(one, inputs, configs))
+
+    async def abatch(self, inputs: List[Any], config=None, *, return_exceptions: bool = False, **kwargs):
+        if not inputs:
+            return []
+        configs = _per_item(config, len(inputs))
+        semaphore = asyncio.Semaphore(self._batch_size(configs))
+
+        async def one(item, item_config):
+            async with semaphore:
+                return await self.ainvoke(item, item_config, **kwargs)
+
+        return await asyncio.gather(*(one(i, c) for i, c in zip(inputs, configs)),
+                                    return_exceptions=return_exceptions)
+
+
+def _per_item(config, n: int) -> list:
+    return list(config) if isinstance(config, list) else [config] * n
+
+
+# --- Process-wide limiter ---------------------------------------------------
+_default_limiter: Optional[AdaptiveRateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """
+    The shared limiter, configured from CHUNKBUDDY_RPM / _TPM / _MAX_CONCURRENCY.
+    An RPM or TPM of 0 means no limit on that bucket.
+    """
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = AdaptiveRateLimiter(
+                rpm=float(os.environ.get("CHUNKBUDDY_RPM", "500")),
+                tpm=float(os.environ.get("CHUNKBUDDY_TPM", "200000")),
+                max_concurrency=int(os.environ.get("CHUNKBUDDY_MAX_CONCURRENCY", "32")),
+            )
+        return _default_limiter
+
+
+def rate_limited(llm, limiter: Optional[AdaptiveRateLimiter] = None) -> RateLimitedLLM:
+    """Route `llm` through `limiter` (default: the process-wide limiter)."""
+    if isinstance(llm, RateLimitedLLM):
+        return llm
+    return RateLimitedLLM(llm, limiter or get_rate_limiter())
@@ -0,0 +1,327 @@
+# semantic_cache.py
+# ---------------------------------------------------------------------------
+# Near-duplicate result cache for whole ChunkBuddy runs.
+# Learners phrase the same topic many ways ("Kafka partitions",
+# "kafka partitioning", "partitions in Kafka"). Instead of running the full
+# four-call pipeline for each, we embed the topic, look up its nearest
+# neighbours in a FAISS index, and reuse a stored LearningState when the
+# cosine similarity is above a threshold, the learner level matches, and the
+# topics name the same things: the same stemmed content words ("Supervised
+# learning" is not "Unsupervised learning", nor "Binary search" "Binary search
+# trees") and the same versions ("OAuth 2.0" is not "OAuth 1.0", nor "B+ trees"
+# "B-trees"). Character-level embeddings score such pairs as near-identical,
+# above any threshold that still lets real wording variants through.
+#
+# - Embedders are pluggable: anything with `embed(texts) -> np.ndarray`.
+#   HashingEmbedder works fully offline; LangChainEmbedder adapts any
+#   LangChain `Embeddings` (e.g. OpenAIEmbeddings).
+# - The FAISS index and a SQLite side table (id → topic, level, state)
+#   persist to disk; entries are evicted by TTL and least-recent use.
+# ---------------------------------------------------------------------------
+
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional, Protocol, Tuple
+
+import faiss
+import numpy as np
+
+from chunkbuddy_graph import LearningState
+
+DEFAULT_INDEX_DIR = Path(__file__).parent / ".cache" / "semantic"
+
+# Small words that carry no topic meaning ("partitions IN Kafka").
+_STOP_WORDS = {"a", "an", "and", "for", "how", "in", "is", "of", "on", "the", "to", "what", "with"}
+
+
+# Version-like tokens: numbers ("2.0", the 4 in "IPv4") and words ending in
+# + or # ("C++", "C#", "B+").
+_EXACT_TOKEN = re.compile(r"[a-z0-9]*[+#]+|\d+(?:\.\d+)*")
+
+
+def version_tokens(topic: str) -> Tuple[str, ...]:
+    """The tokens two topics must share exactly to be the same lesson."""
+    tokens = set()
+    for token in _EXACT_TOKEN.findall(topic.lower()):
+        if token[0].isdigit():
+            token = re.sub(r"(?:\.0)+$", "", token)  # "2.0" is "2"
+        tokens.add(token)
+    return tuple(sorted(tokens))
+
+
+def _stem(word: str) -> str:
+    # Just enough to fold plurals and verb forms: partitions / partitioning.
+    if word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        word = word[:-1]
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    return word[:-1] if word.endswith("e") and len(word) > 3 else word
+
+
+def content_terms(topic: str) -> frozenset:
+    """Stemmed content words of a topic, ignoring order, stop words and numbers."""
+    words = re.findall(r"[a-z0-9]+", topic.lower())
+    return frozenset(_stem(w) for w in words if w not in _STOP_WORDS and not w.isdigit())
+
+
+def same_topic(a: str, b: str) -> bool:
+    """Lexical guard on top of similarity: same content words, same versions."""
+    return content_terms(a) == content_terms(b) and version_tokens(a) == version_tokens(b)
+
+
+# Pairs that must never be served for one another (see __main__ below).
+DISTINCT_TOPICS = [
+    ("OAuth 2.0", "OAuth 1.0"),
+    ("Python 2", "Python 3"),
+    ("B-trees", "B+ trees"),
+    ("HTTP/2", "HTTP/3"),
+    ("C++ templates", "C# templates"),
+    ("Supervised learning", "Unsupervised learning"),
+    ("Synchronous IO", "Asynchronous IO"),
+    ("Binary search", "Binary search trees"),
+]
+
+# Wording variants that must still be served for one another.
+SAME_TOPICS = [
+    ("Kafka partitions", "kafka partitioning"),
+    ("Kafka partitions", "partitions in Kafka"),
+    ("Bloom filters", "Bloom filter"),
+    ("OAuth 2.0", "oauth 2"),
+]
+
+
+# --- Embedders --------------------------------------------------------------
+class Embedder(Protocol):
+    dim: int
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return an (n, dim) float32 array of L2-normalised vectors."""
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: hashes words and character trigrams into a fixed-size
+    vector. Good enough to rank spelling/word-order variants of a topic;
+    same_topic() rejects the distinct topics it scores as near-identical.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in _STOP_WORDS]
+        features = []
+        for word in words:
+            features.append("w:" + word)
+            padded = f"<{word}>"
+            features.extend("c:" + padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # Signed hashing keeps unrelated collisions from adding up.
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        faiss.normalize_L2(out)
+        return out
+
+
+class LangChainEmbedder:
+    """Adapter for any LangChain Embeddings object (embed_documents)."""
+
+    def __init__(self, embeddings, dim: int):
+        self.embeddings = embeddings
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.asarray(self.embeddings.embed_documents(texts), dtype="float32")
+        faiss.normalize_L2(out)
+        return out
+
+
+# --- Cache ------------------------------------------------------------------
+class SemanticCache:
+    """FAISS nearest-neighbour cache mapping (topic, level) → LearningState."""
+
+    def __init__(
+        self,
+        path: Optional[Path] = DEFAULT_INDEX_DIR,
+        embedder: Optional[Embedder] = None,
+        threshold: float = 0.75,
+        max_entries: int = 5_000,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        # path=None keeps everything in memory (nothing is persisted).
+        self.path = Path(path) if path is not None else None
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            db_path = str(self.path / "entries.sqlite")
+        else:
+            db_path = ":memory:"
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                topic TEXT NOT NULL,
+                level TEXT NOT NULL,
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self._index = self._load_index()
+
+    # --- Persistence --------------------------------------------------------
+    @property
+    def _index_path(self) -> Optional[Path]:
+        return self.path / "topics.faiss" if self.path is not None else None
+
+    def _load_index(self):
+        if self._index_path is not None and self._index_path.exists():
+            index = faiss.read_index(str(self._index_path))
+            if index.d == self.embedder.dim:
+                return index
+            # Embedder changed: the stored vectors are meaningless now.
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedder.dim))
+
+    def save(self) -> None:
+        if self._index_path is not None:
+            with self._lock:
+                faiss.write_index(self._index, str(self._index_path))
+
+    # --- Lookup / store -----------------------------------------------------
+    def lookup(self, topic: str, level: str) -> Optional[Tuple[LearningState, float]]:
+        """Return (stored state, similarity) for the best match, or None."""
+        vector = self.embedder.embed([topic])
+        now = time.time()
+        with self._lock:
+            if self._index.ntotal == 0:
+                self.stats["misses"] += 1
+                return None
+            # Every entry above the threshold, not just the top k: entries at
+            # other levels must not crowd out a same-level match.
+            lims, scores, ids = self._index.range_search(vector, self.threshold)
+            candidates = sorted(zip(scores[lims[0]:lims[1]], ids[lims[0]:lims[1]]), reverse=True)
+            for score, entry_id in candidates:
+                row = self._conn.execute(
+                    "SELECT topic, level, state, created_at FROM entries WHERE id = ?", (int(entry_id),)
+                ).fetchone()
+                if row is None or row[1] != level or not same_topic(row[0], topic):
+                    continue
+                if self.ttl_seconds is not None and now - row[3] > self.ttl_seconds:
+                    continue
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE id = ?", (now, int(entry_id))
+                )
+                self._conn.commit()
+                self.stats["hits"] += 1
+                return json.loads(row[2]), float(score)
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, state: LearningState) -> None:
+        topic, level = state.get("topic", ""), state.get("level", "beginner")
+        if not topic:
+            return
+        vector = self.embedder.embed([topic])
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO entries (topic, level, state, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (topic, level, json.dumps(state, ensure_ascii=False), now, now),
+            )
+            self._index.add_with_ids(vector, np.array([cur.lastrowid], dtype="int64"))
+            self.stats["writes"] += 1
+            self._evict(now)
+            self._conn.commit()
+        self.save()
+
+    def __len__(self) -> int:
+        return self._index.ntotal
+
+    # --- Eviction -----------------------------------------------------------
+    def _evict(self, now: float) -> None:
+        doomed: List[int] = []
+        if self.ttl_seconds is not None:
+            doomed += [r[0] for r in self._conn.execute(
+                "SELECT id FROM entries WHERE created_at < ?", (now - self.ttl_seconds,)
+            )]
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - len(doomed) - self.max_entries
+        if overflow > 0:
+            # Least recently used first, skipping rows already marked expired.
+            expired = set(doomed)
+            for (entry_id,) in self._conn.execute("SELECT id FROM entries ORDER BY accessed_at ASC"):
+                if overflow <= 0:
+                    break
+                if entry_id not in expired:
+                    doomed.append(entry_id)
+                    overflow -= 1
+        if doomed:
+            self._index.remove_ids(np.array(doomed, dtype="int64"))
+            self._conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in doomed])
+            self.stats["evictions"] += len(doomed)
+
+
+# --- Front door -------------------------------------------------------------
+def invoke_with_semantic_cache(app, state: LearningState, cache: SemanticCache) -> LearningState:
+    """Serve a near-duplicate topic from `cache`, otherwise run `app` and store the result."""
+    topic, level = state.get("topic", ""), state.get("level", "beginner")
+    match = cache.lookup(topic, level)
+    if match is not None:
+        cached_state, _similarity = match
+        # Keep the learner's own wording of the topic in the returned state.
+        return {**cached_state, "topic": topic, "level": level}
+    result = app.invoke(state)
+    cache.store(result)
+    return result
+
+
+# --- Regression check -------------------------------------------------------
+# python semantic_cache.py: every DISTINCT_TOPICS pair must miss, and
+# wording variants must still hit, with the default embedder and threshold.
+if __name__ == "__main__":
+    failures = []
+    for stored, asked in DISTINCT_TOPICS + [(b, a) for a, b in DISTINCT_TOPICS]:
+        cache = SemanticCache(path=None)
+        cache.store({"topic": stored, "level": "beginner"})
+        if cache.lookup(asked, "beginner") is not None:
+            failures.append(f"{asked!r} was served {stored!r}")
+
+    for stored, asked in SAME_TOPICS:
+        cache = SemanticCache(path=None)
+        # Same topic at other levels first: they must not hide the match.
+        for level in ("advanced", "intermediate", "advanced", "intermediate", "advanced", "beginner"):
+            cache.store({"topic": stored, "level": level})
+        match = cache.lookup(asked, "beginner")
+        if match is None or match[0]["level"] != "beginner":
+            failures.append(f"{asked!r} missed {stored!r}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    print("✅ Semantic cache checks passed." if not failures else f"{len(failures)} check(s) failed.")
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,379 @@
+# single_flight.py
+# ---------------------------------------------------------------------------
+# Single-flight coalescing for identical concurrent graph runs.
+# When a class of learners types the same topic at the same moment, every
+# request used to start its own four-call pipeline. coalesced(app) wraps a
+# compiled graph so that concurrent runs with the same normalised
+# (topic, level) share one in-flight execution:
+#   - invoke / ainvoke: the first caller (the leader) runs the graph, the
+#     others (followers) wait for it and get the same result.
+#   - stream / astream: the run is pumped by a background thread (a task,
+#     for astream) into an event log; every caller, leader included,
+#     replays that log as it grows, so followers still see node results as
+#     they complete and a caller that stops reading does not stall the others.
+#     An astream run whose last caller closes its stream before the run is
+#     done is cancelled, so nobody pays for a run that no one is reading.
+# Only the in-flight window is shared: once a run finishes, the next request
+# starts a new one (use the response cache / topic library for reuse).
+# Coalesced calls are counted in chunkbuddy_singleflight_total{mode,role}.
+#
+# Usage:
+#   app = coalesced(get_app())
+#   app.invoke({"topic": "Kafka partitions", "level": "beginner"})
+# ---------------------------------------------------------------------------
+
+import asyncio
+import contextvars
+import copy
+import json
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from metrics import REGISTRY
+from topic_library import topic_key
+
+REGISTRY.describe("chunkbuddy_singleflight_total",
+                  "Graph runs by single-flight role (leader ran it, follower was coalesced).")
+REGISTRY.describe("chunkbuddy_singleflight_in_flight", "Distinct graph runs currently in flight.")
+
+
+def count_run(mode: str, shared: bool) -> None:
+    """Record one coalescable run as led (executed) or followed (coalesced)."""
+    REGISTRY.inc("chunkbuddy_singleflight_total", mode=mode, role="follower" if shared else "leader")
+
+
+# --- Calls -----------------------------------------------------------------
+class _Call:
+    """One in-flight execution: its outcome, plus the events streamed so far."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.events: List[Any] = []
+
+    def append(self, event: Any) -> None:
+        with self.cond:
+            self.events.append(event)
+            self.cond.notify_all()
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self.cond:
+            self.result, self.error, self.done = result, error, True
+            self.cond.notify_all()
+
+    def wait(self) -> Any:
+        with self.cond:
+            self.cond.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def replay(self) -> Iterator[Any]:
+        """Yield every event, blocking for new ones until the run is done."""
+        index = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.done or index < len(self.events))
+                pending = self.events[index:]
+                finished = self.done
+            yield from pending
+            index += len(pending)
+            if finished and index == len(self.events):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class _AsyncCall:
+    """Event-loop version of _Call, for shared async streams."""
+
+    def __init__(self):
+        self.cond = asyncio.Condition()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.events: List[Any] = []
+        self.task: Optional["asyncio.Task"] = None  # keeps the pump alive
+        self.subscribers = 0  # open replays; guarded by SingleFlight._lock
+
+    async def append(self, event: Any) -> None:
+        async with self.cond:
+            self.events.append(event)
+            self.cond.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self.cond:
+            self.error, self.done = error, True
+            self.cond.notify_all()
+
+    async def replay(self) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            async with self.cond:
+                await self.cond.wait_for(lambda: self.done or index < len(self.events))
+                pending = self.events[index:]
+                finished = self.done
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index == len(self.events):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class _Subscription:
+    """
+    One caller's replay of an _AsyncCall. Leaving (exhausting, failing or
+    aclose()) is reported exactly once, even if iteration never started.
+    """
+
+    def __init__(self, call: _AsyncCall, leave: Callable[[_AsyncCall], None]):
+        self._call = call
+        self._events = call.replay()
+        self._leave: Optional[Callable[[_AsyncCall], None]] = leave
+
+    def __aiter__(self) -> "_Subscription":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            return await self._events.__anext__()
+        except BaseException:
+            self._left()
+            raise
+
+    async def aclose(self) -> None:
+        self._left()
+        await self._events.aclose()
+
+    def _left(self) -> None:
+        if self._leave is not None:
+            leave, self._leave = self._leave, None
+            leave(self._call)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; concurrent callers with the same
+    key share its outcome (result or exception). Thread-safe; the async
+    methods (ado, astream) share runs within one event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, "asyncio.Task"] = {}
+        self._streams: Dict[Hashable, _AsyncCall] = {}
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks) + len(self._streams)
+
+    def _gauge(self) -> None:
+        REGISTRY.set_gauge("chunkbuddy_singleflight_in_flight", self.in_flight())
+
+    def _forget(self, table: Dict[Hashable, Any], key: Hashable, entry: Any) -> None:
+        with self._lock:
+            if table.get(key) is entry:
+                del table[key]
+        if isinstance(entry, asyncio.Future) and not entry.cancelled():
+            entry.exception()  # retrieved, even if every caller was cancelled
+        self._gauge()
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+        self._gauge()
+        return call, True
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `fn` unless a call for `key` is in flight. Returns (result, shared)."""
+        call, leader = self._join(key)
+        if not leader:
+            return call.wait(), True
+        try:
+            result = fn()
+        except BaseException as exc:
+            call.finish(error=exc)
+            raise
+        finally:
+            self._forget(self._calls, key, call)
+        call.finish(result)
+        return result, False
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Async twin of do(). The shared run is its own task, so cancelling any
+        caller (the leader included) does not cancel it for the others.
+        """
+        with self._lock:
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self._tasks[key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda done: self._forget(self._tasks, key, done))
+        self._gauge()
+        return await asyncio.shield(task), not leader
+
+    def stream(self, key: Hashable, fn: Callable[[], Iterator[Any]]) -> Tuple[Iterator[Any], bool]:
+        """
+        Share one run of the iterator `fn()` between concurrent callers.
+        Returns (events, shared); the run is driven by a daemon thread.
+        """
+        call, leader = self._join(key)
+        if leader:
+            context = contextvars.copy_context()
+
+            def pump() -> None:
+                try:
+                    for event in fn():
+                        call.append(event)
+                except BaseException as exc:
+                    call.finish(error=exc)
+                else:
+                    call.finish()
+                finally:
+                    self._forget(self._calls, key, call)
+
+            threading.Thread(target=context.run, args=(pump,), daemon=True,
+                             name="chunkbuddy-singleflight").start()
+        return call.replay(), not leader
+
+    def astream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """
+        Async twin of stream(); the run is driven by a task on this loop.
+        Callers should aclose() the returned stream if they stop reading
+        early: once every caller has left, an unfinished run is cancelled.
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            leader = call is None
+            if leader:
+                call = self._streams[key] = _AsyncCall()
+            call.subscribers += 1
+        if leader:
+            async def pump() -> None:
+                events = fn()
+                try:
+                    async for event in events:
+                        await call.append(event)
+                except BaseException as exc:
+                    await call.finish(exc)
+                else:
+                    await call.finish()
+                finally:
+                    self._forget(self._streams, key, call)
+                    aclose = getattr(events, "aclose", None)
+                    if aclose is not None:
+                        await aclose()  # run the source's cleanup now, not at GC
+
+            call.task = asyncio.ensure_future(pump())
+            self._gauge()
+        return _Subscription(call, lambda left: self._unsubscribe(key, left)), not leader
+
+    def _unsubscribe(self, key: Hashable, call: _AsyncCall) -> None:
+        with self._lock:
+            call.subscribers -= 1
+            abandoned = call.subscribers == 0 and not call.done
+            if abandoned and self._streams.get(key) is call:
+                del self._streams[key]  # a new caller starts a fresh run
+        if abandoned and call.task is not None:
+            call.task.cancel()
+            self._gauge()
+
+
+# --- Graph wrapper -----------------------------------------------------------
+def run_key(state: dict) -> Optional[Tuple[str, str, str]]:
+    """
+    Coalescing key for an initial state: normalised topic, level and any
+    other input keys. None when the state has no topic.
+    """
+    topic = state.get("topic") if isinstance(state, dict) else None
+    if not isinstance(topic, str):
+        return None
+    rest = {k: v for k, v in state.items() if k not in ("topic", "level")}
+    return topic_key(topic), state.get("level", "beginner"), json.dumps(rest, sort_keys=True, default=str)
+
+
+class CoalescedApp:
+    """
+    Wraps a compiled graph so identical concurrent runs execute once.
+    Everything other than invoke/ainvoke/stream/astream (get_graph,
+    get_state, ...) is forwarded to the wrapped app. Runs with a config
+    that carries `configurable` values (e.g. a checkpointer thread_id) are
+    never coalesced.
+    """
+
+    def __init__(self, app, flight: Optional[SingleFlight] = None):
+        self.app = app
+        self.flight = flight or SingleFlight()
+
+    def __getattr__(self, name: str):
+        if name in ("app", "flight"):  # not set yet (e.g. during copy/unpickle)
+            raise AttributeError(name)
+        return getattr(self.app, name)
+
+    @staticmethod
+    def _key(mode: str, input, config, kwargs) -> Optional[tuple]:
+        if config and config.get("configurable"):
+            return None
+        key = run_key(input)
+        if key is None:
+            return None
+        return (mode, key, json.dumps(kwargs, sort_keys=True, default=str))
+
+    @staticmethod
+    def _own(result, input, shared: bool):
+        # Followers get their own copy, with their own spelling of the topic.
+        if not shared or not isinstance(result, dict):
+            return result
+        return {**copy.deepcopy(result), **input}
+
+    def invoke(self, input, config=None, **kwargs):
+        key = self._key("invoke", input, config, kwargs)
+        if key is None:
+            return self.app.invoke(input, config, **kwargs)
+        result, shared = self.flight.do(key, lambda: self.app.invoke(input, config, **kwargs))
+        count_run("invoke", shared)
+        return self._own(result, input, shared)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        key = self._key("ainvoke", input, config, kwargs)
+        if key is None:
+            return await self.app.ainvoke(input, config, **kwargs)
+        result, shared = await self.flight.ado(key, lambda: self.app.ainvoke(input, config, **kwargs))
+        count_run("ainvoke", shared)
+        return self._own(result, input, shared)
+
+    def stream(self, input, config=None, **kwargs) -> Iterator[Any]:
+        key = self._key("stream", input, config, kwargs)
+        if key is None:
+            yield from self.app.stream(input, config, **kwargs)
+            return
+        events, shared = self.flight.stream(key, lambda: self.app.stream(input, config, **kwargs))
+        count_run("stream", shared)
+        yield from events
+
+    async def astream(self, input, config=None, **kwargs) -> AsyncIterator[Any]:
+        key = self._key("astream", input, config, kwargs)
+        if key is None:
+            async for event in self.app.astream(input, config, **kwargs):
+                yield event
+            return
+        events, shared = self.flight.astream(key, lambda: self.app.astream(input, config, **kwargs))
+        count_run("astream", shared)
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+
+def coalesced(app, flight: Optional[SingleFlight] = None) -> CoalescedApp:
+    """Wrap a compiled graph with single-flight coalescing."""
+    return CoalescedApp(app, flight)
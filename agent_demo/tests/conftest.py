@@ -0,0 +1,24 @@
+# conftest.py
+# ---------------------------------------------------------------------------
+# Offline test suite for ChunkBuddy. Nothing here needs an API key or the
+# network: model calls go to fake_llm.FakeChatModel.
+#
+# Usage (from agent_demo/):
+#   python -m pytest tests
+# ---------------------------------------------------------------------------
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live flat in agent_demo/ and import each other by bare name,
+# exactly as the scripts do.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def fake_llm():
+    """A FakeChatModel with a short, fixed latency."""
+    from fake_llm import FakeChatModel
+    return FakeChatModel(latency_mean=0.01, latency_jitter=0.0, distribution="constant")
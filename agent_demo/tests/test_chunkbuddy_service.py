@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import pytest
+
+from chunkbuddy_service import Admission, ChunkBuddyService, QueueFull, _call, create_service
+
+
+def _body(topic, **extra):
+    return json.dumps({"topic": topic, **extra}).encode()
+
+
+def test_admission_rejects_beyond_workers_plus_queue():
+    admission = Admission(workers=1, queue_size=1)
+
+    async def main():
+        running = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.slot():
+                running.set()
+                await release.wait()
+
+        first = asyncio.ensure_future(hold())
+        await running.wait()
+        second = asyncio.ensure_future(hold())  # waits in the queue
+        await asyncio.sleep(0)
+        assert (admission.running, admission.queued) == (1, 1)
+        with pytest.raises(QueueFull):
+            admission.reserve()
+        release.set()
+        await asyncio.gather(first, second)
+        assert (admission.running, admission.queued) == (0, 0)
+        admission.reserve()  # room again
+        admission.unreserve()
+
+    asyncio.run(main())
+
+
+def test_admission_validates_sizes():
+    with pytest.raises(ValueError):
+        Admission(workers=0, queue_size=1)
+    with pytest.raises(ValueError):
+        Admission(workers=1, queue_size=-1)
+
+
+def test_health_and_bad_requests():
+    service = ChunkBuddyService(workers=2, queue_size=3)
+
+    async def main():
+        return [
+            await _call(service, "GET", "/healthz"),
+            await _call(service, "POST", "/v1/lessons", b"not json"),
+            await _call(service, "POST", "/v1/lessons", _body("Kafka", level="expert")),
+            await _call(service, "POST", "/v1/lessons", _body("   ")),
+            await _call(service, "GET", "/v1/lessons"),
+            await _call(service, "GET", "/nowhere"),
+        ]
+
+    (status, body), *rest = asyncio.run(main())
+    assert status == 200
+    assert json.loads(body) == {"status": "ok", "workers": 2, "queue_size": 3, "running": 0, "queued": 0}
+    assert [status for status, _ in rest] == [400, 400, 400, 405, 404]
+
+
+def _slow_service(workers, queue_size):
+    from fake_llm import FakeChatModel
+    llm = FakeChatModel(latency_mean=0.1, latency_jitter=0.0, distribution="constant")
+    return create_service(llm, workers=workers, queue_size=queue_size), llm
+
+
+@pytest.mark.parametrize("path", ["/v1/lessons", "/v1/lessons/stream"])
+def test_full_queue_answers_429(path):
+    service, _ = _slow_service(workers=1, queue_size=0)
+
+    async def main():
+        return await asyncio.gather(
+            _call(service, "POST", path, _body("Kafka partitions")),
+            _call(service, "POST", path, _body("Raft consensus")),
+        )
+
+    statuses = sorted(status for status, _ in asyncio.run(main()))
+    assert statuses == [200, 429]
+    assert service.admission.health()["running"] == 0
+
+
+def test_identical_requests_share_one_slot():
+    service, llm = _slow_service(workers=1, queue_size=0)
+
+    async def main():
+        return await asyncio.gather(*(
+            _call(service, "POST", "/v1/lessons", _body(topic))
+            for topic in ("Kafka partitions", "kafka partitions", "Kafka  Partitions")
+        ))
+
+    responses = asyncio.run(main())
+    assert [status for status, _ in responses] == [200, 200, 200]
+    assert [json.loads(body)["topic"] for _, body in responses] == [
+        "Kafka partitions", "kafka partitions", "Kafka  Partitions"]
+    calls = llm.calls
+
+    asyncio.run(_call(service, "POST", "/v1/lessons", _body("Kafka partitions")))
+    assert llm.calls == 2 * calls  # the burst cost exactly one run
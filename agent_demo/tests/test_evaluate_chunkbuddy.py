@@ -0,0 +1,45 @@
+import json
+
+from evaluate_chunkbuddy import parse_batch_verdicts
+
+
+def _reply(*verdicts):
+    return json.dumps({"verdicts": list(verdicts)})
+
+
+def test_reads_every_expected_verdict():
+    text = _reply({"id": "a", "score": 4, "reason": "clear"}, {"id": "b", "score": 2.5, "reason": "dense"})
+    assert parse_batch_verdicts(text, ["a", "b"]) == {
+        "a": {"score": 4.0, "reason": "clear", "name": "clarity_for_level"},
+        "b": {"score": 2.5, "reason": "dense", "name": "clarity_for_level"},
+    }
+
+
+def test_numeric_ids_match_string_ids():
+    assert set(parse_batch_verdicts(_reply({"id": 7, "score": 3}), ["7"])) == {"7"}
+
+
+def test_json_fence_is_tolerated():
+    text = "```json\n" + _reply({"id": "a", "score": 5, "reason": "ok"}) + "\n```"
+    assert parse_batch_verdicts(text, ["a"])["a"]["score"] == 5.0
+
+
+def test_bad_entries_are_dropped_for_rescoring():
+    text = _reply(
+        {"id": "a", "score": 4, "reason": "first"},
+        {"id": "a", "score": 1, "reason": "duplicate"},
+        {"id": "b", "score": 0},
+        {"id": "c", "score": 6},
+        {"id": "d", "score": "high"},
+        {"id": "e"},
+        {"id": "unknown", "score": 3},
+        "not an object",
+    )
+    assert parse_batch_verdicts(text, ["a", "b", "c", "d", "e"]) == {
+        "a": {"score": 4.0, "reason": "first", "name": "clarity_for_level"},
+    }
+
+
+def test_unparseable_replies_give_nothing():
+    for text in ("", "Score: 4", "[]", '{"results": []}', '{"verdicts": {"a": 4}}', "{"):
+        assert parse_batch_verdicts(text, ["a"]) == {}
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+from job_queue import JobQueue, work
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(tmp_path / "jobs.sqlite", visibility_timeout=60, max_attempts=2, retry_backoff=0)
+    yield q
+    q.close()
+
+
+def test_claim_leases_each_job_once(queue):
+    ids = queue.enqueue_many([("Kafka", "beginner"), ("Raft", "advanced")], batch="b1")
+    first = queue.claim("w1")
+    second = queue.claim("w2")
+    assert [job.id for job in first + second] == ids
+    assert first[0].attempts == 1
+    assert queue.claim("w3") == []  # both leased
+    assert queue.counts("b1")["running"] == 2
+
+
+def test_complete_stores_result_and_calls_sinks(queue):
+    job_id = queue.enqueue("Kafka")
+    (job,) = queue.claim("w1")
+    seen = []
+    assert queue.complete(job, "w1", {"summary": "ok"}, sinks=[lambda j, s: seen.append((j.id, s))])
+    assert seen == [(job_id, {"summary": "ok"})]
+    assert queue.get(job_id)["status"] == "done"
+    assert queue.result(job_id) == {"summary": "ok"}
+
+
+def test_expired_lease_is_reclaimed_and_stale_worker_loses(queue):
+    queue.visibility_timeout = 0  # every lease is expired as soon as it is taken
+    job_id = queue.enqueue("Kafka")
+    (stale,) = queue.claim("w1")
+    time.sleep(0.01)
+    (job,) = queue.claim("w2")
+    assert job.id == job_id and job.attempts == 2
+
+    seen = []
+    assert not queue.complete(stale, "w1", {"who": "w1"}, sinks=[lambda j, s: seen.append(s)])
+    assert seen == [] and queue.result(job_id) is None
+    assert queue.complete(job, "w2", {"who": "w2"}, sinks=[lambda j, s: seen.append(s)])
+    assert seen == [{"who": "w2"}]
+
+
+def test_expired_lease_on_last_attempt_fails(queue):
+    queue.visibility_timeout = 0
+    job_id = queue.enqueue("Kafka")
+    queue.claim("w1")
+    time.sleep(0.01)
+    queue.claim("w2")
+    time.sleep(0.01)
+    assert queue.claim("w3") == []
+    row = queue.get(job_id)
+    assert row["status"] == "failed"
+    assert row["error"] == "visibility timeout expired"
+
+
+def test_fail_retries_then_fails(queue):
+    job_id = queue.enqueue("Kafka")
+    (job,) = queue.claim("w1")
+    assert queue.fail(job, "w1", "boom 1") == "queued"
+    (job,) = queue.claim("w1")
+    assert job.attempts == 2
+    assert queue.fail(job, "w1", "boom 2") == "failed"
+    assert queue.claim("w1") == []
+    assert queue.failures() == [{"id": job_id, "topic": "Kafka", "level": "beginner",
+                                 "attempts": 2, "error": "boom 2"}]
+
+    assert queue.requeue_failed() == 1
+    (job,) = queue.claim("w1")
+    assert job.attempts == 1
+
+
+def test_fail_after_losing_the_lease_is_ignored(queue):
+    job_id = queue.enqueue("Kafka")
+    (job,) = queue.claim("w1")
+    assert queue.complete(job, "w1", {})
+    assert queue.fail(job, "w1", "late error") == "done"
+    assert queue.get(job_id)["error"] is None
+
+
+def test_raising_sink_rolls_back_and_keeps_the_lease(queue):
+    job_id = queue.enqueue("Kafka")
+    (job,) = queue.claim("w1")
+
+    def broken(job, state):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        queue.complete(job, "w1", {}, sinks=[broken])
+    assert queue.get(job_id)["status"] == "running"
+    assert queue.result(job_id) is None
+    assert queue.complete(job, "w1", {})
+
+
+def test_work_drains_with_retries(queue):
+    queue.enqueue_many([("Kafka", "beginner"), ("flaky", "beginner"), ("broken", "beginner")])
+    attempts = {}
+
+    def run(state):
+        attempts[state["topic"]] = attempts.get(state["topic"], 0) + 1
+        if state["topic"] == "broken" or (state["topic"] == "flaky" and attempts["flaky"] == 1):
+            raise RuntimeError("model error")
+        return {**state, "summary": "ok"}
+
+    assert work(queue, run, worker="w1", drain=True, poll_interval=0.01) == 2
+    assert attempts == {"Kafka": 1, "flaky": 2, "broken": 2}
+    assert queue.counts()["done"] == 2
+    assert [f["topic"] for f in queue.failures()] == ["broken"]
@@ -0,0 +1,93 @@
+import time
+
+from llm_cache import ResponseCache
+
+
+def _clock(monkeypatch, start=1_000_000.0):
+    now = [start]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_hit_after_set():
+    cache = ResponseCache(path=None)
+    key = ResponseCache.make_key("gpt-4o-mini", 0.0, "Explain Kafka")
+    assert cache.get(key) is None
+    cache.set(key, "reply")
+    assert cache.get(key) == "reply"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_depends_on_model_temperature_and_prompt():
+    keys = {
+        ResponseCache.make_key("gpt-4o-mini", 0.0, "p"),
+        ResponseCache.make_key("gpt-4o", 0.0, "p"),
+        ResponseCache.make_key("gpt-4o-mini", 0.7, "p"),
+        ResponseCache.make_key("gpt-4o-mini", 0.0, "q"),
+    }
+    assert len(keys) == 4
+
+
+def test_memory_entry_expires_after_ttl(monkeypatch):
+    now = _clock(monkeypatch)
+    cache = ResponseCache(path=None, ttl_seconds=60)
+    cache.set("k", "v")
+    now[0] += 59
+    assert cache.get("k") == "v"
+    now[0] += 2
+    assert cache.get("k") is None
+
+
+def test_disk_entry_expires_after_ttl(monkeypatch, tmp_path):
+    now = _clock(monkeypatch)
+    path = tmp_path / "responses.sqlite"
+    writer = ResponseCache(path=path, ttl_seconds=60)
+    writer.set("k", "v")
+    writer.close()
+
+    # A fresh process has an empty memory tier, so both lookups go to disk.
+    reader = ResponseCache(path=path, ttl_seconds=60)
+    assert reader.get("k") == "v"
+    assert reader.stats["disk_hits"] == 1
+    reader.close()
+
+    now[0] += 61
+    late = ResponseCache(path=path, ttl_seconds=60)
+    assert late.get("k") is None
+    late.close()
+
+
+def test_no_ttl_never_expires(monkeypatch):
+    now = _clock(monkeypatch)
+    cache = ResponseCache(path=None, ttl_seconds=None)
+    cache.set("k", "v")
+    now[0] += 365 * 24 * 3600
+    assert cache.get("k") == "v"
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = ResponseCache(path=None, max_memory_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "b" is now the least recently used
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_disk_lru_evicts_least_recently_accessed(monkeypatch, tmp_path):
+    now = _clock(monkeypatch)
+    cache = ResponseCache(path=tmp_path / "responses.sqlite", max_memory_entries=1, max_disk_entries=2)
+    cache.set("a", "1")
+    now[0] += 1
+    cache.set("b", "2")
+    now[0] += 1
+    assert cache.get("a") == "1"  # from disk; refreshes its access time
+    now[0] += 1
+    cache.set("c", "3")
+    cache._memory.clear()
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    cache.close()
@@ -0,0 +1,53 @@
+import pytest
+
+from node_output import ChunkSplitter, read_chunks
+
+REPLIES = {
+    "titled": "\n\n".join(
+        f"Chunk {i}: Idea {i}\nThis chunk explains one idea.\nIt gives a short example."
+        for i in range(1, 5)
+    ),
+    "preamble": "Here are your chunks:\n\nChunk 1: Basics\nOne.\n\nChunk 2: Details\nTwo.\n\nChunk 3: Wrap-up\nThree.",
+    "blank lines inside": "Chunk 1: First\nLine one.\n\nLine two.\n\n\nChunk 2: Second\nLine three.",
+    "title on its own line": "Chunk 1:\nA body line.\nChunk 2:\nAnother body line.\n",
+    "crlf": "Chunk 1: A\r\nBody a.\r\n\r\nChunk 2: B\r\nBody b.\r\n",
+}
+
+
+def _split(pieces):
+    splitter = ChunkSplitter()
+    streamed = []
+    for piece in pieces:
+        streamed.extend(splitter.feed(piece))
+    return streamed
+
+
+def _words(text):
+    words, start = [], 0
+    for i, char in enumerate(text):
+        if char in " \n":
+            words.append(text[start:i + 1])
+            start = i + 1
+    return words + [text[start:]]
+
+
+@pytest.mark.parametrize("name", sorted(REPLIES))
+@pytest.mark.parametrize("pieces", [list, _words, lambda text: [text]], ids=["chars", "words", "whole"])
+def test_streamed_chunks_match_read_chunks(name, pieces):
+    text = REPLIES[name]
+    expected = read_chunks(text)
+    assert len(expected) >= 2
+    # Every chunk but the last is released as soon as the next title arrives;
+    # the last one is only known once the stream ends.
+    assert _split(pieces(text)) == expected[:-1]
+
+
+def test_read_chunks_json_reply():
+    assert read_chunks('{"chunks": ["Chunk 1: A\\nBody", "Chunk 2: B\\nBody"]}') == [
+        "Chunk 1: A\nBody",
+        "Chunk 2: B\nBody",
+    ]
+
+
+def test_read_chunks_empty_reply():
+    assert read_chunks("  \n") == []
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from metrics import REGISTRY
+from prompt_budget import count_tokens, render_prompt, truncate_to_tokens
+
+TEMPLATE = "Write check questions for a {level} learner about {topic}.\n\nChunks:\n{chunks}\n\nAnswer:"
+WORDS = "the broker writes each record to one partition and consumers read them in order".split()
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def test_under_budget_is_untouched():
+    prompt = render_prompt("test", TEMPLATE, {"level": "beginner", "topic": "Kafka"},
+                           {"chunks": (["Chunk 1: A", "Chunk 2: B"], "\n\n")}, budget=10_000)
+    assert prompt == TEMPLATE.format(level="beginner", topic="Kafka", chunks="Chunk 1: A\n\nChunk 2: B")
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_over_budget_fits_and_keeps_the_template(seed):
+    rng = random.Random(seed)
+    chunks = [f"Chunk {i}: " + _text(rng, rng.randint(1, 300)) for i in range(rng.randint(1, 8))]
+    budget = rng.randint(60, 400)
+    prompt = render_prompt("test", TEMPLATE, {"level": "beginner", "topic": "Kafka"},
+                           {"chunks": (chunks, "\n\n")}, budget=budget)
+    assert count_tokens(prompt) <= budget
+    assert prompt.startswith("Write check questions for a beginner learner about Kafka.")
+    assert prompt.endswith("\n\nAnswer:")
+
+
+def test_short_items_are_kept_whole():
+    long = "Chunk 2: " + " ".join(WORDS * 40)
+    prompt = render_prompt("test", TEMPLATE, {"level": "beginner", "topic": "Kafka"},
+                           {"chunks": (["Chunk 1: short", long], "\n\n")}, budget=200)
+    assert "Chunk 1: short\n\n" in prompt
+    assert "Chunk 2: the broker" in prompt
+    assert count_tokens(prompt) <= 200
+
+
+def test_fixed_fields_over_budget_are_counted():
+    before = REGISTRY.counter_value("chunkbuddy_prompt_over_budget_total", node="test_fixed")
+    topic = " ".join(WORDS * 20)
+    prompt = render_prompt("test_fixed", TEMPLATE, {"level": "beginner", "topic": topic},
+                           {"chunks": (["Chunk 1: " + " ".join(WORDS * 5)], "\n\n")}, budget=50)
+    assert topic in prompt and "Chunk 1" not in prompt
+    assert REGISTRY.counter_value("chunkbuddy_prompt_over_budget_total", node="test_fixed") == before + 1
+
+
+def test_truncate_to_tokens_marks_the_cut():
+    text = " ".join(WORDS * 10)
+    cut = truncate_to_tokens(text, 20)
+    assert count_tokens(cut) <= 20
+    assert cut.endswith("…")
+    assert truncate_to_tokens("short", 20) == "short"
@@ -0,0 +1,35 @@
+import pytest
+
+from semantic_cache import DISTINCT_TOPICS, SAME_TOPICS, SemanticCache, same_topic
+
+
+@pytest.mark.parametrize("a, b", DISTINCT_TOPICS)
+def test_distinct_topics_are_never_the_same(a, b):
+    assert not same_topic(a, b)
+    assert not same_topic(b, a)
+
+
+@pytest.mark.parametrize("a, b", SAME_TOPICS)
+def test_wording_variants_are_the_same_topic(a, b):
+    assert same_topic(a, b)
+
+
+@pytest.mark.parametrize("stored, asked", DISTINCT_TOPICS + [(b, a) for a, b in DISTINCT_TOPICS])
+def test_distinct_topic_is_not_served(stored, asked):
+    cache = SemanticCache(path=None)
+    cache.store({"topic": stored, "level": "beginner", "summary": stored})
+    assert cache.lookup(asked, "beginner") is None
+
+
+@pytest.mark.parametrize("stored, asked", SAME_TOPICS)
+def test_wording_variant_is_served_at_the_right_level(stored, asked):
+    cache = SemanticCache(path=None)
+    # Same topic at other levels first: they must not hide the match.
+    for level in ("advanced", "intermediate", "advanced", "intermediate", "advanced", "beginner"):
+        cache.store({"topic": stored, "level": level})
+    match = cache.lookup(asked, "beginner")
+    assert match is not None
+    state, similarity = match
+    assert state["level"] == "beginner"
+    assert state["topic"] == stored
+    assert 0.0 < similarity <= 1.0 + 1e-6
@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, coalesced
+
+
+def test_do_shares_one_run_between_threads():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return {"summary": "ok"}
+
+    outcomes = []
+    ready = threading.Barrier(5)
+
+    def caller():
+        ready.wait()
+        outcomes.append(flight.do("k", fn))
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    time.sleep(0.1)  # let every caller join the leader's run
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(runs) == 1
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True]
+    assert all(result == {"summary": "ok"} for result, _ in outcomes)
+    assert flight.in_flight() == 0
+
+
+def test_ado_coalesces_and_shares_errors():
+    flight = SingleFlight()
+    runs = []
+
+    async def fn():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("model down")
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", fn) for _ in range(3)), return_exceptions=True)
+
+    outcomes = asyncio.run(main())
+    assert len(runs) == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert flight.in_flight() == 0
+
+
+def test_finished_runs_are_not_reused():
+    flight = SingleFlight()
+    runs = []
+
+    async def fn():
+        runs.append(1)
+        return len(runs)
+
+    async def main():
+        return [await flight.ado("k", fn), await flight.ado("k", fn)]
+
+    assert asyncio.run(main()) == [(1, False), (2, False)]
+
+
+def test_cancelling_the_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ("done", True)
+
+
+async def _source(events, log):
+    log.append("started")
+    try:
+        for event in events:
+            await asyncio.sleep(0.01)
+            yield event
+    finally:
+        log.append("closed")
+
+
+def test_astream_replays_one_run_to_every_subscriber():
+    flight = SingleFlight()
+    log = []
+
+    async def read(events):
+        return [event async for event in events]
+
+    async def main():
+        first, shared_first = flight.astream("k", lambda: _source([1, 2, 3], log))
+        second, shared_second = flight.astream("k", lambda: _source([1, 2, 3], log))
+        assert (shared_first, shared_second) == (False, True)
+        return await asyncio.gather(read(first), read(second))
+
+    assert asyncio.run(main()) == [[1, 2, 3], [1, 2, 3]]
+    assert log == ["started", "closed"]
+    assert flight.in_flight() == 0
+
+
+def test_astream_is_cancelled_when_the_last_subscriber_leaves():
+    flight = SingleFlight()
+    log = []
+
+    async def main():
+        first, _ = flight.astream("k", lambda: _source(range(100), log))
+        second, _ = flight.astream("k", lambda: _source(range(100), log))
+        assert await first.__anext__() == 0
+        await first.aclose()
+        assert await second.__anext__() == 0  # still running for the other caller
+        assert await second.__anext__() == 1
+        await second.aclose()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert log == ["started", "closed"]
+    assert flight.in_flight() == 0
+
+
+def test_astream_leaving_before_reading_still_counts():
+    flight = SingleFlight()
+    log = []
+
+    async def main():
+        events, _ = flight.astream("k", lambda: _source(range(100), log))
+        await events.aclose()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert flight.in_flight() == 0
+    assert "started" not in log or log[-1] == "closed"
+
+
+@pytest.mark.parametrize("mode", ["ainvoke", "astream"])
+def test_coalesced_graph_calls_the_model_once_per_run(fake_llm, mode):
+    from chunkbuddy_graph import build_async_app
+
+    app = coalesced(build_async_app(llm=fake_llm))
+    state = {"topic": "Kafka partitions", "level": "beginner"}
+
+    async def run(topic):
+        if mode == "ainvoke":
+            return await app.ainvoke({**state, "topic": topic})
+        return [event async for event in app.astream({**state, "topic": topic}, stream_mode="updates")]
+
+    asyncio.run(run(state["topic"]))
+    per_run = fake_llm.calls
+
+    async def burst():
+        # Spelling variants normalise to the same key.
+        return await asyncio.gather(run("Kafka partitions"), run("kafka  partitions"), run("Kafka Partitions"))
+
+    results = asyncio.run(burst())
+    assert fake_llm.calls == 2 * per_run
+    if mode == "ainvoke":
+        assert [result["topic"] for result in results] == ["Kafka partitions", "kafka  partitions", "Kafka Partitions"]
+        assert len({result["summary"] for result in results}) == 1
+    else:
+        assert results[0] == results[1] == results[2]
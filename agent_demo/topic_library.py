@@ -0,0 +1,236 @@
+# topic_library.py
+# ---------------------------------------------------------------------------
+# Precomputed topic library: generate ChunkBuddy output for common topics
+# once, offline, and serve it instantly afterwards.
+#
+# Results live in a small SQLite file with a (topic_key, level) primary key,
+# so a lookup is a single indexed read (well under a millisecond). Entries
+# older than `refresh_after` are still served, and — if a refresher is
+# attached — regenerated in a background thread (stale-while-revalidate).
+#
+# Usage:
+#   python topic_library.py precompute topics.txt --levels beginner,intermediate
+#   python topic_library.py get "Kafka partitions" --level beginner
+#   python topic_library.py list
+# ---------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from chunkbuddy_graph import LearningState, run_many
+from llm_cache import ResponseCache
+
+DEFAULT_LIBRARY_PATH = Path(__file__).parent / ".cache" / "topic_library.sqlite"
+
+
+def topic_key(topic: str) -> str:
+    """Normalise a topic for lookup: case- and whitespace-insensitive."""
+    return re.sub(r"\s+", " ", topic).strip().lower()
+
+
+class TopicLibrary:
+    """Indexed store of precomputed LearningState results."""
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_LIBRARY_PATH,
+        refresh_after: Optional[float] = 30 * 24 * 3600,
+        refresher: Optional[Callable[[LearningState], LearningState]] = None,
+    ):
+        # refresher: called with {"topic", "level"} to regenerate a stale
+        # entry in the background, e.g. build_app().invoke.
+        self.path = Path(path)
+        self.refresh_after = refresh_after
+        self.refresher = refresher
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "refreshes": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS topics (
+                topic_key TEXT NOT NULL,
+                level TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (topic_key, level)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+        self._refreshing: set = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # --- Serving ------------------------------------------------------------
+    def get(self, topic: str, level: str = "beginner") -> Optional[LearningState]:
+        key = (topic_key(topic), level)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, updated_at FROM topics WHERE topic_key = ? AND level = ?", key
+            ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        state, updated_at = row
+        if self.refresh_after is not None and time.time() - updated_at > self.refresh_after:
+            self.stats["stale_hits"] += 1
+            self._schedule_refresh(topic, level)
+        return json.loads(state)
+
+    # --- Writing ------------------------------------------------------------
+    def put(self, state: LearningState) -> None:
+        self.put_many([state])
+
+    def put_many(self, states: List[LearningState]) -> None:
+        now = time.time()
+        rows = [
+            (topic_key(s["topic"]), s.get("level", "beginner"), s["topic"],
+             json.dumps(s, ensure_ascii=False), now)
+            for s in states
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO topics (topic_key, level, topic, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def entries(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT topic, level, updated_at FROM topics ORDER BY topic_key, level"
+            ).fetchall()
+        yield from rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0]
+
+    # --- Background refresh -------------------------------------------------
+    def _schedule_refresh(self, topic: str, level: str) -> None:
+        if self.refresher is None:
+            return
+        key = (topic_key(topic), level)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="topic-refresh")
+        self._executor.submit(self._refresh, key, topic, level)
+
+    def _refresh(self, key, topic: str, level: str) -> None:
+        try:
+            self.put(self.refresher({"topic": topic, "level": level}))
+            self.stats["refreshes"] += 1
+        except Exception as exc:  # keep serving the stale entry
+            print(f"⚠️  Background refresh failed for {topic!r} ({level}): {exc!r}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+# --- Precompute -------------------------------------------------------------
+def precompute(
+    library: TopicLibrary,
+    topics: List[str],
+    levels: List[str],
+    max_concurrency: int = 16,
+    skip_existing: bool = True,
+    llm=None,
+) -> Tuple[int, int]:
+    """Run the graph for every (topic, level) pair and store the results.
+    With skip_existing=False every pair is regenerated, bypassing the
+    response cache.
+
+    Returns (stored, failed).
+    """
+    pairs = [(t, lvl) for lvl in levels for t in topics]
+    if skip_existing:
+        pairs = [(t, lvl) for t, lvl in pairs if library.get(t, lvl) is None]
+    if not pairs:
+        return 0, 0
+
+    results = asyncio.run(
+        run_many(
+            [t for t, _ in pairs],
+            [lvl for _, lvl in pairs],
+            max_concurrency=max_concurrency,
+            # A forced run must regenerate, not replay cached LLM responses.
+            cache=ResponseCache() if skip_existing else None,
+            llm=llm,
+        )
+    )
+    ok = [r for r in results if not isinstance(r, Exception)]
+    for (t, lvl), r in zip(pairs, results):
+        if isinstance(r, Exception):
+            print(f"⚠️  {t!r} ({lvl}) failed: {r!r}")
+    library.put_many(ok)
+    return len(ok), len(results) - len(ok)
+
+
+# --- CLI --------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precomputed ChunkBuddy topic library.")
+    parser.add_argument("--db", default=str(DEFAULT_LIBRARY_PATH), help="Library SQLite file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_pre = sub.add_parser("precompute", help="Generate results for a topic list.")
+    p_pre.add_argument("topics_file", help="Text file with one topic per line.")
+    p_pre.add_argument("--levels", default="beginner", help="Comma-separated levels.")
+    p_pre.add_argument("--max-concurrency", type=int, default=16)
+    p_pre.add_argument("--force", action="store_true", help="Regenerate existing entries.")
+
+    p_get = sub.add_parser("get", help="Print one stored result.")
+    p_get.add_argument("topic")
+    p_get.add_argument("--level", default="beginner")
+
+    sub.add_parser("list", help="List stored topics.")
+    args = parser.parse_args()
+
+    library = TopicLibrary(path=Path(args.db))
+
+    if args.command == "precompute":
+        with open(args.topics_file, encoding="utf-8") as f:
+            topics = [line.strip() for line in f if line.strip()]
+        levels = [lvl.strip() for lvl in args.levels.split(",") if lvl.strip()]
+        stored, failed = precompute(
+            library, topics, levels,
+            max_concurrency=args.max_concurrency,
+            skip_existing=not args.force,
+        )
+        print(f"✅ Stored {stored} results ({failed} failed); library now has {len(library)} entries.")
+
+    elif args.command == "get":
+        start = time.perf_counter()
+        state = library.get(args.topic, args.level)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if state is None:
+            print(f"Not in library: {args.topic!r} ({args.level})")
+        else:
+            print(json.dumps(state, indent=2, ensure_ascii=False))
+            print(f"\n(served in {elapsed_ms:.3f} ms)")
+
+    elif args.command == "list":
+        for topic, level, updated_at in library.entries():
+            age_days = (time.time() - updated_at) / 86400
+            print(f"{topic} [{level}] — {age_days:.1f} days old")